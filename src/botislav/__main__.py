@@ -1,15 +1,48 @@
 import os
 import sys
+import signal
 import logging
 import asyncio
 
-import pickledb
-
 from botislav.dialog import DialogManager
 from botislav.client import BotislavClient
 from botislav.context import ContextManager
 from botislav.intents import get_intent_classifier
-from botislav.handlers import get_handlers
+from botislav.handlers import get_handlers, description_cache, llm
+from botislav.integrations.decode import DECODE_POOL
+from botislav.integrations.opendota import OPENDOTA_RATE_LIMITER, get_match
+from botislav.integrations.shared_cache import SharedCache
+from botislav.integrations.utils import HTTP_CLIENT
+from botislav.metrics import METRICS, serve_metrics
+from botislav.prefetch import MatchPrefetcher
+from botislav.sharding import ShardConfig
+from botislav.storage import SqliteUserStore, migrate_pickledb
+from botislav.watchdog import LoopWatchdog
+
+# fly.io kills the machine kill_timeout (5s) after SIGINT, running dialogs get most of it
+DRAIN_TIMEOUT = 3.0
+
+
+def register_gauges(dialog_manager: DialogManager, watchdog: LoopWatchdog) -> None:
+    scheduler = dialog_manager.scheduler
+    METRICS.gauge("botislav_dialogs_in_flight", "Dialogs running right now", lambda: scheduler.in_flight)
+    METRICS.gauge("botislav_dialogs_queued", "Dialogs waiting for a free slot", lambda: scheduler.queued)
+    METRICS.gauge("botislav_dialogs_dropped", "Dialogs dropped from a full backlog", lambda: scheduler.dropped)
+    METRICS.gauge(
+        "botislav_opendota_queue_depth", "Requests waiting for the OpenDota rate limiter",
+        lambda: OPENDOTA_RATE_LIMITER.queue_depth,
+    )
+    METRICS.gauge(
+        "botislav_opendota_throttled_seconds", "Time requests spent waiting for the OpenDota rate limiter",
+        lambda: OPENDOTA_RATE_LIMITER.throttled_seconds,
+    )
+    METRICS.gauge("botislav_match_cache_hit_rate", "Hit rate of the match cache", lambda: get_match.cache_info().hit_rate)
+    METRICS.gauge("botislav_llm_in_flight", "Descriptions being generated", lambda: llm.in_flight)
+    METRICS.gauge("botislav_llm_timeouts", "Descriptions that timed out", lambda: llm.timeouts)
+    METRICS.gauge(
+        "botislav_loop_lag_seconds", "How late the last event loop heartbeat was, while the watchdog runs",
+        lambda: watchdog.last_lag,
+    )
 
 
 async def main():
@@ -17,19 +50,82 @@ async def main():
         stream=sys.stdout, format="%(name)s: %(message)s", level=logging.INFO
     )
 
-    context_manager = ContextManager(
-        cache=pickledb.load(location="./cache/cache.db", auto_dump=True)
-    )
+    # processes running a share of the shards split the OpenDota quota and share fetched responses,
+    # chores that only need doing once are left to the process with shard 0
+    shards = ShardConfig.from_env()
+    leader = shards.owns(None)
+    if shards.sharded:
+        OPENDOTA_RATE_LIMITER.split(shards.processes)
+        HTTP_CLIENT.shared_cache = SharedCache(path="./cache/upstream.sqlite3")
+
+    user_store = SqliteUserStore(path="./cache/users.sqlite3")
+    if leader:
+        migrate_pickledb(location="./cache/cache.db", store=user_store)
+    await user_store.start()
+
+    context_manager = ContextManager(cache=user_store, keep_loaded=not shards.sharded)
     dialog_manager = DialogManager(
-        intent_classifier=get_intent_classifier(),
+        intent_classifier=get_intent_classifier(mode="lalr", cache="./cache/intents.lark"),
         handlers=get_handlers(),
         context_manager=context_manager,
     )
 
-    client = BotislavClient(dialog_manager=dialog_manager)
+    client = BotislavClient(
+        dialog_manager=dialog_manager,
+        shard_count=shards.count if shards.count > 1 else None,
+        shard_ids=list(shards.ids) if shards.sharded else None,
+    )
     context_manager.set_client(client)
 
-    await client.start(token=os.getenv("DISCORD_TOKEN"))
+    # off by default, SIGUSR1 turns it on and off while the bot runs
+    watchdog = LoopWatchdog(threshold=float(os.getenv("LOOP_WATCHDOG_THRESHOLD", "0.1")))
+    if os.getenv("LOOP_WATCHDOG"):
+        watchdog.start()
+
+    # both are off unless asked for, the instrumented code then skips all bookkeeping
+    metrics_runner = None
+    if metrics_port := os.getenv("METRICS_PORT"):
+        METRICS.enabled = True
+        METRICS.trace_dialogs = bool(os.getenv("TRACE_DIALOGS"))
+        register_gauges(dialog_manager, watchdog)
+        metrics_runner = await serve_metrics(host="127.0.0.1", port=int(metrics_port))
+
+    # opt-in, it spends part of the OpenDota quota and LLM calls on matches nobody may ask about
+    prefetcher = None
+    if os.getenv("PREFETCH_MATCHES") and leader:
+        prefetcher = MatchPrefetcher(
+            accounts=user_store.opendota_ids,
+            requests_per_hour=float(os.getenv("PREFETCH_REQUESTS_PER_HOUR", "600")),
+        )
+        prefetcher.start()
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+    loop.add_signal_handler(signal.SIGUSR1, watchdog.toggle)
+
+    running = asyncio.create_task(client.start(token=os.getenv("DISCORD_TOKEN")))
+    stopped = asyncio.create_task(stopping.wait())
+    try:
+        await asyncio.wait({running, stopped}, return_when=asyncio.FIRST_COMPLETED)
+        if running.done():
+            running.result()
+    finally:
+        stopped.cancel()
+        watchdog.stop()
+        await dialog_manager.scheduler.drain(timeout=DRAIN_TIMEOUT)
+        await client.close()
+        await asyncio.gather(running, return_exceptions=True)
+        if prefetcher is not None:
+            await prefetcher.stop()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await user_store.close()
+        await description_cache.close()
+        if HTTP_CLIENT.shared_cache is not None:
+            await HTTP_CLIENT.shared_cache.close()
+        DECODE_POOL.close()
 
 
 if __name__ == "__main__":
@@ -1,21 +1,55 @@
+import asyncio
 from logging import getLogger
+from typing import List, Optional
 
-from discord import Client, Message, Intents
+from discord import AutoShardedClient, Message, Intents
 
 from botislav.dialog import DialogManager
+from botislav.handlers import warm_up_generation
+from botislav.integrations.constants import warm_up_constants
+from botislav.integrations.opendota import CONSTANTS
+from botislav.integrations.utils import HTTP_CLIENT
 
 _logger = getLogger(__name__)
 
 
-class BotislavClient(Client):
+class BotislavClient(AutoShardedClient):
     def __init__(
         self,
         dialog_manager: DialogManager,
+        shard_count: Optional[int] = None,
+        shard_ids: Optional[List[int]] = None,
     ):
         intents = Intents.default()
         intents.message_content = True
-        super(BotislavClient, self).__init__(intents=intents)
+        # without a shard count discord recommends one, a single shard until the bot grows
+        super(BotislavClient, self).__init__(intents=intents, shard_count=shard_count, shard_ids=shard_ids)
         self.dialog_manager: DialogManager = dialog_manager
+        self._warm_up: Optional[asyncio.Task] = None
+
+    async def setup_hook(self) -> None:
+        await HTTP_CLIENT.start()
+        await warm_up_constants(CONSTANTS)
+
+    async def on_ready(self) -> None:
+        # cheap intents are answered right away, the llm stack is loaded once the gateway is up
+        if self._warm_up is None:
+            self._warm_up = asyncio.create_task(warm_up_generation())
+            self._warm_up.add_done_callback(self._on_warmed_up)
+
+    @staticmethod
+    def _on_warmed_up(task: "asyncio.Task[None]") -> None:
+        # descriptions still load on first use, but a broken llm stack should show up in the logs now
+        if not task.cancelled() and (error := task.exception()) is not None:
+            _logger.error(f"Warming up description generators failed with {error}", exc_info=error)
+
+    async def close(self) -> None:
+        if self._warm_up is not None:
+            self._warm_up.cancel()
+            await asyncio.gather(self._warm_up, return_exceptions=True)
+            self._warm_up = None
+        await super(BotislavClient, self).close()
+        await HTTP_CLIENT.close()
 
     async def on_message(self, message: Message):
 
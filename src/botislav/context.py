@@ -1,20 +1,41 @@
 import asyncio
-from typing import Optional, Dict
+from typing import Any, Callable, Optional, Dict, List
 from contextlib import contextmanager
 
 import ctor
 import discord
-import pickledb
-from attr import dataclass, attrib
+from attr import dataclass, attrib, setters
+
+from botislav.lru import LruCache
+from botislav.metrics import span
+from botislav.storage import UserStore
 
 __all__ = ["Cache", "Context", "ContextManager"]
 
 
-@dataclass(slots=True)
+def _mark_dirty(cache: "Cache", _attribute, value):
+    object.__setattr__(cache, "_dirty", True)
+    return value
+
+
+@dataclass(slots=True, on_setattr=_mark_dirty)
 class Cache:
     steam_id: Optional[str] = None
     opendota_id: Optional[int] = None
 
+    # init=False keeps it out of ctor.dump, so it is never persisted
+    _dirty: bool = attrib(default=False, init=False, eq=False, repr=False, on_setattr=setters.NO_OP)
+
+    @property
+    def is_dirty(self) -> bool:
+        return self._dirty
+
+    def mark_clean(self) -> None:
+        self._dirty = False
+
+
+USER_CACHE_SIZE = 4096
+
 
 @dataclass(slots=True)
 class Context:
@@ -23,6 +44,7 @@ class Context:
     _client: discord.Client
     _message: discord.Message
     _reply_queue: asyncio.Queue
+    _load_user_cache: Optional[Callable[[str], Cache]] = None
 
     def normalize_emoji(self, emoji: str) -> str:
         if emoji.startswith("<") and emoji.endswith(">"):
@@ -36,16 +58,29 @@ class Context:
     def user_text(self) -> str:
         return self._message.content
 
+    @property
+    def mentioned_user_keys(self) -> List[str]:
+        return [str(user.id) for user in self._message.mentions]
+
+    def get_user_cache(self, key: str) -> Cache:
+        # caches of other users are for reading only, changes to them are not saved
+        if key == self.key:
+            return self.cache
+        if self._load_user_cache is None:
+            return Cache()
+        return self._load_user_cache(key)
+
     async def reply_to_user(self, text: str) -> None:
         await self._message.reply(text)
 
-    async def reply_to_user_with_embed(self, title: str, description: str, color: int, thumbnail: str) -> None:
+    async def reply_to_user_with_embed(self, title: str, description: str, color: int, thumbnail: Optional[str]) -> None:
         embed = discord.Embed(
             title=title,
             description=description,
             color=color
         )
-        embed.set_thumbnail(url=thumbnail)
+        if thumbnail:
+            embed.set_thumbnail(url=thumbnail)
         await self._message.channel.send(embed=embed, reference=self._message)
 
     async def send_text(self, text: str) -> None:
@@ -68,8 +103,11 @@ class Context:
 
 @dataclass(slots=True)
 class ContextManager:
-    _cache: pickledb.PickleDB
+    _cache: UserStore
     _active_reply_queues: Dict[str, "asyncio.Queue[discord.Message]"] = attrib(factory=dict)
+    # off when other processes write to the same store, every dialog then reads the user afresh
+    keep_loaded: bool = True
+    _loaded_caches: "LruCache[str, Cache]" = attrib(factory=lambda: LruCache(max_entries=USER_CACHE_SIZE), init=False)
 
     _client: discord.Client = attrib(init=False)
 
@@ -81,18 +119,44 @@ class ContextManager:
         reply_queue: "asyncio.Queue[discord.Message]" = asyncio.Queue()
         self._active_reply_queues[key] = reply_queue
 
-        if raw_cache := self._cache.get(key):
-            cache = ctor.load(Cache, raw_cache)
-        else:
-            cache = Cache()
+        with span("context_load"):
+            cache = self._load_cache(key)
+            loaded = ctor.dump(cache)
 
         try:
 
-            yield Context(key=key, message=message, cache=cache, reply_queue=reply_queue, client=self._client)
+            yield Context(
+                key=key,
+                message=message,
+                cache=cache,
+                reply_queue=reply_queue,
+                client=self._client,
+                load_user_cache=self._load_cache,
+            )
 
         finally:
             self._active_reply_queues.pop(key)
-            self._cache.set(key, ctor.dump(cache))
+            if cache.is_dirty:
+                with span("context_save"):
+                    self._save_cache(key, cache, loaded)
+                cache.mark_clean()
+
+    def _load_cache(self, key: str) -> Cache:
+        if (cache := self._loaded_caches.get(key)) is None:
+            if raw_cache := self._cache.get(key):
+                cache = ctor.load(Cache, raw_cache)
+            else:
+                cache = Cache()
+            if self.keep_loaded:
+                self._loaded_caches.put(key, cache)
+        return cache
+
+    def _save_cache(self, key: str, cache: Cache, loaded: Dict[str, Any]) -> None:
+        # only the fields this dialog changed go over what the store holds now,
+        # so a change another process made to the same user meanwhile is kept
+        record = ctor.dump(cache)
+        changed = {name: value for name, value in record.items() if loaded.get(name) != value}
+        self._cache.set(key, {**record, **(self._cache.get(key) or {}), **changed})
 
     def has_active_context(self, key: str) -> bool:
         return key in self._active_reply_queues
@@ -1,33 +1,157 @@
 import asyncio
 import logging
-from typing import Dict
+from collections import Counter, OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Set
 
 import discord
 from attr import dataclass, attrib
 
 from botislav.context import ContextManager
 from botislav.handlers import Handler
-from botislav.intents import IntentClassifier
+from botislav.intents import IntentClassifier, normalize_phrase
+from botislav.metrics import count, span, trace_dialog
+
+__all__ = [
+    "DialogScheduler",
+    "DialogManager",
+]
 
 _logger = logging.getLogger(__name__)
 
 
+@dataclass(slots=True)
+class _Dialog:
+    key: str
+    guild_id: Optional[int]
+    run: Callable[[], Awaitable[None]]
+
+
+@dataclass(slots=True)
+class DialogScheduler:
+    # runs dialogs as supervised tasks under a global and a per guild limit; the rest waits in
+    # a bounded backlog where a newer message of the same user replaces the queued one and
+    # the oldest dialog is dropped when it is full; one user never has two dialogs running
+    max_concurrency: int = 16
+    max_per_guild: int = 4
+    max_backlog: int = 64
+
+    completed: int = attrib(default=0, init=False)
+    failed: int = attrib(default=0, init=False)
+    merged: int = attrib(default=0, init=False)
+    dropped: int = attrib(default=0, init=False)
+    _running: Dict["asyncio.Task[None]", _Dialog] = attrib(factory=dict, init=False)
+    _running_keys: Set[str] = attrib(factory=set, init=False)
+    _running_per_guild: Counter = attrib(factory=Counter, init=False)
+    _backlog: "OrderedDict[str, _Dialog]" = attrib(factory=OrderedDict, init=False)
+    _closed: bool = attrib(default=False, init=False)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._running)
+
+    @property
+    def queued(self) -> int:
+        return len(self._backlog)
+
+    def submit(self, key: str, guild_id: Optional[int], run: Callable[[], Awaitable[None]]) -> bool:
+        if self._closed:
+            self.dropped += 1
+            return False
+
+        dialog = _Dialog(key=key, guild_id=guild_id, run=run)
+        if key in self._backlog:
+            self._backlog[key] = dialog
+            self.merged += 1
+            return True
+        if self._can_start(dialog):
+            self._start(dialog)
+            return True
+
+        if len(self._backlog) >= self.max_backlog:
+            stale_key, _ = self._backlog.popitem(last=False)
+            self.dropped += 1
+            _logger.warning(f"Dialog backlog is full, dropped the dialog of {stale_key}")
+        self._backlog[key] = dialog
+        return True
+
+    def _can_start(self, dialog: _Dialog) -> bool:
+        return (
+            len(self._running) < self.max_concurrency
+            and self._running_per_guild[dialog.guild_id] < self.max_per_guild
+            and dialog.key not in self._running_keys
+        )
+
+    def _start(self, dialog: _Dialog) -> None:
+        # the scheduler holds the only strong reference the event loop does not keep
+        task = asyncio.create_task(self._supervise(dialog), name=f"dialog-{dialog.key}")
+        self._running[task] = dialog
+        self._running_keys.add(dialog.key)
+        self._running_per_guild[dialog.guild_id] += 1
+
+    def _start_from_backlog(self) -> None:
+        for key, dialog in list(self._backlog.items()):
+            if self._can_start(dialog):
+                del self._backlog[key]
+                self._start(dialog)
+
+    async def _supervise(self, dialog: _Dialog) -> None:
+        try:
+            await dialog.run()
+            self.completed += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            self.failed += 1
+            _logger.error(f"Dialog {dialog.key} failed with {error}", exc_info=True)
+        finally:
+            del self._running[asyncio.current_task()]
+            self._running_keys.discard(dialog.key)
+            self._running_per_guild[dialog.guild_id] -= 1
+            if not self._running_per_guild[dialog.guild_id]:
+                del self._running_per_guild[dialog.guild_id]
+            if not self._closed:
+                self._start_from_backlog()
+
+    async def drain(self, timeout: float) -> None:
+        # stops accepting dialogs, drops the backlog and gives running dialogs up to timeout to finish
+        self._closed = True
+        self.dropped += len(self._backlog)
+        self._backlog.clear()
+        if not self._running:
+            return
+        _logger.info(f"Draining {len(self._running)} dialogs")
+        tasks = list(self._running)
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if pending:
+            _logger.warning(f"Cancelled {len(pending)} dialogs that did not finish in {timeout}s")
+
+
 @dataclass(slots=True)
 class DialogManager:
     context_manager: ContextManager
     intent_classifier: IntentClassifier
     handlers: Dict[str, Handler] = attrib(factory=dict)
+    scheduler: DialogScheduler = attrib(factory=DialogScheduler)
     client: discord.Client = attrib(init=False)
 
     def set_client(self, client: discord.Client):
         self.client = client
 
-    async def _start_dialog(self, key: str, message: discord.Message):
-        phrase = message.content.lower()
-        intent = self.intent_classifier.get_intent(phrase)
-        handler = self.handlers[intent.handler_id]
-        with self.context_manager.get_context(key, message) as context:
-            await handler(context)
+    async def _start_dialog(self, key: str, phrase: str, message: discord.Message):
+        with trace_dialog(key), span("dialog"):
+            intent = self.intent_classifier.get_intent(phrase)
+            # lets the loop watchdog tell which dialog blocked the loop
+            asyncio.current_task().set_name(f"dialog-{key}:{intent.handler_id}")
+            count("botislav_dialogs_total", intent=intent.handler_id)
+            if (handler := self.handlers.get(intent.handler_id)) is None:
+                _logger.warning(f"No handler for intent {intent.handler_id}")
+                return
+            with self.context_manager.get_context(key, message) as context:
+                with span(f"handler:{intent.handler_id}"):
+                    await handler(context)
         _logger.info(f"Dialog {key} ended")
 
     async def handle(self, message: discord.Message) -> None:
@@ -36,6 +160,12 @@ class DialogManager:
         if self.context_manager.has_active_context(key):
             _logger.info(f"Resuming dialog for {key}")
             self.context_manager.pass_reply_to_active_context(key, message)
-        else:
-            _logger.info(f"Starting new dialog for {key}")
-            asyncio.create_task(self._start_dialog(key, message))
+            return
+
+        phrase = normalize_phrase(message.content)
+        if not self.intent_classifier.may_match(phrase):
+            return
+
+        _logger.info(f"Starting new dialog for {key}")
+        guild_id = message.guild.id if message.guild is not None else None
+        self.scheduler.submit(key, guild_id, lambda: self._start_dialog(key, phrase, message))
@@ -1,17 +1,24 @@
 import os
 import re
+import asyncio
+import hashlib
+import functools
 import logging
-from typing import Dict, Callable, Awaitable, TypedDict, Optional
+from urllib.parse import urlsplit
+from typing import Dict, Callable, Awaitable, TypedDict, Optional, List, Set, Tuple
 
 from attr import dataclass
-from gigachat import context
-from langchain_core.prompts import PromptTemplate
-from langchain_deepseek import ChatDeepSeek
-from langchain_gigachat import GigaChat
 
 from botislav.context import Context
-from botislav.integrations.dota2 import get_hero_info_from_dota2_com
-from botislav.integrations.opendota import get_player_recent_matches, get_match, get_heroes
+from botislav.integrations.budget import LatencyBudget
+from botislav.integrations.dota2 import Dota2Hero, get_hero_info_from_dota2_com
+from botislav.integrations.opendota import (
+    CompactMatch, CompactPlayer, Hero, get_player_recent_matches, get_match, get_heroes
+)
+from botislav.integrations.utils import HTTP_CLIENT, UpstreamError
+from botislav import phrases
+from botislav.llm import LazyChain, LlmExecutor
+from botislav.storage import DescriptionCache
 
 _logger = logging.getLogger(__name__)
 
@@ -24,15 +31,35 @@ __all__ = [
 Handler = Callable[[Context], Awaitable[None]]
 
 
+RECENT_MATCH_BUDGET = 8.0  # seconds for the whole upstream lookup
+PARTY_MATCH_BUDGET = 10.0
+
 OPENDOTA_ID_PATTERN = re.compile(
     r"(https?://)?(www\.)?opendota\.com/players/(?P<opendota_id>\d+)"
 )
 
 
+# how the user knows the hosts behind an UpstreamError
+UPSTREAM_NAMES = {
+    "api.opendota.com": "OpenDota",
+    "www.dota2.com": "dota2.com",
+    "raw.githubusercontent.com": "GitHub",
+}
+
+
+def _upstream_reply(error: UpstreamError) -> str:
+    if name := UPSTREAM_NAMES.get(urlsplit(error.url).hostname or ""):
+        return f"{name} сейчас не отвечает, попробуй попозже"
+    return "Сервис с данными матчей сейчас не отвечает, попробуй попозже"
+
+
 def handles_exceptions(func):
     async def wrapped(context: Context):
         try:
             return await func(context)
+        except UpstreamError as error:
+            _logger.warning(f"Handler {func.__qualname__} gave up on {error}")
+            await context.reply_to_user(_upstream_reply(error))
         except Exception as error:
             _logger.error(f"Handler {func.__qualname__} failed with {error}", exc_info=True)
             await context.reply_to_user("Упсс... кажется я сломался ...")
@@ -48,28 +75,57 @@ async def link_account(context: Context) -> None:
         await context.add_reaction(context.normalize_emoji("FeelsGood"))
 
 
-giga = GigaChat(
-    credentials=os.getenv("GIGACHAT_TOKEN"),
-    model="GigaChat-2-Pro",
-    scope="GIGACHAT_API_PERS",
-    verify_ssl_certs=False,
-    max_tokens=100,
-    top_p=0.9
-)
+GIGACHAT_MODEL = "GigaChat-2-Pro"
+GIGACHAT_SESSION_ID = "f29d33fa-27cc-4132-9a8e-049860952ec0"
+
+
+# the llm stack takes longer to import than everything else together, so it is only
+# imported when the first description is generated or warm_up_generation() runs
+
+@functools.lru_cache(maxsize=None)
+def get_giga():
+    from langchain_gigachat import GigaChat
+
+    return GigaChat(
+        credentials=os.getenv("GIGACHAT_TOKEN"),
+        model=GIGACHAT_MODEL,
+        scope="GIGACHAT_API_PERS",
+        verify_ssl_certs=False,
+        max_tokens=100,
+        top_p=0.9
+    )
+
+
+# @functools.lru_cache(maxsize=None)
+# def get_deepseek():
+#     from langchain_deepseek import ChatDeepSeek
+#
+#     return ChatDeepSeek(
+#         model="deepseek-chat",
+#         temperature=0.5,
+#         max_tokens=None,
+#         timeout=None,
+#         max_retries=2,
+#     )
+
 
-# for gigachat token caching
-context.session_id_cvar.set("f29d33fa-27cc-4132-9a8e-049860952ec0")
+def _use_gigachat_session() -> None:
+    # for gigachat token caching, the context var is per task so it is set for every generation
+    from gigachat import context
 
-# deepseek = ChatDeepSeek(
-#     model="deepseek-chat",
-#     temperature=0.5,
-#     max_tokens=None,
-#     timeout=None,
-#     max_retries=2,
-# )
+    context.session_id_cvar.set(GIGACHAT_SESSION_ID)
 
 
-DESCRIBE_MATCH_PROMPT = PromptTemplate.from_template("""
+def _chain(template: str) -> LazyChain:
+    def build():
+        from langchain_core.prompts import PromptTemplate
+
+        return PromptTemplate.from_template(template) | get_giga()
+
+    return LazyChain(factory=build, setup=_use_gigachat_session)
+
+
+DESCRIBE_MATCH_PROMPT = """
 --- Задача ---
 Опиши последний матч в Dota 2 игрока! Обязятельно делай отсылки на способности HERO_NAME и добавляй похожие на них эмодзи!
 
@@ -118,21 +174,71 @@ KDA и HERO_DESCRIPTION в итоговом тексте быть не долж
   **JunkTapes** собрался на **Lion** и одержал победу со счетом **1/10/15**, заставив противников содрогнуться от страха
   **Kēksiņš** украл у противника все тайны, в том числе и победу на **Rubick**, счет **3/7/20**
   **Infighter** вызвал помощь из параллельных миров на **Enigma** со счетом **5/14/27**
-""")
+"""
+
+phrase_generator = _chain(DESCRIBE_MATCH_PROMPT)
+
+llm = LlmExecutor(chain=phrase_generator, max_concurrency=2, timeout=15.0)
+# speculative descriptions from the prefetcher never take the slots of people waiting for a reply
+background_llm = LlmExecutor(chain=phrase_generator, max_concurrency=1, timeout=60.0)
+
+# changing the prompt or the model invalidates previously generated descriptions
+DESCRIBE_MATCH_PROMPT_VERSION = hashlib.sha1(
+    f"{GIGACHAT_MODEL}:{DESCRIBE_MATCH_PROMPT}".encode("utf-8")
+).hexdigest()[:12]
+
+DESCRIBE_PARTY_PROMPT = """
+--- Задача ---
+Опиши последний совместный матч в Dota 2 компании игроков! Делай отсылки на способности их героев и добавляй похожие эмодзи!
+
+--- Вывод ---
+Будь ироничен и подшучивай над игроками! Обязательно шути! Про каждого игрока не больше одного предложения!
+Хвали тех, у кого хороший счет, и смейся над теми, кто был якорем.
+Твой текст должен быть от мужского рода.
+
+--- Требования ---
+HERO_NAME, NICKNAME и SCORE каждого игрока обязательно должны быть в твоем ответе! Выделяй их **!
+KDA в итоговом тексте быть не должно!
 
-phrase_generator = DESCRIBE_MATCH_PROMPT | giga
-# phrase_generator = DESCRIBE_MATCH_PROMPT | deepseek
+--- Контекст ---
+Описание параметров: HERO_NAME - имя героя, WIN - победил ли игрок, NICKNAME - псевдоним игрока,
+KDA - соотношение убийств и помощи к смертям, SCORE - счет игрока (убийства/смерти/помощь)
+
+Игроки:
+{players}
+"""
+
+party_generator = _chain(DESCRIBE_PARTY_PROMPT)
+
+PARTY_PROMPT_VERSION = hashlib.sha1(
+    f"{GIGACHAT_MODEL}:{DESCRIBE_PARTY_PROMPT}".encode("utf-8")
+).hexdigest()[:12]
+
+description_cache = DescriptionCache(path="./cache/descriptions.sqlite3")
+
+
+async def warm_up_generation() -> None:
+    # meant to run in the background once the bot is connected, so the first description
+    # does not pay for the imports
+    await asyncio.gather(
+        phrase_generator.load(),
+        party_generator.load(),
+        asyncio.to_thread(lambda: phrases.PHRASE_GENERATOR),
+    )
+    _logger.info("Description generators are loaded")
 
 
 @dataclass
 class DotaRecentMatch:
+    match_id: int
+    account_id: Optional[int]
     win: bool
     kda: float
     score: str
     nickname: str
     hero_name: str
     hero_description: str
-    hero_image_url: str
+    hero_image_url: Optional[str]
     date: str
     game_mode: str
     url: str
@@ -148,26 +254,174 @@ class DotaRecentMatch:
         }
 
 
+def _to_recent_match(
+    full_match: CompactMatch,
+    player: CompactPlayer,
+    hero_from_dota2_com: Optional[Dota2Hero],
+    heroes: Optional[Dict[int, Hero]],
+) -> DotaRecentMatch:
+    hero_from_opendota = (heroes or {}).get(player.hero_id)
+    if hero_from_dota2_com is not None:
+        hero_name = hero_from_dota2_com.name_loc
+    elif hero_from_opendota is not None:
+        hero_name = hero_from_opendota.localized_name
+    else:
+        hero_name = "Неизвестный герой"
+
+    return DotaRecentMatch(
+        match_id=full_match.match_id,
+        account_id=player.account_id,
+        win=bool(player.win),
+        hero_name=hero_name,
+        hero_description=hero_from_dota2_com.hype_loc if hero_from_dota2_com else "",
+        kda=(player.kills + player.assists) / (player.deaths or 1),
+        date=full_match.start_date,
+        nickname=player.personaname or "Аноним",
+        hero_image_url=hero_from_opendota.image_vert_url if hero_from_opendota else None,
+        url=full_match.url,
+        game_mode=full_match.game_mode_localized,
+        score="{}/{}/{}".format(player.kills, player.deaths, player.assists),
+    )
+
+
 async def get_recent_match_info(opendota_account_id: int) -> Optional[DotaRecentMatch]:
-    recent_matches = await get_player_recent_matches(account_id=opendota_account_id, limit=1)
-    if recent_match := next(iter(recent_matches), None):
-        full_match = await get_match(recent_match.match_id)
-        if player := full_match.find_player(opendota_account_id):
-            hero_from_dota2_com = await get_hero_info_from_dota2_com(hero_id=player.hero_id)
-            hero_from_opendota = (await get_heroes())[player.hero_id]
-            return DotaRecentMatch(
-                win=bool(player.win),
-                hero_name=hero_from_dota2_com.name_loc,
-                hero_description=hero_from_dota2_com.hype_loc,
-                kda=(player.kills + player.assists) / (player.deaths or 1),
-                date=full_match.start_date,
-                nickname=player.personaname,
-                hero_image_url=hero_from_opendota.image_vert_url,
-                url=full_match.url,
-                game_mode=full_match.game_mode_localized,
-                score="{}/{}/{}".format(player.kills, player.deaths, player.assists),
-            )
-    return None
+    budget = LatencyBudget(name=f"recent match of {opendota_account_id}", total=RECENT_MATCH_BUDGET)
+    # hero constants do not depend on anything, so they are fetched alongside the whole lookup
+    heroes = asyncio.ensure_future(budget.stage("opendota_heroes", get_heroes(), default=None))
+    try:
+        recent_matches = await budget.stage(
+            "recent_matches", get_player_recent_matches(account_id=opendota_account_id, limit=1)
+        )
+        if not (recent_match := next(iter(recent_matches), None)):
+            return None
+
+        full_match, hero_from_dota2_com, hero_from_opendota = await asyncio.gather(
+            budget.stage("match", get_match(recent_match.match_id)),
+            budget.stage("dota2_hero", get_hero_info_from_dota2_com(hero_id=recent_match.hero_id), default=None),
+            heroes,
+        )
+        if not (player := full_match.find_player(opendota_account_id)):
+            return None
+        return _to_recent_match(full_match, player, hero_from_dota2_com, hero_from_opendota)
+    finally:
+        heroes.cancel()
+        budget.log_timings()
+
+
+async def get_party_match_info(account_ids: List[int], include_party: bool) -> List[DotaRecentMatch]:
+    # the first account leads: its last match is fetched first and the rest are looked up in it,
+    # only accounts that were not in that match cost extra requests, and every match is fetched once
+    leader_id, *other_ids = account_ids
+    budget = LatencyBudget(name=f"party match of {leader_id}", total=PARTY_MATCH_BUDGET)
+    heroes = asyncio.ensure_future(budget.stage("opendota_heroes", get_heroes(), default=None))
+    try:
+        recent_matches = await budget.stage(
+            "recent_matches", get_player_recent_matches(account_id=leader_id, limit=1)
+        )
+        if not (recent_match := next(iter(recent_matches), None)):
+            return []
+        leader_match = await budget.stage("match", get_match(recent_match.match_id))
+        if not (leader := leader_match.find_player(leader_id)):
+            return []
+
+        members = [(leader_match, leader)]
+        seen: Set[int] = {leader_id}
+        missing = []
+        for account_id in other_ids:
+            if account_id in seen:
+                continue
+            seen.add(account_id)
+            if player := leader_match.find_player(account_id):
+                members.append((leader_match, player))
+            else:
+                missing.append(account_id)
+
+        if include_party and leader.party_id is not None:
+            for player in leader_match.players:
+                if player.party_id == leader.party_id and player.account_id not in seen:
+                    seen.add(player.account_id)
+                    members.append((leader_match, player))
+
+        if missing:
+            members.extend(await _get_other_matches(budget, missing, known={leader_match.match_id: leader_match}))
+
+        hero_ids = {player.hero_id for _, player in members}
+        dota2_heroes = dict(zip(hero_ids, await asyncio.gather(*(
+            budget.stage(f"dota2_hero_{hero_id}", get_hero_info_from_dota2_com(hero_id=hero_id), default=None)
+            for hero_id in hero_ids
+        ))))
+        opendota_heroes = await heroes
+        return [
+            _to_recent_match(full_match, player, dota2_heroes[player.hero_id], opendota_heroes)
+            for full_match, player in members
+        ]
+    finally:
+        heroes.cancel()
+        budget.log_timings()
+
+
+async def _get_other_matches(
+    budget: LatencyBudget, account_ids: List[int], known: Dict[int, CompactMatch]
+) -> List[Tuple[CompactMatch, CompactPlayer]]:
+    recent = await asyncio.gather(*(
+        budget.stage(f"recent_matches_{account_id}", get_player_recent_matches(account_id=account_id, limit=1), default=[])
+        for account_id in account_ids
+    ))
+    match_ids = {
+        recent_match.match_id
+        for recent_matches in recent
+        for recent_match in recent_matches[:1]
+        if recent_match.match_id not in known
+    }
+    fetched = await asyncio.gather(*(
+        budget.stage(f"match_{match_id}", get_match(match_id), default=None) for match_id in match_ids
+    ))
+    matches = {**known, **{match_id: match for match_id, match in zip(match_ids, fetched) if match is not None}}
+
+    members = []
+    for account_id, recent_matches in zip(account_ids, recent):
+        if not recent_matches or not (full_match := matches.get(recent_matches[0].match_id)):
+            continue
+        if player := full_match.find_player(account_id):
+            members.append((full_match, player))
+    return members
+
+
+async def describe_match(match: DotaRecentMatch, executor: Optional[LlmExecutor] = None) -> str:
+    key = f"{match.match_id}:{match.account_id}:{DESCRIBE_MATCH_PROMPT_VERSION}"
+    if description := await description_cache.get(key):
+        return description
+    if description := await (executor or llm).generate(match.to_context()):
+        await description_cache.put(key, description)
+        return description
+    # template fallbacks are not cached so the next request gets another chance at the model
+    return phrases.PHRASE_GENERATOR.get_phrase(
+        win=match.win, username=match.nickname, hero=match.hero_name, score=match.score, kda=match.kda
+    )
+
+
+def _party_players_block(members: List[DotaRecentMatch]) -> str:
+    return "\n".join(
+        f"    NICKNAME - {match.nickname}, HERO_NAME - {match.hero_name}, WIN - {match.win}, "
+        f"KDA - {match.kda:.2f}, SCORE - {match.score}"
+        for match in members
+    )
+
+
+async def describe_party(members: List[DotaRecentMatch]) -> str:
+    players = _party_players_block(members)
+    key = "party:{}:{}".format(hashlib.sha1(players.encode("utf-8")).hexdigest(), PARTY_PROMPT_VERSION)
+    if description := await description_cache.get(key):
+        return description
+    if description := await llm.generate({"players": players}, chain=party_generator):
+        await description_cache.put(key, description)
+        return description
+    return "\n".join(
+        phrases.PHRASE_GENERATOR.get_phrase(
+            win=match.win, username=match.nickname, hero=match.hero_name, score=match.score, kda=match.kda
+        )
+        for match in members
+    )
 
 
 @handles_exceptions
@@ -194,16 +448,43 @@ async def dota_lastmatch(context: Context) -> None:
         await context.reply_to_user("Не могу найти твой последний матч")
         return
 
-    response = phrase_generator.invoke(match.to_context())
+    description = await describe_match(match)
     emoji = context.normalize_emoji("clueless") if match.win else context.normalize_emoji("aware")
     await context.reply_to_user_with_embed(
         title="{} {} {}".format(match.date, match.game_mode, emoji),
-        description="{}\n\n[OpenDota] {}".format(response.content, match.url),
+        description="{}\n\n[OpenDota] {}".format(description, match.url),
         color=0x00a0ea,
         thumbnail=match.hero_image_url
     )
 
 
+@handles_exceptions
+async def dota_party_lastmatch(context: Context) -> None:
+    keys = [context.key] + [key for key in dict.fromkeys(context.mentioned_user_keys) if key != context.key]
+    account_ids = [
+        opendota_id for key in keys if (opendota_id := context.get_user_cache(key).opendota_id)
+    ]
+    if not account_ids:
+        await context.reply_to_user("Не знаю ни одного профиля OpenDota, привяжи свой")
+        return
+
+    members = await get_party_match_info(account_ids, include_party=not context.mentioned_user_keys)
+    if not members:
+        await context.reply_to_user("Не могу найти последний матч")
+        return
+
+    leader = members[0]
+    description = await describe_party(members)
+    urls = "\n".join(dict.fromkeys(match.url for match in members))
+    emoji = context.normalize_emoji("clueless") if leader.win else context.normalize_emoji("aware")
+    await context.reply_to_user_with_embed(
+        title="{} {} {}".format(leader.date, leader.game_mode, emoji),
+        description="{}\n\n[OpenDota] {}".format(description, urls),
+        color=0x00a0ea,
+        thumbnail=leader.hero_image_url
+    )
+
+
 @handles_exceptions
 async def greeting(context: Context) -> None:
     await context.reply_to_user("Здарова")
@@ -218,22 +499,23 @@ def get_handlers() -> Dict[str, Handler]:
     return {
         "link_account": link_account,
         "dota_lastmatch": dota_lastmatch,
+        "dota_party_lastmatch": dota_party_lastmatch,
+        "greeting": greeting,
         "silence": silence,
     }
 
 
 async def main():
-    # for m in giga.get_models().data:
+    # for m in get_giga().get_models().data:
     #     print(m)
 
     # match = await get_recent_match_info(54190916)
     # match = await get_recent_match_info(102349859)
     # match = await get_recent_match_info(55136643)
     match = await get_recent_match_info(77264404)
-    phrase = phrase_generator.invoke(match.to_context())
-    print(phrase.content)
+    print(await describe_match(match))
+    await HTTP_CLIENT.close()
 
 
 if __name__ == '__main__':
-    import asyncio
     asyncio.run(main())
@@ -0,0 +1,55 @@
+import asyncio
+from logging import getLogger
+from time import monotonic
+from typing import Any, Awaitable, Dict, TypeVar
+
+from attr import dataclass, attrib
+
+__all__ = [
+    "LatencyBudget",
+    "REQUIRED",
+]
+
+_logger = getLogger(__name__)
+
+T = TypeVar("T")
+
+REQUIRED: Any = object()
+
+
+@dataclass(slots=True)
+class LatencyBudget:
+    name: str
+    total: float
+    timings: Dict[str, float] = attrib(factory=dict, init=False)
+    skipped: Dict[str, str] = attrib(factory=dict, init=False)
+    _started: float = attrib(factory=monotonic, init=False)
+
+    @property
+    def remaining(self) -> float:
+        return max(0.0, self._started + self.total - monotonic())
+
+    async def stage(self, name: str, awaitable: Awaitable[T], default: Any = REQUIRED) -> T:
+        # stages with a default degrade to it on timeout or error, required ones raise
+        started = monotonic()
+        try:
+            return await asyncio.wait_for(awaitable, timeout=self.remaining)
+        except asyncio.TimeoutError:
+            if default is REQUIRED:
+                raise
+            self.skipped[name] = "timeout"
+            return default
+        except Exception as error:
+            if default is REQUIRED:
+                raise
+            _logger.warning(f"{self.name}: optional stage {name} failed with {error}")
+            self.skipped[name] = type(error).__name__
+            return default
+        finally:
+            self.timings[name] = monotonic() - started
+
+    def log_timings(self) -> None:
+        stages = ", ".join(f"{name}={elapsed * 1000:.0f}ms" for name, elapsed in self.timings.items())
+        skipped = f" skipped: {self.skipped}" if self.skipped else ""
+        total = (monotonic() - self._started) * 1000
+        _logger.info(f"{self.name} took {total:.0f}ms ({stages}){skipped}")
@@ -0,0 +1,56 @@
+import functools
+import inspect
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar, Union
+
+from botislav.lru import CacheStats, LruCache
+from botislav.integrations.singleflight import SingleFlight, make_key
+
+__all__ = [
+    "cached",
+]
+
+T = TypeVar("T")
+
+_MISSING: Any = object()
+
+Ttl = Union[None, float, Callable[[Any], Optional[float]]]
+
+
+def cached(
+    ttl: Ttl = None,
+    max_entries: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    # ttl may be a callable to give each result its own lifetime, None caches forever
+
+    def decorator(function: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        cache: LruCache[Hashable, T] = LruCache(max_entries=max_entries, max_bytes=max_bytes)
+        flight = SingleFlight()
+        signature = inspect.signature(function)
+
+        async def load(key: Hashable, args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> T:
+            value = await function(*args, **kwargs)
+            cache.put(key, value, ttl=ttl(value) if callable(ttl) else ttl)
+            return value
+
+        @functools.wraps(function)
+        async def wrapped(*args: Any, **kwargs: Any) -> T:
+            # f(1), f(1, limit=10) and f(account_id=1) are the same call and share an entry
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = make_key(bound.args, bound.kwargs)
+            value = cache.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            # concurrent misses for the same key share a single upstream call
+            return await flight.do(key, lambda: load(key, args, kwargs))
+
+        def cache_info() -> CacheStats:
+            return cache.stats
+
+        wrapped.cache = cache
+        wrapped.flight = flight
+        wrapped.cache_info = cache_info
+        return wrapped
+
+    return decorator
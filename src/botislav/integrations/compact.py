@@ -0,0 +1,185 @@
+import math
+import threading
+from array import array
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple, Union, get_args, get_origin
+
+import attr
+import ctor
+
+from botislav.integrations.utils import json_dumps, json_loads
+
+__all__ = [
+    "CompactRows",
+]
+
+INT, BOOL, FLOAT, STR, BLOB = range(5)
+
+_MISSING_INT = -2 ** 63
+_NO_FIELD: Any = object()
+
+
+def _kind(field_type: Any) -> int:
+    if get_origin(field_type) is Union:
+        field_type, *_ = (arg for arg in get_args(field_type) if arg is not type(None))
+    if field_type is bool:
+        return BOOL
+    if field_type is int:
+        return INT
+    if field_type is float:
+        return FLOAT
+    if field_type is str:
+        return STR
+    return BLOB
+
+
+@attr.dataclass(slots=True, frozen=True)
+class _Layout:
+    record_type: type
+    names: Tuple[str, ...]
+    kinds: Tuple[int, ...]
+    types: Tuple[Any, ...]
+    # position of every column within the storage of its kind, and how many columns each storage has
+    offsets: Tuple[int, ...]
+    widths: Tuple[int, ...]
+    index: Dict[str, int]
+    defaults: Dict[str, Any]
+
+
+# layouts are shared by every table with the same columns; tables only keep an id,
+# so a cached match does not carry (or get charged for) its own copy. Tables are packed on the
+# loop thread and on decode pool threads, so new layouts are registered under a lock
+_LAYOUTS: List[_Layout] = []
+_LAYOUT_IDS: Dict[Tuple[type, Tuple[str, ...]], int] = {}
+_LAYOUTS_LOCK = threading.Lock()
+
+# one layout per set of present columns: with projected fields upstream payloads only ever
+# produce a handful, past this many a table keeps every column it may have instead
+MAX_LAYOUTS = 256
+
+
+def _make_layout(record_type: type, names: Tuple[str, ...]) -> _Layout:
+    fields = attr.fields_dict(record_type)
+    kinds = tuple(_kind(fields[name].type) for name in names)
+    offsets, widths = [], [0] * 5
+    for kind in kinds:
+        storage = INT if kind == BOOL else kind
+        offsets.append(widths[storage])
+        widths[storage] += 1
+    return _Layout(
+        record_type=record_type,
+        names=names,
+        kinds=kinds,
+        types=tuple(fields[name].type for name in names),
+        offsets=tuple(offsets),
+        widths=tuple(widths),
+        index={name: position for position, name in enumerate(names)},
+        defaults={
+            name: None if field.default is attr.NOTHING or isinstance(field.default, attr.Factory) else field.default
+            for name, field in fields.items()
+        },
+    )
+
+
+def _layout_id(record_type: type, names: Tuple[str, ...], all_names: Tuple[str, ...]) -> int:
+    if (layout_id := _LAYOUT_IDS.get((record_type, names))) is not None:
+        return layout_id
+
+    with _LAYOUTS_LOCK:
+        if len(_LAYOUTS) >= MAX_LAYOUTS:
+            names = all_names
+        key = (record_type, names)
+        if (layout_id := _LAYOUT_IDS.get(key)) is None:
+            layout_id = len(_LAYOUTS)
+            _LAYOUTS.append(_make_layout(record_type, names))
+            _LAYOUT_IDS[key] = layout_id
+        return layout_id
+
+
+class CompactRows:
+    # records of one attrs class packed column-wise: numbers live in flat arrays, strings in a tuple
+    # and anything structured stays encoded as json until it is read; only columns that have
+    # a value in at least one record are stored
+    __slots__ = ("_layout_id", "_rows", "_ints", "_floats", "_strs", "_blobs")
+
+    def __init__(
+        self,
+        layout_id: int,
+        rows: int,
+        ints: array,
+        floats: array,
+        strs: Tuple[Optional[str], ...],
+        blobs: Tuple[Optional[bytes], ...],
+    ) -> None:
+        self._layout_id = layout_id
+        self._rows = rows
+        self._ints = ints
+        self._floats = floats
+        self._strs = strs
+        self._blobs = blobs
+
+    @classmethod
+    def pack(
+        cls,
+        record_type: type,
+        records: Sequence[Dict[str, Any]],
+        fields: Optional[FrozenSet[str]] = None,
+        exclude: FrozenSet[str] = frozenset(),
+    ) -> "CompactRows":
+        present = {key for record in records for key, value in record.items() if value is not None}
+        all_names = tuple(
+            name for name in attr.fields_dict(record_type)
+            if name not in exclude and (fields is None or name in fields)
+        )
+        layout_id = _layout_id(record_type, tuple(name for name in all_names if name in present), all_names)
+        layout = _LAYOUTS[layout_id]
+
+        ints, floats, strs, blobs = array("q"), array("d"), [], []
+        for record in records:
+            for name, kind in zip(layout.names, layout.kinds):
+                value = record.get(name)
+                if kind == INT or kind == BOOL:
+                    ints.append(_MISSING_INT if value is None else int(value))
+                elif kind == FLOAT:
+                    floats.append(math.nan if value is None else float(value))
+                elif kind == STR:
+                    strs.append(value)
+                else:
+                    blobs.append(None if value is None else json_dumps(value))
+        return cls(layout_id, len(records), ints, floats, tuple(strs), tuple(blobs))
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def get(self, row: int, name: str) -> Any:
+        layout = _LAYOUTS[self._layout_id]
+        position = layout.index.get(name)
+        if position is None:
+            if (default := layout.defaults.get(name, _NO_FIELD)) is _NO_FIELD:
+                raise AttributeError(name)
+            return default
+
+        kind = layout.kinds[position]
+        if kind == INT or kind == BOOL:
+            value = self._ints[row * layout.widths[INT] + layout.offsets[position]]
+            if value == _MISSING_INT:
+                return None
+            return bool(value) if kind == BOOL else value
+        if kind == FLOAT:
+            value = self._floats[row * layout.widths[FLOAT] + layout.offsets[position]]
+            return None if math.isnan(value) else value
+        if kind == STR:
+            return self._strs[row * layout.widths[STR] + layout.offsets[position]]
+        blob = self._blobs[row * layout.widths[BLOB] + layout.offsets[position]]
+        return None if blob is None else ctor.load(layout.types[position], json_loads(blob))
+
+    def to_dict(self, row: int) -> Dict[str, Any]:
+        # plain json values, as they were packed
+        layout = _LAYOUTS[self._layout_id]
+        result = {}
+        for position, name in enumerate(layout.names):
+            if layout.kinds[position] == BLOB:
+                blob = self._blobs[row * layout.widths[BLOB] + layout.offsets[position]]
+                result[name] = None if blob is None else json_loads(blob)
+            else:
+                result[name] = self.get(row, name)
+        return result
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import pickle
+from logging import getLogger
+from pathlib import Path
+from time import time
+from typing import Any, Callable, Dict, Generic, Iterable, Optional, TypeVar
+
+from attr import dataclass
+
+from botislav.integrations.decode import decode
+from botislav.integrations.singleflight import SingleFlight
+from botislav.integrations.utils import HTTP_CLIENT
+
+__all__ = [
+    "CONSTANTS_CACHE_DIR",
+    "PersistentConstant",
+    "warm_up_constants",
+]
+
+_logger = getLogger(__name__)
+
+T = TypeVar("T")
+
+CONSTANTS_CACHE_DIR = Path("./cache/constants")
+REVALIDATE_AFTER = 60 * 60 * 24  # 24 hours
+
+# bump whenever the classes stored in snapshots change shape
+_SNAPSHOT_FORMAT = 1
+
+@dataclass(slots=True, frozen=True)
+class _Snapshot:
+    format: int
+    value: Any
+    fetched_at: float
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+class PersistentConstant(Generic[T]):
+    # serves the last known copy from memory or disk and revalidates it in the background
+
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        loader: Callable[[Any], T],
+        revalidate_after: float = REVALIDATE_AFTER,
+        cache_dir: Optional[Path] = None,
+    ) -> None:
+        self.name = name
+        self.url = url
+        self.loader = loader
+        self.revalidate_after = revalidate_after
+        self.cache_dir = cache_dir
+        self._snapshot: Optional[_Snapshot] = None
+        self._loaded_from_disk = False
+        self._flight = SingleFlight()
+        self._revalidation: Optional["asyncio.Task[None]"] = None
+
+    @property
+    def path(self) -> Path:
+        return (self.cache_dir or CONSTANTS_CACHE_DIR) / f"{self.name}.pickle"
+
+    @property
+    def is_stale(self) -> bool:
+        return self._snapshot is None or self._snapshot.fetched_at + self.revalidate_after < time()
+
+    async def __call__(self) -> T:
+        if not self._loaded_from_disk:
+            await self._flight.do("disk", self._load_from_disk)
+        if self._snapshot is None:
+            await self._flight.do("upstream", self._refresh)
+        elif self.is_stale:
+            self.revalidate_in_background()
+        return self._snapshot.value
+
+    async def warm_up(self) -> None:
+        if not self._loaded_from_disk:
+            await self._flight.do("disk", self._load_from_disk)
+        self.revalidate_in_background()
+
+    def revalidate_in_background(self) -> None:
+        if self._revalidation is None or self._revalidation.done():
+            self._revalidation = asyncio.create_task(self._revalidate())
+
+    async def _revalidate(self) -> None:
+        try:
+            await self._flight.do("upstream", self._refresh)
+        except Exception as error:
+            _logger.warning(f"Revalidation of {self.name} failed with {error}, serving stale copy")
+
+    async def _load_from_disk(self) -> None:
+        self._snapshot = await asyncio.to_thread(self._read)
+        self._loaded_from_disk = True
+
+    def _read(self) -> Optional[_Snapshot]:
+        try:
+            with self.path.open("rb") as file:
+                snapshot = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except Exception as error:
+            _logger.warning(f"Ignoring unreadable snapshot {self.path}: {error}")
+            return None
+        if not isinstance(snapshot, _Snapshot) or snapshot.format != _SNAPSHOT_FORMAT:
+            return None
+        return snapshot
+
+    def _write(self, snapshot: _Snapshot) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # several bot processes may revalidate at once
+        temporary = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with temporary.open("wb") as file:
+            pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, self.path)
+
+    async def _refresh(self) -> None:
+        headers: Dict[str, str] = {}
+        if self._snapshot is not None:
+            if self._snapshot.etag:
+                headers["If-None-Match"] = self._snapshot.etag
+            if self._snapshot.last_modified:
+                headers["If-Modified-Since"] = self._snapshot.last_modified
+
+        response = await HTTP_CLIENT.fetch(self.url, headers=headers)
+
+        if response.status == 304 and self._snapshot is not None:
+            snapshot = _Snapshot(
+                format=_SNAPSHOT_FORMAT,
+                value=self._snapshot.value,
+                fetched_at=time(),
+                etag=self._snapshot.etag,
+                last_modified=self._snapshot.last_modified,
+            )
+        elif response.status == 200:
+            snapshot = _Snapshot(
+                format=_SNAPSHOT_FORMAT,
+                value=await decode(response.body, self.loader),
+                fetched_at=time(),
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+            )
+        else:
+            raise RuntimeError(f"Unexpected status {response.status} for {self.url}")
+
+        self._snapshot = snapshot
+        await asyncio.to_thread(self._write, snapshot)
+        _logger.info(f"Constant {self.name} revalidated with status {response.status}")
+
+
+async def warm_up_constants(constants: Iterable[PersistentConstant[Any]]) -> None:
+    await asyncio.gather(*(constant.warm_up() for constant in constants))
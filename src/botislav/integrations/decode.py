@@ -0,0 +1,62 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from typing import Any, Callable, Optional, TypeVar
+
+from attr import dataclass, attrib
+
+from botislav.integrations.utils import json_loads
+from botislav.metrics import span
+
+__all__ = [
+    "DecodePool",
+    "DECODE_POOL",
+    "decode",
+]
+
+_logger = getLogger(__name__)
+
+T = TypeVar("T")
+
+# a parsed match is ~130KB and takes ~1.5ms to decode, anything much smaller is not worth the hop to a thread
+DECODE_INLINE_BELOW = 64 * 1024
+
+
+def _decode(body: bytes, loader: Callable[[Any], T]) -> T:
+    return loader(json_loads(body))
+
+
+@dataclass(slots=True)
+class DecodePool:
+    # json parsing and ctor.load of large payloads, off the thread that answers gateway heartbeats;
+    # the GIL is still shared, but the loop thread gets it back every switch interval instead of
+    # waiting for the whole payload
+    max_workers: int = 2
+    inline_below: int = DECODE_INLINE_BELOW
+
+    offloaded: int = attrib(default=0, init=False)
+    inline: int = attrib(default=0, init=False)
+    _executor: Optional[ThreadPoolExecutor] = attrib(default=None, init=False)
+
+    async def decode(self, body: bytes, loader: Callable[[Any], T]) -> T:
+        if len(body) < self.inline_below:
+            self.inline += 1
+            return _decode(body, loader)
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="decode")
+        self.offloaded += 1
+        with span("decode"):
+            return await asyncio.get_running_loop().run_in_executor(self._executor, _decode, body, loader)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+DECODE_POOL = DecodePool()
+
+
+async def decode(body: bytes, loader: Callable[[Any], T]) -> T:
+    return await DECODE_POOL.decode(body, loader)
@@ -1,7 +1,12 @@
 import ctor
 from attr import dataclass
 
-from botislav.integrations.utils import CacheWithLifetime, get_json
+from botislav.integrations.cache import cached
+from botislav.integrations.utils import get_json
+
+DOTA2_DATAFEED_URL = "https://www.dota2.com/datafeed"
+
+HERO_DATA_TTL = 60 * 60 * 24  # heroes only change on patch day
 
 
 @dataclass
@@ -39,9 +44,8 @@ class Dota2Hero:
     mana_regen: float
 
 
+@cached(ttl=HERO_DATA_TTL, max_entries=256)
 async def get_hero_info_from_dota2_com(hero_id: int) -> Dota2Hero:
-    data = await get_json(
-        f"https://www.dota2.com/datafeed/herodata?language=russian&hero_id={hero_id}"
-    )
+    data = await get_json(f"{DOTA2_DATAFEED_URL}/herodata?language=russian&hero_id={hero_id}")
     hero_data = next(iter(data["result"]["data"]["heroes"]))
-    return ctor.load(Dota2Hero, hero_data)
\ No newline at end of file
+    return ctor.load(Dota2Hero, hero_data)
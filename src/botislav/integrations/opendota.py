@@ -1,8 +1,10 @@
 from datetime import datetime
 from typing import (
+    Any,
     Union,
     Literal,
     Dict,
+    FrozenSet,
     List,
     Optional,
 )
@@ -19,12 +21,43 @@ __all__ = [
     "get_items",
     "get_item_ids",
     "get_heroes",
+    "CONSTANTS",
     "translate_dota_rank",
     "get_player_recent_matches",
     "get_match",
+    "load_match",
+    "CompactMatch",
+    "CompactPlayer",
+    "load_compact_match",
+    "MATCH_FIELDS",
+    "PLAYER_FIELDS",
 ]
 
-from botislav.integrations.utils import CacheWithLifetime, get_json
+from botislav.integrations.cache import cached
+from botislav.integrations.compact import CompactRows
+from botislav.integrations.constants import PersistentConstant
+from botislav.integrations.decode import decode
+from botislav.integrations.ratelimit import RateLimiter, TokenBucket
+from botislav.integrations.utils import HTTP_CLIENT, RetryPolicy, get_json
+
+DOTACONSTANTS_URL = "https://raw.githubusercontent.com/odota/dotaconstants/master"
+
+# free tier limits, shared by every caller of the api
+OPENDOTA_HOST = "api.opendota.com"
+# read on every call, so load tests can point it at a local stub
+OPENDOTA_API_URL = f"https://{OPENDOTA_HOST}/api"
+OPENDOTA_RATE_LIMITER = RateLimiter(buckets=[
+    TokenBucket(capacity=60, period=60),
+    TokenBucket(capacity=2000, period=24 * 60 * 60),
+])
+HTTP_CLIENT.configure_host(OPENDOTA_HOST, rate_limiter=OPENDOTA_RATE_LIMITER, retry_policy=RetryPolicy())
+
+# decides which match "лм" describes, so it must catch a game that just ended;
+# long enough only to share the lookup between the handlers of one burst of messages
+RECENT_MATCHES_TTL = 5
+# how long other bot processes may reuse a fetched match, they never change once parsed
+MATCH_SHARED_TTL = 7 * 24 * 60 * 60
+MATCH_CACHE_MAX_BYTES = 32 * 1024 * 1024
 
 DOTA_RANK_TIERS = ["I", "II", "III", "IV", "V"]
 DOTA_RANK_NAMES = [
@@ -180,6 +213,8 @@ class Player:
     purchase_tpscroll: Optional[int] = None
     pings: Optional[int] = None
     teamfight_participation: Optional[float] = None
+    party_id: Optional[int] = None
+    party_size: Optional[int] = None
 
     @property
     def kda(self) -> float:
@@ -329,56 +364,158 @@ class DotaItem:
     components: Optional[List[str]] = None
 
 
-@CacheWithLifetime
-async def get_items() -> Dict[str, DotaItem]:
-    data = await get_json(
-        "https://raw.githubusercontent.com/odota/dotaconstants/master/build/items.json"
-    )
+def _load_items(data: Dict[str, Any]) -> Dict[str, DotaItem]:
     return ctor.load(Dict[str, DotaItem], data)
 
 
-@CacheWithLifetime
-async def get_item_ids() -> Dict[str, str]:
-    data = await get_json(
-        "https://raw.githubusercontent.com/odota/dotaconstants/master/build/item_ids.json"
-    )
+def _load_strings(data: Dict[str, Any]) -> Dict[str, str]:
     return ctor.load(Dict[str, str], data)
 
 
-@CacheWithLifetime
-async def get_permanent_buffs() -> Dict[str, str]:
-    data = await get_json(
-        "https://raw.githubusercontent.com/odota/dotaconstants/master/json/permanent_buffs.json"
-    )
-    return ctor.load(Dict[str, str], data)
-
-
-@CacheWithLifetime
-async def get_heroes() -> Dict[int, Hero]:
-    data = await get_json(
-        "https://raw.githubusercontent.com/odota/dotaconstants/master/build/heroes.json"
-    )
+def _load_heroes(data: Dict[str, Any]) -> Dict[int, Hero]:
     return {
         int(hero_id): ctor.load(Hero, hero_data) for hero_id, hero_data in data.items()
     }
 
 
-async def get_match(match_id: Union[str, int]) -> DotaMatch:
-    data = await get_json(f"https://api.opendota.com/api/matches/{match_id}")
-    return ctor.load(DotaMatch, data)
+get_items: PersistentConstant[Dict[str, DotaItem]] = PersistentConstant(
+    name="items",
+    url=f"{DOTACONSTANTS_URL}/build/items.json",
+    loader=_load_items,
+)
+
+get_item_ids: PersistentConstant[Dict[str, str]] = PersistentConstant(
+    name="item_ids",
+    url=f"{DOTACONSTANTS_URL}/build/item_ids.json",
+    loader=_load_strings,
+)
+
+get_permanent_buffs: PersistentConstant[Dict[str, str]] = PersistentConstant(
+    name="permanent_buffs",
+    url=f"{DOTACONSTANTS_URL}/json/permanent_buffs.json",
+    loader=_load_strings,
+)
+
+get_heroes: PersistentConstant[Dict[int, Hero]] = PersistentConstant(
+    name="heroes",
+    url=f"{DOTACONSTANTS_URL}/build/heroes.json",
+    loader=_load_heroes,
+)
+
+# revalidated when the bot starts
+CONSTANTS = (get_items, get_item_ids, get_permanent_buffs, get_heroes)
+
+
+# what the handlers read from a match; parsed matches also carry per player damage, item usage,
+# timelines and chat, which are hundreds of KB that would only be materialized to be thrown away
+MATCH_FIELDS = frozenset({
+    "match_id", "start_time", "game_mode", "duration", "lobby_type", "radiant_win", "players",
+})
+PLAYER_FIELDS = frozenset({
+    "account_id", "player_slot", "hero_id", "isRadiant", "win", "kills", "deaths", "assists",
+    "personaname", "party_id", "party_size",
+})
+
+
+def _project(data: Dict[str, Any], fields: Optional[FrozenSet[str]]) -> Dict[str, Any]:
+    if fields is None:
+        return data
+    return {key: value for key, value in data.items() if key in fields}
+
+
+def load_match(
+    data: Dict[str, Any],
+    match_fields: Optional[FrozenSet[str]] = MATCH_FIELDS,
+    player_fields: Optional[FrozenSet[str]] = PLAYER_FIELDS,
+) -> DotaMatch:
+    # None keeps every field
+    match = _project(data, match_fields)
+    if "players" in match and player_fields is not None:
+        match["players"] = [_project(player, player_fields) for player in data["players"]]
+    return ctor.load(DotaMatch, match)
+
+
+class CompactPlayer:
+    # a read-only view of one row of CompactMatch players, with the same attributes as Player
+    __slots__ = ("_rows", "_row")
+
+    kda = Player.kda
+
+    def __init__(self, rows: CompactRows, row: int) -> None:
+        self._rows = rows
+        self._row = row
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return self._rows.get(self._row, name)
+
+    def to_player(self) -> Player:
+        return ctor.load(Player, self._rows.to_dict(self._row))
+
+
+class CompactMatch:
+    # the cached form of a match, with the same attributes as DotaMatch;
+    # an order of magnitude smaller than the attrs objects it replaces
+    __slots__ = ("_fields", "_players")
+
+    start_date = DotaMatch.start_date
+    game_mode_localized = DotaMatch.game_mode_localized
+    url = DotaMatch.url
+    find_player = DotaMatch.find_player
+
+    def __init__(self, fields: CompactRows, players: CompactRows) -> None:
+        self._fields = fields
+        self._players = players
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return self._fields.get(0, name)
+
+    @property
+    def players(self) -> List[CompactPlayer]:
+        return [CompactPlayer(self._players, row) for row in range(len(self._players))]
+
+    def to_match(self) -> DotaMatch:
+        return ctor.load(DotaMatch, {
+            **self._fields.to_dict(0),
+            "players": [self._players.to_dict(row) for row in range(len(self._players))],
+        })
+
+
+def load_compact_match(
+    data: Dict[str, Any],
+    match_fields: Optional[FrozenSet[str]] = MATCH_FIELDS,
+    player_fields: Optional[FrozenSet[str]] = PLAYER_FIELDS,
+) -> CompactMatch:
+    return CompactMatch(
+        fields=CompactRows.pack(DotaMatch, [data], match_fields, exclude=frozenset({"players"})),
+        players=CompactRows.pack(Player, data.get("players") or [], player_fields),
+    )
+
+
+# finished matches never change, so they stay cached until evicted
+@cached(max_entries=1024, max_bytes=MATCH_CACHE_MAX_BYTES)
+async def get_match(match_id: Union[str, int]) -> CompactMatch:
+    response = await HTTP_CLIENT.get(f"{OPENDOTA_API_URL}/matches/{match_id}", shared_ttl=MATCH_SHARED_TTL)
+    return await decode(response.body, load_compact_match)
 
 
+@cached(ttl=RECENT_MATCHES_TTL, max_entries=1024)
 async def get_player_recent_matches(
     account_id: Union[str, int], limit: int = 10, significant: Literal[0, 1] = 0
 ) -> List[PlayerRecentMatch]:
     data = await get_json(
-        f"https://api.opendota.com/api/players/{account_id}/recentMatches?limit={limit}&significant={significant}"
+        f"{OPENDOTA_API_URL}/players/{account_id}/recentMatches?limit={limit}&significant={significant}",
+        shared_ttl=RECENT_MATCHES_TTL,
     )
     return ctor.load(List[PlayerRecentMatch], data)
 
 
 async def main():
     await get_match(6862778480)
+    await HTTP_CLIENT.close()
 
 
 if __name__ == '__main__':
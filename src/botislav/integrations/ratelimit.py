@@ -0,0 +1,142 @@
+import asyncio
+import heapq
+import itertools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from time import monotonic
+from typing import Iterator, List, Optional
+
+from attr import dataclass, attrib
+
+__all__ = [
+    "Priority",
+    "request_priority",
+    "background_priority",
+    "TokenBucket",
+    "RateLimiter",
+]
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+# tasks inherit the priority of whoever created them, so a prefetcher only has to set it once
+request_priority: ContextVar[Priority] = ContextVar("request_priority", default=Priority.INTERACTIVE)
+
+
+@contextmanager
+def background_priority() -> Iterator[None]:
+    token = request_priority.set(Priority.BACKGROUND)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+@dataclass(slots=True)
+class TokenBucket:
+    capacity: float
+    period: float  # seconds to refill the whole capacity
+
+    tokens: float = attrib(default=None, init=False)
+    _updated: float = attrib(factory=monotonic, init=False)
+
+    def __attrs_post_init__(self) -> None:
+        self.tokens = self.capacity
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+@dataclass(slots=True)
+class _Waiter:
+    priority: int
+    order: int
+    wakeup: asyncio.Future
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.order) < (other.priority, other.order)
+
+
+@dataclass(slots=True)
+class RateLimiter:
+    # every bucket must have a token for a request to pass; waiters are served by priority,
+    # then in arrival order, and only the head of the queue ever sleeps on the buckets
+    buckets: List[TokenBucket]
+
+    throttled: int = attrib(default=0, init=False)
+    throttled_seconds: float = attrib(default=0.0, init=False)
+    _paused_until: float = attrib(default=0.0, init=False)
+    _waiters: List[_Waiter] = attrib(factory=list, init=False)
+    _order: Iterator[int] = attrib(factory=itertools.count, init=False)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def split(self, parts: int) -> None:
+        # each of several processes calling the same api keeps to its share of the quota;
+        # a bucket must hold at least one token, so tiny shares stretch the period instead
+        buckets = []
+        for bucket in self.buckets:
+            share = bucket.capacity / parts
+            buckets.append(TokenBucket(capacity=max(1.0, share), period=bucket.period * max(1.0, share) / share))
+        self.buckets = buckets
+
+    def pause(self, seconds: float) -> None:
+        # the upstream asked to back off, e.g. with Retry-After
+        self._paused_until = max(self._paused_until, monotonic() + seconds)
+
+    def _delay(self, now: float) -> float:
+        for bucket in self.buckets:
+            bucket.refill(now)
+        return max([self._paused_until - now, *(bucket.delay() for bucket in self.buckets)])
+
+    def _wake_head(self) -> None:
+        if self._waiters and not self._waiters[0].wakeup.done():
+            self._waiters[0].wakeup.set_result(None)
+
+    async def acquire(self, priority: Optional[Priority] = None) -> None:
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(
+            priority=request_priority.get() if priority is None else priority,
+            order=next(self._order),
+            wakeup=loop.create_future(),
+        )
+        heapq.heappush(self._waiters, waiter)
+        started = monotonic()
+        try:
+            while True:
+                if self._waiters[0] is not waiter:
+                    await waiter.wakeup
+                    waiter.wakeup = loop.create_future()
+                    continue
+                delay = self._delay(monotonic())
+                if delay <= 0:
+                    break
+                # a more important waiter arriving meanwhile takes over the head and sleeps instead
+                await asyncio.sleep(delay)
+        except BaseException:
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+            self._wake_head()
+            raise
+
+        heapq.heappop(self._waiters)
+        for bucket in self.buckets:
+            bucket.tokens -= 1
+        if (waited := monotonic() - started) > 0.001:
+            self.throttled += 1
+            self.throttled_seconds += waited
+        self._wake_head()
@@ -0,0 +1,90 @@
+import asyncio
+import sqlite3
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from pathlib import Path
+from typing import Optional, Union
+
+__all__ = [
+    "SharedCache",
+]
+
+_logger = getLogger(__name__)
+
+
+class SharedCache:
+    # upstream responses shared by every bot process on the machine, behind the in-process caches;
+    # bodies are stored compressed, all sqlite work runs on one worker thread
+
+    def __init__(self, path: Union[str, Path], max_entries: int = 5_000, purge_every: int = 100) -> None:
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.purge_every = purge_every
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._connection: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-cache")
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.path)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, body BLOB NOT NULL, expires REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)")
+        return self._connection
+
+    def _get(self, key: str) -> Optional[bytes]:
+        row = self._connect().execute(
+            "SELECT body FROM responses WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone()
+        return zlib.decompress(row[0]) if row else None
+
+    def _put(self, key: str, body: bytes, ttl: float) -> None:
+        connection = self._connect()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (key, body, expires) VALUES (?, ?, ?)",
+                (key, zlib.compress(body), time.time() + ttl),
+            )
+            self._puts += 1
+            if self._puts % self.purge_every == 0:
+                self._purge(connection)
+
+    def _purge(self, connection: sqlite3.Connection) -> None:
+        connection.execute("DELETE FROM responses WHERE expires <= ?", (time.time(),))
+        (count,) = connection.execute("SELECT COUNT(*) FROM responses").fetchone()
+        if count > self.max_entries:
+            connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY expires ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def _close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    async def get(self, key: str) -> Optional[bytes]:
+        body = await asyncio.get_running_loop().run_in_executor(self._executor, self._get, key)
+        if body is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return body
+
+    async def put(self, key: str, body: bytes, ttl: float) -> None:
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._put, key, body, ttl)
+        except sqlite3.Error as error:
+            # the other processes may hold the lock for too long, the response is still served
+            _logger.warning(f"Could not share {key}: {error}")
+
+    async def close(self) -> None:
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close)
+        self._executor.shutdown(wait=True)
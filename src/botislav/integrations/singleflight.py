@@ -0,0 +1,64 @@
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+from attr import dataclass, attrib
+
+__all__ = [
+    "SingleFlight",
+    "make_key",
+    "single_flight",
+]
+
+T = TypeVar("T")
+
+
+def make_key(args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> Hashable:
+    if not kwargs:
+        return args
+    return args, tuple(sorted(kwargs.items()))
+
+
+def _retrieve_exception(task: "asyncio.Future[Any]") -> None:
+    # every waiter may have been cancelled, keep asyncio from logging the error as unretrieved
+    if not task.cancelled():
+        task.exception()
+
+
+@dataclass(slots=True)
+class SingleFlight:
+    calls: int = attrib(default=0, init=False)
+    coalesced: int = attrib(default=0, init=False)
+    _in_flight: Dict[Hashable, "asyncio.Future[Any]"] = attrib(factory=dict, init=False)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def _forget(self, key: Hashable, task: "asyncio.Future[Any]") -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        self.calls += 1
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._in_flight[key] = task
+            task.add_done_callback(_retrieve_exception)
+            task.add_done_callback(functools.partial(self._forget, key))
+        else:
+            self.coalesced += 1
+        # a cancelled waiter must not cancel the call the others are waiting for
+        return await asyncio.shield(task)
+
+
+def single_flight(function: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    flight = SingleFlight()
+
+    @functools.wraps(function)
+    async def wrapped(*args: Any, **kwargs: Any) -> T:
+        return await flight.do(make_key(args, kwargs), lambda: function(*args, **kwargs))
+
+    wrapped.flight = flight
+    return wrapped
@@ -1,32 +1,197 @@
-import json
-from time import time
-from typing import Callable, Any, Optional, Iterable, Mapping, Dict
+import random
+import asyncio
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from logging import getLogger
+from typing import Any, Optional, Dict, Mapping
 
 import aiohttp
+from attr import dataclass, attrib
+from yarl import URL
 
+from botislav.integrations.ratelimit import RateLimiter
+from botislav.integrations.shared_cache import SharedCache
+from botislav.metrics import count, span
 
-class CacheWithLifetime:
-    function: Callable[..., Any]
+try:
+    # several times faster on large payloads like parsed matches, json is kept as a fallback
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:  # pragma: no cover
+    import json
 
-    _cache: Optional[Any] = None
-    _cache_creation_time: float = -1.0
-    _cache_lifetime: float = 60 * 60 * 24  # 24 hours
+    json_loads = json.loads
 
-    def __init__(self, function: Callable[..., Any]) -> None:
-        self.function = function
+    def json_dumps(value: Any) -> bytes:
+        return json.dumps(value, separators=(",", ":")).encode("utf-8")
 
-    def _cache_is_expired(self) -> bool:
-        return self._cache_creation_time + self._cache_lifetime < time()
+__all__ = [
+    "HttpResponse",
+    "UpstreamError",
+    "RetryPolicy",
+    "HttpClient",
+    "HTTP_CLIENT",
+    "json_loads",
+    "json_dumps",
+    "get_json",
+]
 
-    async def __call__(self, *args: Iterable[Any], **kwargs: Mapping[str, Any]) -> Any:
-        if not self._cache or self._cache_is_expired():
-            self._cache = await self.function(*args, **kwargs)
-            self._cache_creation_time = time()
-        return self._cache
+_logger = getLogger(__name__)
 
 
-async def get_json(url: str) -> Dict[str, Any]:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            data = await response.read()
-            return json.loads(data)
\ No newline at end of file
+@dataclass(slots=True, frozen=True)
+class HttpResponse:
+    status: int
+    headers: Mapping[str, str]
+    body: bytes
+
+    def json(self) -> Any:
+        return json_loads(self.body)
+
+
+class UpstreamError(Exception):
+    def __init__(self, url: str, status: Optional[int]) -> None:
+        super().__init__(f"Upstream {url} failed with status {status}")
+        self.url = url
+        self.status = status
+
+
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+@dataclass(slots=True, frozen=True)
+class RetryPolicy:
+    max_retries: int = 3
+    backoff_base: float = 0.5
+    backoff_max: float = 8.0
+    # an interactive request will not wait for longer than this, e.g. when a daily quota ran out
+    max_retry_after: float = 30.0
+
+    def backoff(self, attempt: int) -> float:
+        # "full jitter", so clients that failed together do not retry together
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass(slots=True)
+class HttpClient:
+    limit: int = 32
+    limit_per_host: int = 8
+    dns_cache_ttl: int = 60 * 10
+    keepalive_timeout: float = 60.0
+    timeout: float = 15.0
+
+    # per host, hosts without a policy are neither throttled nor retried
+    rate_limiters: Dict[str, RateLimiter] = attrib(factory=dict)
+    retry_policies: Dict[str, RetryPolicy] = attrib(factory=dict)
+    # shared with other bot processes, only used by requests that pass a shared_ttl
+    shared_cache: Optional[SharedCache] = attrib(default=None)
+
+    retries: int = attrib(default=0, init=False)
+    _session: Optional[aiohttp.ClientSession] = attrib(default=None, init=False)
+
+    def configure_host(
+        self, host: str, rate_limiter: Optional[RateLimiter] = None, retry_policy: Optional[RetryPolicy] = None
+    ) -> None:
+        if rate_limiter is not None:
+            self.rate_limiters[host] = rate_limiter
+        if retry_policy is not None:
+            self.retry_policies[host] = retry_policy
+
+    async def start(self) -> None:
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_cache_ttl,
+            use_dns_cache=True,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @property
+    def started(self) -> bool:
+        return self._session is not None and not self._session.closed
+
+    async def _fetch_once(self, url: str, host: str, headers: Optional[Mapping[str, str]]) -> HttpResponse:
+        # lazily start for scripts and tests that never call start() explicitly
+        if not self.started:
+            await self.start()
+        with span(f"http:{host}"):
+            async with self._session.get(url, headers=headers) as response:
+                body = await response.read()
+        count("botislav_http_responses_total", host=host, status=str(response.status))
+        return HttpResponse(status=response.status, headers=response.headers, body=body)
+
+    async def fetch(self, url: str, headers: Optional[Mapping[str, str]] = None) -> HttpResponse:
+        # transient failures are retried when the host has a policy, other statuses are returned as is
+        host = URL(url).host
+        rate_limiter = self.rate_limiters.get(host)
+        policy = self.retry_policies.get(host)
+        max_retries = policy.max_retries if policy else 0
+
+        for attempt in range(max_retries + 1):
+            if rate_limiter is not None:
+                await rate_limiter.acquire()
+            try:
+                response = await self._fetch_once(url, host, headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                if attempt == max_retries:
+                    raise UpstreamError(url, None) from error
+                delay = policy.backoff(attempt)
+                _logger.warning(f"Request to {url} failed with {error!r}, retrying in {delay:.2f}s")
+            else:
+                if response.status not in RETRYABLE_STATUSES or attempt == max_retries:
+                    return response
+                delay = parse_retry_after(response.headers.get("Retry-After"))
+                if delay is not None:
+                    if delay > policy.max_retry_after:
+                        return response
+                    if rate_limiter is not None:
+                        rate_limiter.pause(delay)
+                else:
+                    delay = policy.backoff(attempt)
+                _logger.warning(f"Request to {url} returned {response.status}, retrying in {delay:.2f}s")
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    async def get(self, url: str, shared_ttl: Optional[float] = None) -> HttpResponse:
+        shared = self.shared_cache if shared_ttl is not None else None
+        if shared is not None and (body := await shared.get(url)) is not None:
+            return HttpResponse(status=200, headers={}, body=body)
+        response = await self.fetch(url)
+        if not 200 <= response.status < 300:
+            raise UpstreamError(url, response.status)
+        if shared is not None:
+            await shared.put(url, response.body, ttl=shared_ttl)
+        return response
+
+    async def get_json(self, url: str, shared_ttl: Optional[float] = None) -> Dict[str, Any]:
+        return (await self.get(url, shared_ttl=shared_ttl)).json()
+
+
+HTTP_CLIENT = HttpClient()
+
+
+async def get_json(url: str, shared_ttl: Optional[float] = None) -> Dict[str, Any]:
+    return await HTTP_CLIENT.get_json(url, shared_ttl=shared_ttl)
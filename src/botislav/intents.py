@@ -1,11 +1,18 @@
+import re
 from logging import getLogger
-from typing import Union
+from typing import Literal, Optional, Pattern, Union
 
-from attr import dataclass
+from attr import dataclass, attrib
 from lark.lark import Lark
+from lark.common import ParserConf
+from lark.grammar import NonTerminal
 from lark.exceptions import UnexpectedInput
+from lark.parsers.grammar_analysis import GrammarAnalyzer
 from lark.visitors import Transformer, TransformerChain
 
+from botislav.lru import CacheStats, LruCache
+from botislav.metrics import span
+
 
 _logger = getLogger(__name__)
 
@@ -14,12 +21,15 @@ __all__ = [
     "IntentMeta",
     "IntentClassifier",
     "INTENTS_GRAMMAR",
+    "INTENTS_GRAMMAR_LALR",
     "get_intent_classifier",
+    "compile_prefilter",
+    "normalize_phrase",
 ]
 
 
 INTENTS_GRAMMAR = """
-intent: link_account | dota_lastmatch | pubg_lastmatch | greeting 
+intent: link_account | dota_party_lastmatch | dota_lastmatch | pubg_lastmatch | greeting 
 
 // -- greeting --
 
@@ -37,10 +47,14 @@ DIGIT: /[0-9]/
 // -- lastmatch --
 
 dota_lastmatch: LASTMATCH ("в"|"in")? DOTA | LASTMATCH
+dota_party_lastmatch: LASTMATCH ("в"|"in")? DOTA? (PARTY | MENTION+)
 pubg_lastmatch: LASTMATCH ("в"|"in")? PUBG
 
 LASTMATCH: "лм" | ("последняя "? "игра") | ("ласт" " "? "катка") | "!"? "last" " "? "match" | "!"? "lm"
 
+PARTY: "пати" | "party" | "тимы" | "команды"
+MENTION: "<@" "!"? DIGIT+ ">"
+
 game: PUBG | DOTA
 PUBG: "pubg" | "пубг" | "пабг" | "пабж" | "бабаджи" | "babagee"
 DOTA: ("dota" | "dotes" | "дота" | "доту" | "дока" | "доку") " "? ("2" | "two" | "два")?
@@ -50,25 +64,71 @@ DOTA: ("dota" | "dotes" | "дота" | "доту" | "дока" | "доку") " "
 """
 
 
+# Same language as INTENTS_GRAMMAR, but unambiguous for the contextual LALR lexer:
+# "привяжи" and its separator are one prioritized terminal, so GREETING's "прив" cannot win
+_LINK_ACCOUNT_RULE = 'link_account: "привяжи" WS OPENDOTA'
+_LINK_ACCOUNT_RULE_LALR = 'link_account: LINK_ACCOUNT OPENDOTA\nLINK_ACCOUNT.2: "привяжи" WS'
+if _LINK_ACCOUNT_RULE not in INTENTS_GRAMMAR:
+    raise RuntimeError("INTENTS_GRAMMAR changed link_account, update its LALR variant")
+INTENTS_GRAMMAR_LALR = INTENTS_GRAMMAR.replace(_LINK_ACCOUNT_RULE, _LINK_ACCOUNT_RULE_LALR)
+
+
 @dataclass(frozen=True, slots=True)
 class IntentMeta:
     handler_id: str
 
 
+SILENCE = IntentMeta(handler_id="silence")
+
+# only short phrases are memoized, which caps the memo at roughly size * length characters
+MEMO_SIZE = 4096
+MEMO_MAX_PHRASE_LENGTH = 64
+
+
+def normalize_phrase(phrase: str) -> str:
+    return " ".join(phrase.lower().split())
+
+
 @dataclass(frozen=True, slots=True)
 class IntentClassifier:
     parser: Lark
-    transformer: Union[Transformer, TransformerChain]
+    # None when the parser runs its transformer inline and returns IntentMeta directly
+    transformer: Optional[Union[Transformer, TransformerChain]]
+    prefilter: Optional[Pattern[str]] = None
+    memo: "LruCache[str, IntentMeta]" = attrib(factory=lambda: LruCache(max_entries=MEMO_SIZE))
+
+    def may_match(self, phrase: str) -> bool:
+        return self.prefilter is None or self.prefilter.match(phrase) is not None
+
+    def memo_info(self) -> CacheStats:
+        return self.memo.stats
 
     def get_intent(self, phrase: str) -> IntentMeta:
+        with span("intent"):
+            return self._get_intent(phrase)
+
+    def _get_intent(self, phrase: str) -> IntentMeta:
+        phrase = normalize_phrase(phrase)
+        if not self.may_match(phrase):
+            return SILENCE
+        if len(phrase) > MEMO_MAX_PHRASE_LENGTH:
+            return self._parse(phrase)
+        if (meta := self.memo.get(phrase)) is None:
+            meta = self._parse(phrase)
+            self.memo.put(phrase, meta)
+        return meta
+
+    def _parse(self, phrase: str) -> IntentMeta:
         try:
-            tree = self.parser.parse(phrase)
-            node = self.transformer.transform(tree)
-            meta = node.children[0]
-            _logger.info(f"Matched {meta}")
+            result = self.parser.parse(phrase)
+            if self.transformer is None:
+                meta = result
+            else:
+                meta = self.transformer.transform(result).children[0]
+            _logger.debug(f"Matched {meta}")
             return meta
         except UnexpectedInput:
-            return IntentMeta(handler_id="silence")
+            return SILENCE
 
 
 class LastMatchTransformer(Transformer):
@@ -76,6 +136,10 @@ class LastMatchTransformer(Transformer):
     def dota_lastmatch(self, _) -> IntentMeta:
         return IntentMeta(handler_id="dota_lastmatch")
 
+    # noinspection PyMethodMayBeStatic
+    def dota_party_lastmatch(self, _) -> IntentMeta:
+        return IntentMeta(handler_id="dota_party_lastmatch")
+
     # noinspection PyMethodMayBeStatic
     def pubg_lastmatch(self, _) -> IntentMeta:
         return IntentMeta(handler_id="pubg_lastmatch")
@@ -93,7 +157,36 @@ class LinkAccountTransformer(Transformer):
         return IntentMeta(handler_id="link_account")
 
 
-def get_intent_classifier() -> IntentClassifier:
+class IntentTransformer(GreetingTransformer, LastMatchTransformer, LinkAccountTransformer):
+    # noinspection PyMethodMayBeStatic
+    def intent(self, children) -> IntentMeta:
+        return children[0]
+
+
+def compile_prefilter(parser: Lark, start: str = "intent") -> Pattern[str]:
+    # a phrase can only parse if it starts with one of the terminals in FIRST(start),
+    # optionally preceded by ignored terminals, so anything else is rejected up front
+    analyzer = GrammarAnalyzer(ParserConf(parser.rules, None, [start]))
+    first = sorted(terminal.name for terminal in analyzer.FIRST[NonTerminal(start)])
+    ignored = [parser.get_terminal(name).pattern.to_regexp() for name in parser.lexer_conf.ignore]
+    leading = "(?:{})*".format("|".join(ignored)) if ignored else ""
+    alternatives = "|".join(parser.get_terminal(name).pattern.to_regexp() for name in first)
+    return re.compile(f"{leading}(?:{alternatives})")
+
+
+def get_intent_classifier(
+    mode: Literal["earley", "lalr"] = "earley", cache: Union[bool, str] = True
+) -> IntentClassifier:
+    if mode == "lalr":
+        # the parse table is pickled to `cache` (a temp file when True), so restarts skip grammar analysis
+        parser = Lark(
+            grammar=INTENTS_GRAMMAR_LALR,
+            start="intent",
+            parser="lalr",
+            transformer=IntentTransformer(),
+            cache=cache,
+        )
+        return IntentClassifier(parser=parser, transformer=None, prefilter=compile_prefilter(parser))
     parser = Lark(grammar=INTENTS_GRAMMAR, start="intent")
     transformer = GreetingTransformer() * LastMatchTransformer() * LinkAccountTransformer()
-    return IntentClassifier(parser=parser, transformer=transformer)
+    return IntentClassifier(parser=parser, transformer=transformer, prefilter=compile_prefilter(parser))
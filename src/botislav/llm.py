@@ -0,0 +1,93 @@
+import asyncio
+from logging import getLogger
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from attr import dataclass, attrib
+
+from botislav.metrics import span
+
+__all__ = [
+    "LazyChain",
+    "LlmExecutor",
+]
+
+_logger = getLogger(__name__)
+
+
+@dataclass(slots=True)
+class LazyChain:
+    # model clients pull in langchain and friends, so they are only built, off the event loop,
+    # when the first generation needs them or when load() is called to warm up
+    factory: Callable[[], Any]
+    # runs in the task of every generation, for per call context like context vars
+    setup: Optional[Callable[[], None]] = None
+
+    _chain: Any = attrib(default=None, init=False)
+    _loading: Optional[asyncio.Future] = attrib(default=None, init=False)
+
+    @property
+    def loaded(self) -> bool:
+        return self._chain is not None
+
+    async def load(self) -> Any:
+        if self._chain is None:
+            # shielded and stored by a callback, so a generation timing out during the first load
+            # does not waste it
+            if self._loading is None:
+                self._loading = asyncio.ensure_future(asyncio.to_thread(self.factory))
+                self._loading.add_done_callback(self._on_loaded)
+            return await asyncio.shield(self._loading)
+        return self._chain
+
+    def _on_loaded(self, loading: asyncio.Future) -> None:
+        if not loading.cancelled() and loading.exception() is None:
+            self._chain = loading.result()
+        else:
+            # the next generation tries again
+            self._loading = None
+
+    async def astream(self, inputs: Dict[str, Any]) -> AsyncIterator[Any]:
+        chain = await self.load()
+        if self.setup is not None:
+            self.setup()
+        async for chunk in chain.astream(inputs):
+            yield chunk
+
+
+@dataclass(slots=True)
+class LlmExecutor:
+    # `chain` is any langchain Runnable producing message chunks, e.g. a prompt piped into a chat model
+    chain: Any
+    max_concurrency: int = 2
+    timeout: float = 15.0
+
+    in_flight: int = attrib(default=0, init=False)
+    timeouts: int = attrib(default=0, init=False)
+    failures: int = attrib(default=0, init=False)
+    _semaphore: Optional[asyncio.Semaphore] = attrib(default=None, init=False)
+
+    async def _stream(self, inputs: Dict[str, Any], chain: Any) -> str:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                with span("llm"):
+                    chunks = [chunk.content async for chunk in chain.astream(inputs)]
+            finally:
+                self.in_flight -= 1
+        return "".join(chunks)
+
+    async def generate(self, inputs: Dict[str, Any], chain: Optional[Any] = None) -> Optional[str]:
+        # None means the caller should fall back to something that does not need the model;
+        # the timeout covers waiting for a free slot too, so a backlog degrades instead of queueing.
+        # Other chains may be passed to share the same concurrency limit
+        try:
+            return await asyncio.wait_for(self._stream(inputs, self.chain if chain is None else chain), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            _logger.warning(f"LLM generation timed out after {self.timeout}s")
+        except Exception as error:
+            self.failures += 1
+            _logger.error(f"LLM generation failed with {error}", exc_info=True)
+        return None
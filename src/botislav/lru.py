@@ -0,0 +1,139 @@
+import sys
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Callable, Generic, Hashable, Optional, TypeVar
+
+from attr import dataclass, attrib
+
+__all__ = [
+    "CacheStats",
+    "LruCache",
+    "deep_sizeof",
+]
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_DEFAULT_TTL: Any = object()
+
+
+def deep_sizeof(obj: Any) -> int:
+    seen = set()
+    stack = [obj]
+    size = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, (str, bytes, bytearray, int, float, bool)) or item is None:
+            continue
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        else:
+            for slot in getattr(type(item), "__slots__", ()):
+                if hasattr(item, slot):
+                    stack.append(getattr(item, slot))
+            if hasattr(item, "__dict__"):
+                stack.append(item.__dict__)
+    return size
+
+
+@dataclass(slots=True)
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+@dataclass(slots=True)
+class _Entry:
+    value: Any
+    size: int
+    expires_at: Optional[float]
+
+
+@dataclass(slots=True)
+class LruCache(Generic[K, V]):
+    max_entries: Optional[int] = None
+    max_bytes: Optional[int] = None
+    ttl: Optional[float] = None
+    sizeof: Callable[[Any], int] = deep_sizeof
+
+    stats: CacheStats = attrib(factory=CacheStats, init=False)
+    size_bytes: int = attrib(default=0, init=False)
+    _entries: "OrderedDict[K, _Entry]" = attrib(factory=OrderedDict, init=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        return self._lookup(key) is not None
+
+    def _lookup(self, key: K) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at is not None and entry.expires_at <= monotonic():
+            self._remove(key)
+            self.stats.expirations += 1
+            return None
+        return entry
+
+    def get(self, key: K, default: Any = None) -> V:
+        entry = self._lookup(key)
+        if entry is None:
+            self.stats.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return entry.value
+
+    def put(self, key: K, value: V, ttl: Optional[float] = _DEFAULT_TTL) -> None:
+        if ttl is _DEFAULT_TTL:
+            ttl = self.ttl
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            # would evict everything and still not fit
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = _Entry(
+            value=value, size=size, expires_at=monotonic() + ttl if ttl is not None else None
+        )
+        self.size_bytes += size
+        self._evict()
+
+    def pop(self, key: K, default: Any = None) -> V:
+        entry = self._lookup(key)
+        if entry is None:
+            return default
+        self._remove(key)
+        return entry.value
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size_bytes = 0
+
+    def _remove(self, key: K) -> None:
+        entry = self._entries.pop(key)
+        self.size_bytes -= entry.size
+
+    def _evict(self) -> None:
+        while self._entries and (
+            (self.max_entries is not None and len(self._entries) > self.max_entries)
+            or (self.max_bytes is not None and self.size_bytes > self.max_bytes)
+        ):
+            key, entry = self._entries.popitem(last=False)
+            self.size_bytes -= entry.size
+            self.stats.evictions += 1
@@ -0,0 +1,166 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging import getLogger
+from time import perf_counter
+from typing import TYPE_CHECKING, Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+from attr import dataclass, attrib
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+__all__ = [
+    "Histogram",
+    "Metrics",
+    "METRICS",
+    "span",
+    "count",
+    "trace_dialog",
+    "serve_metrics",
+]
+
+_logger = getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# spans finished within the current dialog, only set while a dialog is traced
+_trace: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("dialog_trace", default=None)
+
+
+@dataclass(slots=True)
+class Histogram:
+    buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+
+    counts: List[int] = attrib(init=False)
+    total: float = attrib(default=0.0, init=False)
+    count: int = attrib(default=0, init=False)
+
+    def __attrs_post_init__(self) -> None:
+        self.counts = [0] * (len(self.buckets) + 1)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *_) -> None:
+        return None
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+@dataclass(slots=True)
+class Metrics:
+    # everything is a no-op until enabled, so the hot path only pays for one attribute check
+    enabled: bool = False
+    trace_dialogs: bool = False
+
+    spans: Dict[str, Histogram] = attrib(factory=dict, init=False)
+    counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], int] = attrib(factory=dict, init=False)
+    gauges: Dict[str, Tuple[str, Callable[[], float]]] = attrib(factory=dict, init=False)
+
+    def span(self, name: str) -> ContextManager[None]:
+        if not self.enabled:
+            return _NOOP_SPAN
+        return self._span(name)
+
+    @contextmanager
+    def _span(self, name: str) -> Iterator[None]:
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - started
+            if (histogram := self.spans.get(name)) is None:
+                histogram = self.spans[name] = Histogram()
+            histogram.observe(elapsed)
+            if (trace := _trace.get()) is not None:
+                trace.append((name, elapsed))
+
+    def count(self, name: str, **labels: str) -> None:
+        if self.enabled:
+            key = (name, tuple(sorted(labels.items())))
+            self.counters[key] = self.counters.get(key, 0) + 1
+
+    def gauge(self, name: str, description: str, value: Callable[[], float]) -> None:
+        # read when scraped, for numbers other components already keep
+        self.gauges[name] = (description, value)
+
+    @contextmanager
+    def trace_dialog(self, key: str) -> Iterator[None]:
+        if not (self.enabled and self.trace_dialogs):
+            yield
+            return
+        trace: List[Tuple[str, float]] = []
+        token = _trace.set(trace)
+        try:
+            yield
+        finally:
+            _trace.reset(token)
+            _logger.info(
+                f"Dialog {key} trace: " + ", ".join(f"{name} {elapsed * 1000:.1f}ms" for name, elapsed in trace)
+            )
+
+    def render(self) -> str:
+        # prometheus text exposition format
+        lines = [
+            "# HELP botislav_span_seconds Time spent in instrumented parts of the dialog pipeline",
+            "# TYPE botislav_span_seconds histogram",
+        ]
+        for name, histogram in sorted(self.spans.items()):
+            cumulative = 0
+            for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+                cumulative += count
+                lines.append(f'botislav_span_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'botislav_span_seconds_sum{{span="{name}"}} {histogram.total}')
+            lines.append(f'botislav_span_seconds_count{{span="{name}"}} {histogram.count}')
+
+        for counter in sorted({name for name, _ in self.counters}):
+            lines.append(f"# TYPE {counter} counter")
+            for (name, labels), value in sorted(self.counters.items()):
+                if name == counter:
+                    labels = ",".join(f'{label}="{label_value}"' for label, label_value in labels)
+                    lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+
+        for name, (description, value) in sorted(self.gauges.items()):
+            lines.extend((f"# HELP {name} {description}", f"# TYPE {name} gauge", f"{name} {value()}"))
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+def span(name: str) -> ContextManager[None]:
+    return METRICS.span(name)
+
+
+def count(name: str, **labels: str) -> None:
+    METRICS.count(name, **labels)
+
+
+def trace_dialog(key: str) -> ContextManager[None]:
+    return METRICS.trace_dialog(key)
+
+
+async def serve_metrics(host: str, port: int, metrics: Metrics = METRICS) -> "web.AppRunner":
+    from aiohttp import web
+
+    async def handle(_request: "web.Request") -> "web.Response":
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    _logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return runner
@@ -1,7 +1,10 @@
 import csv
 import random
+import functools
+from bisect import bisect_right
 from pathlib import Path
-from typing import Dict, List
+from string import Formatter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 from attr import dataclass
 
@@ -17,49 +20,135 @@ Win = bool
 KDA = float
 
 
+@dataclass(slots=True, frozen=True)
+class Template:
+    # literal text followed by the field to substitute, parsed once instead of on every format
+    parts: Tuple[Tuple[str, Optional[str], str], ...]
+
+    @classmethod
+    def compile(cls, text: str) -> "Template":
+        return cls(parts=tuple(
+            (literal, field, spec or "") for literal, field, spec, _ in Formatter().parse(text)
+        ))
+
+    def render(self, **values: str) -> str:
+        return "".join(
+            literal if field is None else literal + format(values[field], spec)
+            for literal, field, spec in self.parts
+        )
+
+
 @dataclass(slots=True, frozen=True)
 class Phrase:
-    kda_range: str
+    lower: float
+    higher: float
     text: str
     win: bool
 
+    @classmethod
+    def parse(cls, kda_range: str, text: str, win: bool) -> "Phrase":
+        lower, _, higher = kda_range.partition(",")
+        return cls(lower=float(lower), higher=float(higher), text=text, win=win)
+
     def check(self, win: bool, kda: float) -> bool:
-        lower, _, higher = self.kda_range.partition(",")
-        return float(lower) <= kda < float(higher) and self.win == win
+        return self.lower <= kda < self.higher and self.win == win
+
+
+@dataclass(slots=True, frozen=True)
+class PhraseIndex:
+    # kda ranges may overlap, so they are cut into elementary intervals between consecutive bounds
+    # and kept in a segment tree over them: a template is stored in at most 2 * log2(intervals)
+    # nodes instead of in every interval it covers, a lookup walks from a leaf up to the root
+    bounds: List[float]
+    # nodes[1] is the root, children of node i are 2i and 2i + 1, leaves start at len(nodes) // 2
+    nodes: List[Tuple[Template, ...]]
+
+    @classmethod
+    def build(cls, phrases: Iterable[Phrase]) -> "PhraseIndex":
+        phrases = list(phrases)
+        bounds = sorted({phrase.lower for phrase in phrases} | {phrase.higher for phrase in phrases})
+        leaves = 1 << max(len(bounds) - 1, 0).bit_length()
+        nodes: List[List[Template]] = [[] for _ in range(2 * leaves)]
+        for phrase in phrases:
+            template = Template.compile(phrase.text)
+            first = bisect_right(bounds, phrase.lower) - 1 + leaves
+            last = bisect_right(bounds, phrase.higher) - 1 + leaves
+            while first < last:
+                if first & 1:
+                    nodes[first].append(template)
+                    first += 1
+                if last & 1:
+                    last -= 1
+                    nodes[last].append(template)
+                first >>= 1
+                last >>= 1
+        return cls(bounds=bounds, nodes=[tuple(templates) for templates in nodes])
+
+    def covering(self, kda: float) -> List[Tuple[Template, ...]]:
+        # templates matching kda, in chunks as they are stored, without copying them
+        interval = bisect_right(self.bounds, kda) - 1
+        if interval < 0 or interval >= len(self.nodes) // 2:
+            return []
+        node, chunks = interval + len(self.nodes) // 2, []
+        while node:
+            if self.nodes[node]:
+                chunks.append(self.nodes[node])
+            node >>= 1
+        return chunks
+
+    def find(self, kda: float) -> Tuple[Template, ...]:
+        return tuple(template for chunk in self.covering(kda) for template in chunk)
 
 
 @dataclass(slots=True, frozen=True)
 class PhraseGenerator:
-    _phrases_by_hero: Dict[HeroName, Dict[Win, str]]
-    _phrases_generic: List[Phrase]
+    _phrases_by_hero: Dict[HeroName, Dict[Win, Template]]
+    _phrases_generic: Dict[Win, PhraseIndex]
 
     def get_phrase(self, win: bool, username: str, hero: str, score: str, kda: float) -> str:
-        choices = []
-        if hero in self._phrases_by_hero:
-            choices.append(self._phrases_by_hero[hero][win])
-        choices.extend(phrase.text for phrase in self._phrases_generic if phrase.check(win, kda))
-        phrase_template = random.choice(choices)
-        return phrase_template.format(username=username, hero=hero, score=score)
+        generic = self._phrases_generic[win].covering(kda)
+        by_hero = self._phrases_by_hero.get(hero)
+        choice = random.randrange(sum(len(chunk) for chunk in generic) + (by_hero is not None))
+        for chunk in generic:
+            if choice < len(chunk):
+                return chunk[choice].render(username=username, hero=hero, score=score)
+            choice -= len(chunk)
+        return by_hero[win].render(username=username, hero=hero, score=score)
 
 
 def get_phrase_generator() -> PhraseGenerator:
 
-    phrases_by_hero: Dict[HeroName, Dict[Win, str]] = {}
+    phrases_by_hero: Dict[HeroName, Dict[Win, Template]] = {}
     with _PHRASES_BY_HERO_CSV_PATH.open(encoding="utf-8") as file:
         reader = csv.reader(file, delimiter=",")
         for row in list(reader)[1:]:
             if row[0] not in phrases_by_hero:
                 phrases_by_hero[row[0]] = {}
-            phrases_by_hero[row[0]][True] = row[1]
-            phrases_by_hero[row[0]][False] = row[2]
+            phrases_by_hero[row[0]][True] = Template.compile(row[1])
+            phrases_by_hero[row[0]][False] = Template.compile(row[2])
 
     phrases_generic: List[Phrase] = []
     with _PHRASES_GENERIC_CSV_PATH.open(encoding="utf-8") as file:
         reader = csv.reader(file, delimiter=",")
         for row in list(reader)[1:]:
-            phrases_generic.append(Phrase(win=True, text=row[0], kda_range=row[2]))
-            phrases_generic.append(Phrase(win=False, text=row[1], kda_range=row[2]))
+            phrases_generic.append(Phrase.parse(win=True, text=row[0], kda_range=row[2]))
+            phrases_generic.append(Phrase.parse(win=False, text=row[1], kda_range=row[2]))
+
+    return PhraseGenerator(
+        phrases_by_hero=phrases_by_hero,
+        phrases_generic={
+            win: PhraseIndex.build(phrase for phrase in phrases_generic if phrase.win == win)
+            for win in (True, False)
+        },
+    )
+
+
+_load_phrase_generator = functools.lru_cache(maxsize=None)(get_phrase_generator)
 
-    return PhraseGenerator(phrases_by_hero=phrases_by_hero, phrases_generic=phrases_generic)
 
-PHRASE_GENERATOR = get_phrase_generator()
+def __getattr__(name: str) -> Any:
+    # PHRASE_GENERATOR reads the phrase packs on first use instead of on import
+    if name == "PHRASE_GENERATOR":
+        generator = globals()["PHRASE_GENERATOR"] = _load_phrase_generator()
+        return generator
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,152 @@
+import asyncio
+import random
+from logging import getLogger
+from time import monotonic, time
+from typing import Callable, Dict, Iterable, Optional
+
+from attr import dataclass, attrib
+
+from botislav import handlers
+from botislav.integrations.opendota import get_player_recent_matches, PlayerRecentMatch
+from botislav.integrations.ratelimit import TokenBucket, background_priority
+
+__all__ = [
+    "MatchPrefetcher",
+]
+
+_logger = getLogger(__name__)
+
+
+@dataclass(slots=True)
+class _Account:
+    account_id: int
+    interval: float
+    next_poll: float
+    last_match_id: Optional[int] = None
+
+
+@dataclass(slots=True)
+class MatchPrefetcher:
+    # polls linked accounts in the background and warms the caches used by dota_lastmatch,
+    # accounts that just played are polled often, idle ones back off up to max_interval
+    accounts: Callable[[], Iterable[int]]
+    min_interval: float = 2 * 60.0
+    max_interval: float = 30 * 60.0
+    requests_per_hour: float = 600.0
+    # a match that ended this long ago is still worth warming the first time an account is seen
+    fresh_match_age: float = 60 * 60.0
+    refresh_accounts_every: float = 5 * 60.0
+    describe: bool = True
+
+    polls: int = attrib(default=0, init=False)
+    new_matches: int = attrib(default=0, init=False)
+    failures: int = attrib(default=0, init=False)
+    over_budget: int = attrib(default=0, init=False)
+    _budget: TokenBucket = attrib(default=None, init=False)
+    _schedule: Dict[int, _Account] = attrib(factory=dict, init=False)
+    _accounts_refreshed_at: Optional[float] = attrib(default=None, init=False)
+    _task: Optional["asyncio.Task[None]"] = attrib(default=None, init=False)
+
+    def __attrs_post_init__(self) -> None:
+        # a minute worth of burst keeps the spending smooth over the hour
+        self._budget = TokenBucket(capacity=max(1.0, self.requests_per_hour / 60), period=60.0)
+
+    @property
+    def tracked_accounts(self) -> int:
+        return len(self._schedule)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="match-prefetcher")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_accounts(self, now: float) -> None:
+        # listing the accounts may scan the whole user store
+        account_ids = set(await asyncio.to_thread(self.accounts))
+        for account_id in self._schedule.keys() - account_ids:
+            del self._schedule[account_id]
+        for account_id in account_ids - self._schedule.keys():
+            # spread the first polls so a restart does not hit the api all at once
+            self._schedule[account_id] = _Account(
+                account_id=account_id,
+                interval=self.min_interval,
+                next_poll=now + random.uniform(0, self.min_interval),
+            )
+        self._accounts_refreshed_at = now
+
+    async def _spend(self) -> None:
+        self._budget.refill(monotonic())
+        if (delay := self._budget.delay()) > 0:
+            self.over_budget += 1
+            await asyncio.sleep(delay)
+            self._budget.refill(monotonic())
+        self._budget.tokens -= 1
+
+    async def _run(self) -> None:
+        with background_priority():
+            while True:
+                try:
+                    await self._step()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as error:
+                    # nobody awaits the task, so it must not die quietly
+                    _logger.error(f"Prefetching failed with {error}", exc_info=True)
+                    await asyncio.sleep(self.min_interval)
+
+    async def _step(self) -> None:
+        now = monotonic()
+        if self._accounts_refreshed_at is None or now - self._accounts_refreshed_at >= self.refresh_accounts_every:
+            await self._refresh_accounts(now)
+
+        account = min(self._schedule.values(), key=lambda account: account.next_poll, default=None)
+        until_refresh = self._accounts_refreshed_at + self.refresh_accounts_every - now
+        if account is None or account.next_poll > now:
+            wait = until_refresh if account is None else account.next_poll - now
+            await asyncio.sleep(max(0.0, min(wait, until_refresh)))
+            return
+
+        await self._poll(account)
+
+    def _is_new(self, account: _Account, recent_match: PlayerRecentMatch) -> bool:
+        if account.last_match_id is None:
+            ended_at = (recent_match.start_time or 0) + (recent_match.duration or 0)
+            return time() - ended_at <= self.fresh_match_age
+        return recent_match.match_id != account.last_match_id
+
+    async def _poll(self, account: _Account) -> None:
+        await self._spend()
+        self.polls += 1
+        try:
+            recent_matches = await get_player_recent_matches(account_id=account.account_id, limit=1)
+            recent_match = next(iter(recent_matches), None)
+            if recent_match is not None and self._is_new(account, recent_match):
+                self.new_matches += 1
+                await self._spend()
+                await self._warm(account.account_id)
+                # people rarely play a single game, the next one is worth catching early too
+                account.interval = self.min_interval
+            else:
+                account.interval = min(account.interval * 2, self.max_interval)
+            if recent_match is not None:
+                account.last_match_id = recent_match.match_id
+        except Exception as error:
+            self.failures += 1
+            account.interval = min(account.interval * 2, self.max_interval)
+            _logger.warning(f"Prefetching matches of {account.account_id} failed with {error}")
+        account.next_poll = monotonic() + account.interval
+
+    async def _warm(self, account_id: int) -> None:
+        # the same calls dota_lastmatch makes, so it is answered from the caches afterwards
+        match = await handlers.get_recent_match_info(opendota_account_id=account_id)
+        if match is not None and self.describe:
+            await handlers.describe_match(match, executor=handlers.background_llm)
+        _logger.info(f"Prefetched the last match of {account_id}")
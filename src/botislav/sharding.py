@@ -0,0 +1,53 @@
+import os
+from typing import Mapping, Optional, Tuple
+
+from attr import dataclass
+
+__all__ = [
+    "shard_for_guild",
+    "ShardConfig",
+]
+
+
+def shard_for_guild(guild_id: Optional[int], shard_count: int) -> int:
+    # the formula discord itself routes guild events by, direct messages always go to shard 0
+    if guild_id is None:
+        return 0
+    return (guild_id >> 22) % shard_count
+
+
+@dataclass(slots=True, frozen=True)
+class ShardConfig:
+    # several processes share ./cache: the user store and the upstream cache are sqlite files.
+    # Discord routes a guild to one shard, so running dialogs stay in one process, but a user
+    # may talk in guilds of different shards, so their records are read from the store every time
+    count: int = 1
+    # shards run by this process, None runs all of them
+    ids: Optional[Tuple[int, ...]] = None
+
+    def __attrs_post_init__(self) -> None:
+        if self.count < 1:
+            raise ValueError(f"Shard count must be positive, got {self.count}")
+        if self.ids is not None and not all(0 <= shard_id < self.count for shard_id in self.ids):
+            raise ValueError(f"Shard ids {self.ids} are out of range for {self.count} shards")
+
+    @classmethod
+    def from_env(cls, environ: Mapping[str, str] = os.environ) -> "ShardConfig":
+        # SHARD_COUNT=4 SHARD_IDS=0,1 for the first of two processes
+        count = int(environ.get("SHARD_COUNT", "1"))
+        ids = environ.get("SHARD_IDS")
+        return cls(count=count, ids=tuple(int(shard_id) for shard_id in ids.split(",")) if ids else None)
+
+    @property
+    def sharded(self) -> bool:
+        return self.ids is not None and len(self.ids) < self.count
+
+    @property
+    def processes(self) -> int:
+        # assuming every process runs as many shards as this one
+        if not self.sharded:
+            return 1
+        return -(-self.count // len(self.ids))
+
+    def owns(self, guild_id: Optional[int]) -> bool:
+        return self.ids is None or shard_for_guild(guild_id, self.count) in self.ids
@@ -0,0 +1,276 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Protocol, Tuple, Union
+
+import pickledb
+
+__all__ = [
+    "UserStore",
+    "MemoryUserStore",
+    "SqliteUserStore",
+    "migrate_pickledb",
+    "DescriptionCache",
+]
+
+_logger = getLogger(__name__)
+
+Record = Dict[str, Any]
+
+
+class UserStore(Protocol):
+    def get(self, key: str) -> Optional[Record]:
+        ...
+
+    def set(self, key: str, value: Record) -> None:
+        ...
+
+    def opendota_ids(self) -> List[int]:
+        ...
+
+    async def flush(self) -> None:
+        ...
+
+    async def close(self) -> None:
+        ...
+
+
+class MemoryUserStore:
+    def __init__(self, records: Optional[Dict[str, Record]] = None) -> None:
+        self._records: Dict[str, Record] = dict(records or {})
+
+    def get(self, key: str) -> Optional[Record]:
+        return self._records.get(key)
+
+    def set(self, key: str, value: Record) -> None:
+        self._records[key] = value
+
+    def opendota_ids(self) -> List[int]:
+        return sorted({opendota_id for value in self._records.values() if (opendota_id := value.get("opendota_id"))})
+
+    async def flush(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class SqliteUserStore:
+    # writes are buffered in memory and flushed in batches by a single writer thread,
+    # reads go straight to the WAL database which never blocks on the writer
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        flush_interval: float = 1.0,
+        max_pending: int = 256,
+    ) -> None:
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._reader = sqlite3.connect(self.path)
+        self._reader.execute("PRAGMA journal_mode=WAL")
+        self._reader.execute("CREATE TABLE IF NOT EXISTS users (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._reader.commit()
+
+        self._writer: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="user-store")
+        self._pending: Dict[str, Record] = {}
+        self._flushing: Dict[str, Record] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional["asyncio.Task[None]"] = None
+        # flush started early because the batch filled up, kept so it is not collected mid-flight
+        self._batch_flush: Optional["asyncio.Task[None]"] = None
+        self._closed = False
+
+    def __len__(self) -> int:
+        (count,) = self._reader.execute("SELECT COUNT(*) FROM users").fetchone()
+        return count
+
+    def get(self, key: str) -> Optional[Record]:
+        if key in self._pending:
+            return self._pending[key]
+        if key in self._flushing:
+            return self._flushing[key]
+        row = self._reader.execute("SELECT value FROM users WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Record) -> None:
+        self._pending[key] = value
+        if len(self._pending) >= self.max_pending and not self._flush_lock.locked():
+            if self._batch_flush is None or self._batch_flush.done():
+                self._batch_flush = asyncio.get_running_loop().create_task(self.flush())
+                self._batch_flush.add_done_callback(self._on_batch_flushed)
+
+    @staticmethod
+    def _on_batch_flushed(task: "asyncio.Task[None]") -> None:
+        if not task.cancelled() and (error := task.exception()) is not None:
+            _logger.error(f"Flushing user store failed with {error}", exc_info=error)
+
+    def opendota_ids(self) -> List[int]:
+        # a full scan that callers run on a worker thread, so it does not share the reader
+        with closing(sqlite3.connect(self.path)) as connection:
+            rows = connection.execute(
+                "SELECT key, json_extract(value, '$.opendota_id') FROM users "
+                "WHERE json_extract(value, '$.opendota_id') IS NOT NULL"
+            ).fetchall()
+        linked = dict(rows)
+        for key, value in {**self._flushing, **self._pending}.items():
+            linked[key] = value.get("opendota_id")
+        return sorted({opendota_id for opendota_id in linked.values() if opendota_id})
+
+    def import_records(self, records: Iterable[Tuple[str, Record]]) -> None:
+        # synchronous bulk load, only meant for startup before the event loop is busy
+        self._reader.executemany(
+            "INSERT OR REPLACE INTO users (key, value) VALUES (?, ?)",
+            ((key, json.dumps(value)) for key, value in records),
+        )
+        self._reader.commit()
+
+    async def start(self) -> None:
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as error:
+                _logger.error(f"Flushing user store failed with {error}", exc_info=True)
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            self._flushing, self._pending = self._pending, {}
+            batch = [(key, json.dumps(value)) for key, value in self._flushing.items()]
+            try:
+                await asyncio.get_running_loop().run_in_executor(self._executor, self._write, batch)
+            except BaseException:
+                # keep the batch for the next attempt unless newer values arrived meanwhile
+                self._pending = {**self._flushing, **self._pending}
+                raise
+            finally:
+                self._flushing = {}
+
+    def _write(self, batch: Iterable[Tuple[str, str]]) -> None:
+        if self._writer is None:
+            self._writer = sqlite3.connect(self.path)
+        with self._writer:
+            self._writer.executemany("INSERT OR REPLACE INTO users (key, value) VALUES (?, ?)", batch)
+
+    def _close_writer(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def close(self) -> None:
+        if self._closed:
+            return
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        if self._batch_flush is not None:
+            await asyncio.gather(self._batch_flush, return_exceptions=True)
+            self._batch_flush = None
+        await self.flush()
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close_writer)
+        self._executor.shutdown(wait=True)
+        self._reader.close()
+        self._closed = True
+
+
+def migrate_pickledb(location: Union[str, Path], store: SqliteUserStore) -> int:
+    # one-shot: the old database is renamed once its records are imported
+    location = Path(location)
+    if not location.exists():
+        return 0
+    records = pickledb.load(location=str(location), auto_dump=False).db
+    store.import_records(records.items())
+    os.replace(location, location.with_name(location.name + ".migrated"))
+    _logger.info(f"Migrated {len(records)} users from {location}")
+    return len(records)
+
+
+class DescriptionCache:
+    # generated texts keyed by whatever identifies their inputs, bounded to max_entries
+    # by evicting the least recently used rows every purge_every puts, so it may briefly hold
+    # a few more; all sqlite work runs on one worker thread
+
+    def __init__(self, path: Union[str, Path], max_entries: int = 20_000, purge_every: int = 100) -> None:
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.purge_every = purge_every
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._connection: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="description-cache")
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.path)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS descriptions "
+                "(key TEXT PRIMARY KEY, text TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS descriptions_last_used ON descriptions (last_used)")
+        return self._connection
+
+    def _get(self, key: str) -> Optional[str]:
+        connection = self._connect()
+        with connection:
+            row = connection.execute("SELECT text FROM descriptions WHERE key = ?", (key,)).fetchone()
+            if row:
+                connection.execute("UPDATE descriptions SET last_used = ? WHERE key = ?", (time.time(), key))
+        return row[0] if row else None
+
+    def _put(self, key: str, text: str) -> None:
+        connection = self._connect()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO descriptions (key, text, last_used) VALUES (?, ?, ?)",
+                (key, text, time.time()),
+            )
+            self._puts += 1
+            if self._puts % self.purge_every == 0:
+                self._purge(connection)
+
+    def _purge(self, connection: sqlite3.Connection) -> None:
+        (count,) = connection.execute("SELECT COUNT(*) FROM descriptions").fetchone()
+        if count > self.max_entries:
+            connection.execute(
+                "DELETE FROM descriptions WHERE key IN "
+                "(SELECT key FROM descriptions ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def _close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    async def get(self, key: str) -> Optional[str]:
+        text = await asyncio.get_running_loop().run_in_executor(self._executor, self._get, key)
+        if text is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return text
+
+    async def put(self, key: str, text: str) -> None:
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._put, key, text)
+
+    async def close(self) -> None:
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close)
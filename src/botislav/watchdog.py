@@ -0,0 +1,126 @@
+import asyncio
+import sys
+import threading
+import traceback
+from collections import deque
+from logging import getLogger
+from time import monotonic
+from typing import Deque, Optional, Tuple
+
+from attr import dataclass, attrib
+
+from botislav.metrics import count
+
+__all__ = [
+    "Stall",
+    "LoopWatchdog",
+]
+
+_logger = getLogger(__name__)
+
+
+@dataclass(slots=True, frozen=True)
+class Stall:
+    lag: float
+    # name of the task that held the loop, dialogs are named after their key and intent
+    task: Optional[str]
+    stack: str
+
+
+@dataclass(slots=True)
+class LoopWatchdog:
+    # a heartbeat scheduled on the loop and a thread watching it; when a beat is late by more
+    # than threshold, the thread grabs the stack the loop thread is stuck in, the beat reports
+    # the stall once the loop is free again. Can be started and stopped at any time
+    threshold: float = 0.1
+    interval: float = 0.05
+    keep: int = 32
+
+    stalls: int = attrib(default=0, init=False)
+    last_lag: float = attrib(default=0.0, init=False)
+    worst_lag: float = attrib(default=0.0, init=False)
+    recent: Deque[Stall] = attrib(init=False)
+    _loop: Optional[asyncio.AbstractEventLoop] = attrib(default=None, init=False)
+    _loop_thread_id: int = attrib(default=0, init=False)
+    _expected: float = attrib(default=0.0, init=False)
+    _beat: Optional[asyncio.TimerHandle] = attrib(default=None, init=False)
+    _thread: Optional[threading.Thread] = attrib(default=None, init=False)
+    _stopped: threading.Event = attrib(factory=threading.Event, init=False)
+    # the beat a stack was captured for, with the task name and the stack
+    _captured: Optional[Tuple[float, Optional[str], str]] = attrib(default=None, init=False)
+
+    def __attrs_post_init__(self) -> None:
+        self.recent = deque(maxlen=self.keep)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        # must be called from the loop thread
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._schedule(monotonic())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        _logger.info(f"Watching the event loop for stalls over {self.threshold * 1000:.0f}ms")
+
+    def stop(self) -> None:
+        if not self.running:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        if self._beat is not None:
+            self._beat.cancel()
+            self._beat = None
+        self._captured = None
+        _logger.info("Stopped watching the event loop")
+
+    def toggle(self) -> None:
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def _schedule(self, now: float) -> None:
+        self._expected = now + self.interval
+        self._beat = self._loop.call_at(self._loop.time() + self.interval, self._on_beat)
+
+    def _on_beat(self) -> None:
+        now = monotonic()
+        expected, self.last_lag = self._expected, max(0.0, now - self._expected)
+        self._schedule(now)
+        if self.last_lag <= self.threshold:
+            return
+
+        self.stalls += 1
+        self.worst_lag = max(self.worst_lag, self.last_lag)
+        count("botislav_loop_stalls_total")
+        captured, self._captured = self._captured, None
+        if captured is None or captured[0] != expected:
+            # too short for the thread to notice, it only checks every interval
+            stall = Stall(lag=self.last_lag, task=None, stack="")
+            _logger.warning(f"Event loop stalled for {self.last_lag * 1000:.0f}ms")
+        else:
+            stall = Stall(lag=self.last_lag, task=captured[1], stack=captured[2])
+            _logger.warning(
+                f"Event loop stalled for {self.last_lag * 1000:.0f}ms in {stall.task or 'a callback'}:\n{stall.stack}"
+            )
+        self.recent.append(stall)
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.interval):
+            expected = self._expected
+            if monotonic() - expected <= self.threshold or (self._captured and self._captured[0] == expected):
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            # current_task only reads the loop's entry in a dict, which is safe enough from here
+            task = asyncio.current_task(self._loop)
+            stack = "".join(traceback.format_stack(frame))
+            self._captured = (expected, task.get_name() if task is not None else None, stack)
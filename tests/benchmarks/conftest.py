@@ -0,0 +1,172 @@
+import json
+import os
+import time
+import random
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+import pytest
+
+
+CHATTER = (
+    "кто пойдет играть",
+    "го катку",
+    "я через 5 минут",
+    "ахахах",
+    "лол",
+    "gish is clueless",
+    "ну ты и рак",
+    "кто с нами в доту?",
+    "я сегодня не могу",
+    "опять этот пудж",
+    "норм игра была",
+    "ggwp",
+    "на сколько ммр играешь?",
+    "скинь ссылку",
+    "кто-нибудь смотрел турнир?",
+    "патч когда?",
+    "я спать",
+    "давайте в пятницу",
+    "все, я ливаю",
+    "+",
+    "да",
+    "нет",
+    "ок",
+    "ну такое",
+    "он опять фидит",
+    "какой же имба этот герой",
+    "мне кажется мы проиграем",
+    "привези курьера плиз",
+    "хаха лучший",
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "<:clueless:123456789>",
+    "история была смешная",
+    "играем?",
+    "хайп",
+    "last one to join buys pizza",
+    "lol what",
+    "this hero is broken",
+    "доброе утро",
+    "когда стрим?",
+    "ща буду",
+)
+
+COMMANDS = (
+    "лм",
+    "lm",
+    "!lm",
+    "last match",
+    "ласт катка в доту",
+    "привет",
+    "здарова",
+    "hello",
+    "привяжи https://www.opendota.com/players/55136643",
+)
+
+
+def make_chat_corpus(size: int, command_fraction: float = 0.05, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    return [
+        rng.choice(COMMANDS) if rng.random() < command_fraction else rng.choice(CHATTER)
+        for _ in range(size)
+    ]
+
+
+class Timer:
+    elapsed: float = 0.0
+
+
+@contextmanager
+def timed() -> Iterator[Timer]:
+    timer = Timer()
+    started = time.perf_counter()
+    try:
+        yield timer
+    finally:
+        timer.elapsed = time.perf_counter() - started
+
+
+def report(title: str, results: Dict[str, float]) -> None:
+    print(f"\n-- {title} --")
+    for name, value in results.items():
+        print(f"  {name:<40} {value:>12.6f}")
+
+
+@pytest.fixture(scope="session")
+def chat_corpus() -> List[str]:
+    return make_chat_corpus(20_000)
+
+
+@pytest.fixture
+def bench_report():
+    return report
+
+
+@pytest.fixture
+def bench_timed():
+    return timed
+
+
+@pytest.fixture
+def bench_strict() -> bool:
+    # wall clock comparisons depend on the machine and its load, so they are only asserted
+    # with BENCH_STRICT=1, otherwise the numbers are just reported
+    return os.getenv("BENCH_STRICT") == "1"
+
+
+def make_parsed_match(match_id: int = 7_000_000_000, seed: int = 0) -> Dict[str, Any]:
+    # shaped like a parsed /api/matches/{id} payload: most of the weight is per player timelines,
+    # damage breakdowns and item usage, plus match wide advantage graphs and chat
+    rng = random.Random(seed)
+    minutes = 45
+    heroes = [f"npc_dota_hero_{name}" for name in ("pudge", "lion", "ursa", "enigma", "rubick", "magnus", "silencer")]
+    items = [f"item_{index}" for index in range(120)]
+
+    def timeline(step: int) -> List[int]:
+        value, values = 0, []
+        for _ in range(minutes + 1):
+            value += rng.randrange(step)
+            values.append(value)
+        return values
+
+    def player(slot: int) -> Dict[str, Any]:
+        return {
+            "match_id": match_id, "player_slot": slot, "account_id": 10_000 + slot, "hero_id": rng.randrange(1, 130),
+            "isRadiant": slot < 128, "win": int(slot < 128), "lose": int(slot >= 128),
+            "kills": rng.randrange(20), "deaths": rng.randrange(15), "assists": rng.randrange(30),
+            "personaname": f"player {slot}", "party_id": slot // 128, "party_size": 5,
+            "gold_per_min": rng.randrange(300, 800), "xp_per_min": rng.randrange(300, 900),
+            "dn_t": timeline(3), "lh_t": timeline(10), "gold_t": timeline(700), "xp_t": timeline(800),
+            "times": list(range(0, (minutes + 1) * 60, 60)),
+            "damage": {hero: rng.randrange(10_000) for hero in heroes},
+            "damage_taken": {hero: rng.randrange(10_000) for hero in heroes},
+            "damage_inflictor": {item: rng.randrange(5_000) for item in rng.sample(items, 30)},
+            "item_usage": {item: 1 for item in rng.sample(items, 40)},
+            "item_win": {item: rng.randrange(2) for item in rng.sample(items, 40)},
+            "purchase_log": [{"time": rng.randrange(2700), "key": rng.choice(items)} for _ in range(150)],
+            "kills_log": [{"time": rng.randrange(2700), "key": rng.choice(heroes)} for _ in range(15)],
+            "obs_log": [{"time": rng.randrange(2700), "x": rng.random() * 256, "y": rng.random() * 256} for _ in range(15)],
+            "ability_upgrades_arr": [rng.randrange(5000, 6000) for _ in range(25)],
+        }
+
+    return {
+        "match_id": match_id, "start_time": 1_700_000_000, "game_mode": 22, "duration": minutes * 60,
+        "lobby_type": 7, "radiant_win": True, "radiant_score": 40, "dire_score": 25,
+        "players": [player(slot) for slot in (0, 1, 2, 3, 4, 128, 129, 130, 131, 132)],
+        "radiant_gold_adv": [rng.randrange(-20_000, 20_000) for _ in range(minutes + 1)],
+        "radiant_xp_adv": [rng.randrange(-20_000, 20_000) for _ in range(minutes + 1)],
+        "chat": [
+            {"time": rng.randrange(2700), "type": "chat", "key": "gg", "slot": rng.randrange(10), "player_slot": 0}
+            for _ in range(500)
+        ],
+        "objectives": [{"time": rng.randrange(2700), "type": "building_kill", "key": "tower"} for _ in range(30)],
+        "teamfights": [
+            {"start": rng.randrange(2700), "deaths": rng.randrange(10), "players": [{"damage": 1000} for _ in range(10)]}
+            for _ in range(20)
+        ],
+    }
+
+
+@pytest.fixture(scope="session")
+def parsed_match_payloads() -> List[bytes]:
+    return [json.dumps(make_parsed_match(match_id=index, seed=index)).encode() for index in range(20)]
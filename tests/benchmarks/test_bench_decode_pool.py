@@ -0,0 +1,51 @@
+import asyncio
+import time
+from typing import List
+
+import pytest
+
+from botislav.integrations.decode import DecodePool
+from botislav.integrations.opendota import load_compact_match
+
+CONCURRENT_MATCHES = 64
+HEARTBEAT_INTERVAL = 0.005
+
+
+async def _heartbeat(lags: List[float]) -> None:
+    # stands in for the discord gateway, which has to answer heartbeats on time
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        lags.append(time.perf_counter() - started - HEARTBEAT_INTERVAL)
+
+
+async def _decode_concurrently(pool: DecodePool, payloads: List[bytes]) -> List[float]:
+    lags: List[float] = []
+    heartbeat = asyncio.create_task(_heartbeat(lags))
+    await asyncio.sleep(HEARTBEAT_INTERVAL * 2)
+    try:
+        matches = await asyncio.gather(*(
+            pool.decode(payloads[number % len(payloads)], load_compact_match) for number in range(CONCURRENT_MATCHES)
+        ))
+        await asyncio.sleep(HEARTBEAT_INTERVAL * 2)
+    finally:
+        heartbeat.cancel()
+        pool.close()
+    assert len(matches) == CONCURRENT_MATCHES
+    return lags
+
+
+@pytest.mark.asyncio
+async def test_decoding_off_the_loop_keeps_heartbeats_on_time(parsed_match_payloads, bench_report, bench_strict):
+    inline_lags = await _decode_concurrently(DecodePool(inline_below=2 ** 62), parsed_match_payloads)
+    pooled_lags = await _decode_concurrently(DecodePool(), parsed_match_payloads)
+
+    bench_report(
+        f"heartbeat lag while decoding {CONCURRENT_MATCHES} matches of {len(parsed_match_payloads[0]) // 1024} KB",
+        {
+            "inline, max lag ms": max(inline_lags) * 1000,
+            "decode pool, max lag ms": max(pooled_lags) * 1000,
+        },
+    )
+    if bench_strict:
+        assert max(pooled_lags) * 2 < max(inline_lags)
@@ -0,0 +1,260 @@
+import asyncio
+import os
+import random
+import resource
+import statistics
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import ctor
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.prompts import PromptTemplate
+
+from botislav import handlers
+from botislav.context import ContextManager
+from botislav.dialog import DialogManager, DialogScheduler
+from botislav.integrations import dota2, opendota
+from botislav.integrations.dota2 import Dota2Hero
+from botislav.integrations.opendota import Hero
+from botislav.integrations.utils import HTTP_CLIENT, json_dumps
+from botislav.intents import get_intent_classifier
+from botislav.llm import LlmExecutor
+from botislav.storage import DescriptionCache, MemoryUserStore
+
+from conftest import CHATTER
+
+# all of it can be turned up for a manual run, the defaults keep the regression gate quick
+USERS = int(os.getenv("LOADTEST_USERS", "2000"))
+MESSAGES = int(os.getenv("LOADTEST_MESSAGES", "3000"))
+RATE = float(os.getenv("LOADTEST_RATE", "1000"))  # messages per second
+COMMAND_FRACTION = float(os.getenv("LOADTEST_COMMAND_FRACTION", "0.2"))
+UPSTREAM_LATENCY = float(os.getenv("LOADTEST_UPSTREAM_LATENCY", "0.02"))
+LLM_LATENCY = float(os.getenv("LOADTEST_LLM_LATENCY", "0.01"))
+LLM_CONCURRENCY = int(os.getenv("LOADTEST_LLM_CONCURRENCY", "2"))  # what the bot runs with
+
+# account and discord ids are the same, counting from 1 since a zero account id reads as not linked
+ACCOUNTS = range(1, USERS + 1)
+# every ten accounts share a last match, like friends playing together
+MATCHES = -(-USERS // 10)
+HERO_ID = 14
+COMMANDS = ("лм", "lm", "last match", "ласт катка в доту", "лм пати")
+
+
+def _heroes() -> Dict[str, dict]:
+    hero = Hero(
+        id=HERO_ID, name="npc_dota_hero_pudge", localized_name="Pudge", primary_attr="str", attack_type="Melee",
+        roles=[], img="", icon="", base_health=200, base_health_regen=None, base_mana=75, base_mana_regen=0,
+        base_armor=0, base_mr=25, base_attack_min=45, base_attack_max=51, base_str=25, base_agi=14, base_int=16,
+        str_gain=3.2, agi_gain=1.5, int_gain=1.5, attack_range=150, projectile_speed=0, attack_rate=1.7,
+        base_attack_time=100, attack_point=0.5, move_speed=280, day_vision=1800, night_vision=800,
+    )
+    return {str(HERO_ID): ctor.dump(hero)}
+
+
+def _dota2_hero() -> dict:
+    hero = Dota2Hero(
+        id=HERO_ID, name="npc_dota_hero_pudge", order_id=1, name_loc="Pudge", bio_loc="", hype_loc="Мясник",
+        npe_desc_loc="", str_base=25, str_gain=3.2, agi_base=14, agi_gain=1.5, int_base=16, int_gain=1.5,
+        primary_attr=0, complexity=1, attack_capability=1, damage_min=45, damage_max=51, attack_rate=1.7,
+        attack_range=150, projectile_speed=0, armor=1, magic_resistance=25, movement_speed=280, turn_rate=0.7,
+        sight_range_day=1800, sight_range_night=800, max_health=720, health_regen=2.5, max_mana=291,
+        mana_regen=0.9,
+    )
+    return {"result": {"data": {"heroes": [ctor.dump(hero)]}}}
+
+
+def _match_id(account_id: int) -> int:
+    return 7_000_000_000 + (account_id - 1) % MATCHES
+
+
+def _match(match_id: int) -> dict:
+    accounts = ACCOUNTS[match_id % MATCHES::MATCHES]
+    return {
+        "match_id": match_id, "start_time": 1_700_000_000, "game_mode": 22, "duration": 2400, "radiant_win": True,
+        "players": [
+            {
+                "account_id": account, "player_slot": slot, "hero_id": HERO_ID, "win": 1, "kills": 7,
+                "deaths": 3, "assists": 12, "personaname": f"player {account}", "party_id": 1,
+                "damage": {"npc_dota_hero_lion": 1000}, "dn_t": list(range(40)),
+            }
+            for slot, account in enumerate(accounts)
+        ],
+    }
+
+
+@pytest_asyncio.fixture
+async def upstream():
+    stats = {"requests": Counter()}
+
+    async def respond(request: web.Request, payload) -> web.Response:
+        stats["requests"][request.match_info.route.resource.canonical] += 1
+        await asyncio.sleep(UPSTREAM_LATENCY)
+        return web.Response(body=json_dumps(payload), content_type="application/json")
+
+    async def recent_matches(request: web.Request) -> web.Response:
+        account_id = int(request.match_info["account_id"])
+        return await respond(request, [{"match_id": _match_id(account_id), "hero_id": HERO_ID}])
+
+    async def match(request: web.Request) -> web.Response:
+        return await respond(request, _match(int(request.match_info["match_id"])))
+
+    async def hero_data(request: web.Request) -> web.Response:
+        return await respond(request, _dota2_hero())
+
+    async def heroes(request: web.Request) -> web.Response:
+        return await respond(request, _heroes())
+
+    app = web.Application()
+    app.router.add_get("/api/players/{account_id}/recentMatches", recent_matches)
+    app.router.add_get("/api/matches/{match_id}", match)
+    app.router.add_get("/datafeed/herodata", hero_data)
+    app.router.add_get("/build/heroes.json", heroes)
+    server = TestServer(app, host="127.0.0.1")
+    await server.start_server()
+    stats["url"] = str(server.make_url(""))
+    yield stats
+    await HTTP_CLIENT.close()
+    await server.close()
+
+
+@pytest.fixture
+def offline_bot(upstream, monkeypatch, tmp_path):
+    monkeypatch.setattr(opendota, "OPENDOTA_API_URL", f"{upstream['url']}/api")
+    monkeypatch.setattr(dota2, "DOTA2_DATAFEED_URL", f"{upstream['url']}/datafeed")
+    monkeypatch.setattr(opendota.get_heroes, "url", f"{upstream['url']}/build/heroes.json")
+    monkeypatch.setattr(opendota.get_heroes, "cache_dir", tmp_path)
+    for cached in (opendota.get_match, opendota.get_player_recent_matches, dota2.get_hero_info_from_dota2_com):
+        cached.cache.clear()
+
+    response = "**{nickname}** затащил"
+    # the fake model streams a character at a time
+    model = FakeListChatModel(responses=[response], sleep=LLM_LATENCY / len(response))
+    monkeypatch.setattr(handlers, "llm", LlmExecutor(
+        chain=PromptTemplate.from_template("{nickname}") | model, max_concurrency=LLM_CONCURRENCY,
+    ))
+    monkeypatch.setattr(handlers, "party_generator", PromptTemplate.from_template("{players}") | model)
+    monkeypatch.setattr(handlers, "description_cache", DescriptionCache(path=tmp_path / "descriptions.sqlite3"))
+
+    users = MemoryUserStore({str(user): {"steam_id": None, "opendota_id": user} for user in ACCOUNTS})
+    context_manager = ContextManager(cache=users)
+    context_manager.set_client(FakeClient())
+    return DialogManager(
+        context_manager=context_manager,
+        intent_classifier=get_intent_classifier(mode="lalr", cache=False),
+        handlers=handlers.get_handlers(),
+        scheduler=DialogScheduler(max_concurrency=64, max_per_guild=64, max_backlog=MESSAGES),
+    )
+
+
+class FakeClient:
+    emojis: List = []
+
+
+class FakeUser:
+    def __init__(self, user_id: int) -> None:
+        self.id = user_id
+
+
+class FakeGuild:
+    id = 1
+
+
+class FakeChannel:
+    def __init__(self, message: "FakeMessage") -> None:
+        self._message = message
+
+    async def send(self, content: Optional[str] = None, **_) -> None:
+        self._message.replied()
+
+
+class FakeMessage:
+    # the parts of discord.Message the dialogs touch
+    guild = FakeGuild()
+    mentions: List[FakeUser] = []
+
+    def __init__(self, user_id: int, content: str) -> None:
+        self.author = FakeUser(user_id)
+        self.content = content
+        self.channel = FakeChannel(self)
+        self.sent_at = 0.0
+        self.latency: Optional[float] = None
+
+    def replied(self) -> None:
+        if self.latency is None:
+            self.latency = time.perf_counter() - self.sent_at
+
+    async def reply(self, content: Optional[str] = None, **_) -> None:
+        self.replied()
+
+    async def add_reaction(self, _emoji: str) -> None:
+        pass
+
+
+async def _watch_loop_lag(lags: List[float], interval: float = 0.01) -> None:
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+def _percentile(values: List[float], percent: int) -> float:
+    return statistics.quantiles(values, n=100)[percent - 1] if len(values) > 1 else (values or [0.0])[0]
+
+
+@pytest.mark.asyncio
+async def test_end_to_end_load(offline_bot, upstream, bench_report):
+    rng = random.Random(0)
+    # one command per user: a second one sent while the first is still answered joins that dialog
+    # instead of getting its own reply, so the rest of the users only chat
+    command_senders = rng.sample(ACCOUNTS, min(USERS - 1, int(MESSAGES * COMMAND_FRACTION)))
+    chatters = sorted(set(ACCOUNTS) - set(command_senders))
+    messages = []
+    for _ in range(MESSAGES):
+        if rng.random() < COMMAND_FRACTION and command_senders:
+            messages.append(FakeMessage(user_id=command_senders.pop(), content=rng.choice(COMMANDS)))
+        else:
+            messages.append(FakeMessage(user_id=rng.choice(chatters), content=rng.choice(CHATTER)))
+    commands = [message for message in messages if message.content in COMMANDS]
+
+    lags: List[float] = []
+    watcher = asyncio.create_task(_watch_loop_lag(lags))
+    started = time.perf_counter()
+    for number, message in enumerate(messages):
+        if (delay := started + number / RATE - time.perf_counter()) > 0:
+            await asyncio.sleep(delay)
+        message.sent_at = time.perf_counter()
+        await offline_bot.handle(message)
+
+    scheduler = offline_bot.scheduler
+    while scheduler.in_flight or scheduler.queued:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    watcher.cancel()
+
+    latencies = [message.latency for message in commands if message.latency is not None]
+    bench_report(
+        f"end to end: {USERS} users, {MESSAGES} messages at {RATE:.0f}/s, {len(commands)} commands",
+        {
+            "messages/s": MESSAGES / elapsed,
+            "reply latency p50, ms": _percentile(latencies, 50) * 1000,
+            "reply latency p95, ms": _percentile(latencies, 95) * 1000,
+            "reply latency p99, ms": _percentile(latencies, 99) * 1000,
+            "llm timeouts": handlers.llm.timeouts,
+            "event loop lag p99, ms": _percentile(lags, 99) * 1000,
+            "event loop lag max, ms": max(lags) * 1000,
+            **{f"requests to {route}": requests for route, requests in sorted(upstream["requests"].items())},
+            "peak RSS, MB": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        },
+    )
+    assert len(latencies) == len(commands)
+    assert scheduler.failed == 0
+    assert handlers.llm.timeouts == 0
+    # the bot gives up on generating past the executor timeout, so no reply should take longer
+    assert max(latencies) < handlers.llm.timeout
+    # every match is fetched once no matter how many of its players ask
+    assert upstream["requests"]["/api/matches/{match_id}"] <= MATCHES
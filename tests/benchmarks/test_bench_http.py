@@ -0,0 +1,82 @@
+import json
+import asyncio
+
+import aiohttp
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from botislav.integrations.utils import HttpClient
+
+REQUESTS = 200
+
+
+async def _get_json_with_new_session(url: str):
+    # the pre-pooling implementation of get_json
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            data = await response.read()
+            return json.loads(data)
+
+
+@pytest_asyncio.fixture
+async def stub_server():
+    connections = set()
+
+    async def match(request: web.Request) -> web.Response:
+        connections.add(request.transport)
+        return web.json_response({"match_id": int(request.match_info["match_id"]), "players": []})
+
+    app = web.Application()
+    app.router.add_get("/api/matches/{match_id}", match)
+    server = TestServer(app, host="127.0.0.1")
+    await server.start_server()
+    server.connections = connections
+    yield server
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_pooled_client_reuses_connections(stub_server, bench_report, bench_timed):
+    with bench_timed() as per_call:
+        for match_id in range(REQUESTS):
+            await _get_json_with_new_session(str(stub_server.make_url(f"/api/matches/{match_id}")))
+    per_call_connections = len(stub_server.connections)
+    stub_server.connections.clear()
+
+    client = HttpClient()
+    await client.start()
+    try:
+        with bench_timed() as pooled:
+            for match_id in range(REQUESTS):
+                data = await client.get_json(str(stub_server.make_url(f"/api/matches/{match_id}")))
+                assert data["match_id"] == match_id
+    finally:
+        await client.close()
+    pooled_connections = len(stub_server.connections)
+
+    bench_report(
+        f"get_json x{REQUESTS}",
+        {
+            "per-call session, s": per_call.elapsed,
+            "pooled session, s": pooled.elapsed,
+            "per-call connections": per_call_connections,
+            "pooled connections": pooled_connections,
+        },
+    )
+    assert pooled_connections == 1
+    assert per_call_connections == REQUESTS
+
+
+@pytest.mark.asyncio
+async def test_pooled_client_respects_per_host_limit(stub_server):
+    client = HttpClient(limit_per_host=2)
+    try:
+        await asyncio.gather(*(
+            client.get_json(str(stub_server.make_url(f"/api/matches/{match_id}")))
+            for match_id in range(20)
+        ))
+    finally:
+        await client.close()
+    assert len(stub_server.connections) <= 2
@@ -0,0 +1,85 @@
+import pytest
+from lark.exceptions import UnexpectedInput
+
+from botislav.intents import get_intent_classifier
+
+
+def test_prefilter_on_chat_corpus(chat_corpus, bench_report, bench_timed, bench_strict):
+    classifier = get_intent_classifier()
+
+    def parse_everything():
+        for phrase in chat_corpus:
+            try:
+                classifier.parser.parse(phrase)
+            except UnexpectedInput:
+                pass
+
+    with bench_timed() as without_prefilter:
+        parse_everything()
+
+    with bench_timed() as with_prefilter:
+        rejected = sum(not classifier.may_match(phrase) for phrase in chat_corpus)
+
+    with bench_timed() as classified:
+        for phrase in chat_corpus:
+            classifier.get_intent(phrase)
+
+    bench_report(
+        f"prefilter over {len(chat_corpus)} chat messages",
+        {
+            "rejected fraction": rejected / len(chat_corpus),
+            "parse everything, s": without_prefilter.elapsed,
+            "prefilter only, s": with_prefilter.elapsed,
+            "get_intent with prefilter, s": classified.elapsed,
+            "prefilter per message, us": with_prefilter.elapsed / len(chat_corpus) * 1e6,
+            "cpu saved, s": without_prefilter.elapsed - classified.elapsed,
+            "intent memo hit rate": classifier.memo_info().hit_rate,
+        },
+    )
+    assert rejected / len(chat_corpus) > 0.8
+    if bench_strict:
+        assert with_prefilter.elapsed < without_prefilter.elapsed
+
+
+PHRASES = (
+    "лм",
+    "ласт катка в доту",
+    "last match dota",
+    "привет",
+    "привяжи https://www.opendota.com/players/55136643",
+    "кто пойдет играть",
+)
+ROUNDS = 500
+
+
+@pytest.mark.parametrize("mode", ("earley", "lalr"))
+def test_classification_latency_per_phrase(mode, bench_report, bench_timed):
+    classifier = get_intent_classifier(mode=mode, cache=False)
+    results = {}
+    for phrase in PHRASES:
+        with bench_timed() as timer:
+            for _ in range(ROUNDS):
+                classifier.get_intent(phrase)
+        results[f"{phrase[:30]}, us"] = timer.elapsed / ROUNDS * 1e6
+    bench_report(f"get_intent latency ({mode})", results)
+
+
+def test_parser_construction_time(tmp_path, chat_corpus, bench_report, bench_timed):
+    cache_path = str(tmp_path / "intents.lark")
+    with bench_timed() as earley:
+        earley_classifier = get_intent_classifier(mode="earley")
+    with bench_timed() as lalr_cold:
+        get_intent_classifier(mode="lalr", cache=cache_path)
+    with bench_timed() as lalr_cached:
+        lalr_classifier = get_intent_classifier(mode="lalr", cache=cache_path)
+
+    bench_report(
+        "classifier construction",
+        {
+            "earley, s": earley.elapsed,
+            "lalr without table cache, s": lalr_cold.elapsed,
+            "lalr from table cache, s": lalr_cached.elapsed,
+        },
+    )
+    for phrase in set(chat_corpus):
+        assert lalr_classifier.get_intent(phrase) == earley_classifier.get_intent(phrase)
@@ -0,0 +1,73 @@
+import json
+import tracemalloc
+
+import ctor
+
+from botislav.integrations.opendota import CompactMatch, DotaMatch, load_compact_match, load_match
+from botislav.integrations.utils import json_loads
+from botislav.lru import deep_sizeof
+
+
+def _legacy_decode(payload: bytes) -> DotaMatch:
+    # what get_match did before: json.loads and ctor.load of every field
+    return ctor.load(DotaMatch, json.loads(payload))
+
+
+def _projected_decode(payload: bytes) -> CompactMatch:
+    # what get_match does now
+    return load_compact_match(json_loads(payload))
+
+
+def _measure(decode, payloads, bench_timed):
+    tracemalloc.start()
+    try:
+        with bench_timed() as timer:
+            matches = [decode(payload) for payload in payloads]
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return matches, timer.elapsed, peak
+
+
+def test_projected_match_decoding(parsed_match_payloads, bench_report, bench_timed):
+    payloads = parsed_match_payloads
+    rounds = len(payloads)
+
+    legacy, legacy_time, legacy_peak = _measure(_legacy_decode, payloads, bench_timed)
+    projected, projected_time, projected_peak = _measure(_projected_decode, payloads, bench_timed)
+
+    for full, small in zip(legacy, projected):
+        player = small.players[0]
+        assert full.find_player(player.account_id).kda == player.kda
+        assert (full.start_date, full.game_mode_localized, full.url) == (small.start_date, small.game_mode_localized, small.url)
+
+    bench_report(
+        f"decoding {rounds} parsed matches of {len(payloads[0]) // 1024} KB",
+        {
+            "json + full ctor.load, ms/match": legacy_time / rounds * 1000,
+            "fast json + compact projection, ms/match": projected_time / rounds * 1000,
+            "json + full ctor.load, peak KB": legacy_peak / 1024,
+            "fast json + compact projection, peak KB": projected_peak / 1024,
+            "full match retained, KB": deep_sizeof(legacy[0]) / 1024,
+            "projected match retained, KB": deep_sizeof(projected[0]) / 1024,
+        },
+    )
+    assert projected_time < legacy_time
+    assert projected_peak < legacy_peak
+    assert deep_sizeof(projected[0]) * 10 < deep_sizeof(legacy[0])
+
+
+def test_cached_match_footprint(parsed_match_payloads, bench_report):
+    payload = json_loads(parsed_match_payloads[0])
+    sizes = {
+        "full DotaMatch": deep_sizeof(load_match(payload, match_fields=None, player_fields=None)),
+        "full CompactMatch": deep_sizeof(load_compact_match(payload, match_fields=None, player_fields=None)),
+        "projected DotaMatch": deep_sizeof(load_match(payload)),
+        "projected CompactMatch": deep_sizeof(load_compact_match(payload)),
+    }
+    bench_report(
+        "cached matches per MB",
+        {name: 1024 * 1024 / size for name, size in sizes.items()},
+    )
+    assert sizes["projected CompactMatch"] * 3 < sizes["projected DotaMatch"]
+    assert sizes["full CompactMatch"] < sizes["full DotaMatch"]
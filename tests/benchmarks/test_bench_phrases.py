@@ -0,0 +1,44 @@
+import random
+from typing import List
+
+from botislav.phrases import Phrase, PhraseIndex
+
+PHRASES = 20_000
+LOOKUPS = 200
+
+
+def _random_phrases(count: int, seed: int = 0) -> List[Phrase]:
+    rng = random.Random(seed)
+    phrases = []
+    for number in range(count):
+        lower = round(rng.uniform(0, 8), 2)
+        higher = float("inf") if rng.random() < 0.05 else round(lower + rng.uniform(0.1, 2), 2)
+        phrases.append(Phrase(lower=lower, higher=higher, text=f"{number} **{{username}}**", win=True))
+    return phrases
+
+
+def test_phrase_index_lookup(bench_report, bench_timed, bench_strict):
+    phrases = _random_phrases(PHRASES)
+    with bench_timed() as built:
+        index = PhraseIndex.build(phrases)
+    kdas = [random.Random(2).uniform(0, 10) for _ in range(LOOKUPS)]
+
+    with bench_timed() as scanning:
+        for kda in kdas:
+            [phrase.text for phrase in phrases if phrase.check(True, kda)]
+
+    with bench_timed() as indexed:
+        for kda in kdas:
+            index.covering(kda)
+
+    bench_report(
+        f"phrase lookup over {PHRASES} phrases",
+        {
+            "build, s": built.elapsed,
+            "stored templates per phrase": sum(len(node) for node in index.nodes) / PHRASES,
+            "scanning per lookup, us": scanning.elapsed / LOOKUPS * 1e6,
+            "indexed per lookup, us": indexed.elapsed / LOOKUPS * 1e6,
+        },
+    )
+    if bench_strict:
+        assert indexed.elapsed * 20 < scanning.elapsed
@@ -0,0 +1,112 @@
+import asyncio
+import multiprocessing
+import os
+import random
+import time
+from typing import List, Optional, Tuple
+
+from conftest import make_parsed_match, make_chat_corpus
+
+from botislav.integrations.opendota import load_compact_match
+from botislav.integrations.shared_cache import SharedCache
+from botislav.integrations.utils import json_dumps, json_loads
+from botislav.intents import get_intent_classifier, normalize_phrase
+from botislav.sharding import ShardConfig
+from botislav.storage import SqliteUserStore
+
+SHARD_COUNT = 4
+GUILDS = 64
+USERS = 500
+MATCHES = 100
+MESSAGES = 4_000
+
+Message = Tuple[Optional[int], int, str]
+
+
+def _make_messages() -> List[Message]:
+    rng = random.Random(0)
+    guild_ids = [rng.getrandbits(63) for _ in range(GUILDS)] + [None]
+    return [
+        (rng.choice(guild_ids), rng.randrange(USERS), text)
+        for text in make_chat_corpus(MESSAGES, command_fraction=0.2)
+    ]
+
+
+async def _serve(config: ShardConfig, directory: str, messages: List[Message], ready, go) -> Tuple[int, int]:
+    # the part of a bot process that scales: intents, the shared user store and decoding matches
+    # that are fetched once for every process
+    classifier = get_intent_classifier(mode="lalr", cache=False)
+    store = SqliteUserStore(path=os.path.join(directory, "users.sqlite3"))
+    cache = SharedCache(path=os.path.join(directory, "upstream.sqlite3"))
+    owned = [message for message in messages if config.owns(message[0])]
+    ready.put(None)
+    go.wait()
+
+    handled = fetched = 0
+    for _, user_id, text in owned:
+        handled += 1
+        if classifier.get_intent(normalize_phrase(text)).handler_id != "dota_lastmatch":
+            continue
+        match_id = store.get(str(user_id))["opendota_id"] % MATCHES
+        if (body := await cache.get(f"matches/{match_id}")) is None:
+            fetched += 1
+            body = json_dumps(make_parsed_match(match_id=match_id, seed=match_id))
+            await cache.put(f"matches/{match_id}", body, ttl=60)
+        load_compact_match(json_loads(body))
+    await store.close()
+    await cache.close()
+    return handled, fetched
+
+
+def _run_process(config: ShardConfig, directory: str, messages: List[Message], ready, go, results) -> None:
+    results.put(asyncio.run(_serve(config, directory, messages, ready, go)))
+
+
+def _run_sharded(processes: int, directory: str, messages: List[Message]) -> Tuple[float, int, int]:
+    context = multiprocessing.get_context("spawn")
+    ready, go, results = context.Queue(), context.Event(), context.Queue()
+    configs = [ShardConfig(count=SHARD_COUNT, ids=tuple(range(number, SHARD_COUNT, processes))) for number in range(processes)]
+    workers = [
+        context.Process(target=_run_process, args=(config, directory, messages, ready, go, results))
+        for config in configs
+    ]
+    for worker in workers:
+        worker.start()
+    for _ in workers:
+        ready.get(timeout=60)
+
+    # startup is not part of the measurement, every process begins together
+    started = time.perf_counter()
+    go.set()
+    counts = [results.get(timeout=120) for _ in workers]
+    elapsed = time.perf_counter() - started
+    for worker in workers:
+        worker.join()
+    return elapsed, sum(handled for handled, _ in counts), sum(fetched for _, fetched in counts)
+
+
+def test_throughput_scales_with_processes(tmp_path, bench_report, bench_strict):
+    messages = _make_messages()
+    results = {}
+    for processes in (1, 2):
+        directory = tmp_path / str(processes)
+        store = SqliteUserStore(path=directory / "users.sqlite3")
+        store.import_records((str(user_id), {"opendota_id": user_id}) for user_id in range(USERS))
+        asyncio.run(store.close())
+        results[processes] = _run_sharded(processes, str(directory), messages)
+
+    bench_report(
+        f"{MESSAGES} messages over {SHARD_COUNT} shards, {os.cpu_count()} cpus",
+        {
+            **{f"{processes} processes, msgs/s": MESSAGES / elapsed for processes, (elapsed, _, _) in results.items()},
+            **{f"{processes} processes, matches fetched": fetched for processes, (_, _, fetched) in results.items()},
+            "speedup": results[1][0] / results[2][0],
+        },
+    )
+    # every message is handled by exactly one process
+    assert all(handled == MESSAGES for _, handled, _ in results.values())
+    # a match one process fetched is reused by the other, unless both missed it at the same time
+    assert results[1][2] <= MATCHES
+    assert results[2][2] < 2 * results[1][2]
+    if bench_strict and (os.cpu_count() or 1) >= 2:
+        assert results[2][0] * 1.3 < results[1][0]
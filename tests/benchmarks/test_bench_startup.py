@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, Tuple
+
+SRC = Path(__file__).parents[2] / "src"
+
+HEAVY_MODULES = ("langchain", "langchain_core", "langchain_gigachat", "langchain_deepseek", "gigachat")
+
+
+def _import_time(code: str) -> Tuple[Dict[str, int], str]:
+    # cumulative microseconds per module as reported by -X importtime, and whatever the code printed
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env={**os.environ, "PYTHONPATH": str(SRC)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, total, name = line[len("import time:"):].split("|")
+        cumulative[name.strip()] = int(total)
+    return cumulative, result.stdout
+
+
+def test_startup_does_not_import_llm_stack(bench_report, bench_strict):
+    startup, loaded = _import_time(
+        "import sys, botislav.__main__\n"
+        f"print(sorted(name for name in {HEAVY_MODULES!r} if name in sys.modules))\n"
+        "print('PHRASE_GENERATOR' in vars(sys.modules['botislav.phrases']))\n"
+    )
+    eager, _ = _import_time("import botislav.__main__, langchain_gigachat, langchain_core.prompts")
+
+    bench_report(
+        "cold import, ms",
+        {
+            "botislav.__main__": startup["botislav.__main__"] / 1000,
+            "botislav.__main__ with the llm stack": (eager["botislav.__main__"] + eager["langchain_gigachat"]) / 1000,
+        },
+    )
+    assert loaded.split("\n")[:2] == ["[]", "False"]
+    if bench_strict:
+        assert startup["botislav.__main__"] * 2 < eager["botislav.__main__"] + eager["langchain_gigachat"]
@@ -0,0 +1,60 @@
+import json
+import random
+from unittest.mock import MagicMock
+
+import pickledb
+import pytest
+
+from botislav.context import ContextManager
+from botislav.storage import SqliteUserStore
+
+MESSAGES = 2000
+PICKLEDB_MESSAGES = 20
+CHANGED_FRACTION = 0.1
+
+
+def _users(count: int):
+    return {str(user_id): {"steam_id": None, "opendota_id": user_id} for user_id in range(count)}
+
+
+def _replay(context_manager: ContextManager, users: int, messages: int) -> None:
+    rng = random.Random(users)
+    for _ in range(messages):
+        key = str(rng.randrange(users))
+        with context_manager.get_context(key, MagicMock()) as context:
+            if rng.random() < CHANGED_FRACTION:
+                context.cache.opendota_id = rng.randrange(10 ** 9)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("users", (10_000, 100_000))
+async def test_user_store_messages_per_second(tmp_path, users, bench_report, bench_timed):
+    records = _users(users)
+
+    legacy_path = tmp_path / "cache.db"
+    legacy_path.write_text(json.dumps(records))
+    legacy = ContextManager(cache=pickledb.load(location=str(legacy_path), auto_dump=True))
+    legacy.set_client(MagicMock())
+    with bench_timed() as legacy_time:
+        _replay(legacy, users, PICKLEDB_MESSAGES)
+
+    store = SqliteUserStore(path=tmp_path / "users.sqlite3")
+    store.import_records(records.items())
+    await store.start()
+    context_manager = ContextManager(cache=store)
+    context_manager.set_client(MagicMock())
+    with bench_timed() as sqlite_time:
+        _replay(context_manager, users, MESSAGES)
+        await store.flush()
+    await store.close()
+
+    legacy_rate = PICKLEDB_MESSAGES / legacy_time.elapsed
+    sqlite_rate = MESSAGES / sqlite_time.elapsed
+    bench_report(
+        f"user store with {users} linked users",
+        {
+            "pickledb auto_dump, msg/s": legacy_rate,
+            "sqlite batched, msg/s": sqlite_rate,
+        },
+    )
+    assert sqlite_rate > legacy_rate
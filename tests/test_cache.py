@@ -0,0 +1,159 @@
+import asyncio
+
+import pytest
+
+from botislav.lru import LruCache
+from botislav.integrations.cache import cached
+from botislav.integrations.singleflight import single_flight
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LruCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats.evictions == 1
+
+
+def test_lru_cache_respects_byte_budget():
+    cache = LruCache(max_bytes=1000, sizeof=len)
+    cache.put("a", "x" * 400)
+    cache.put("b", "x" * 400)
+    cache.put("c", "x" * 400)
+
+    assert "a" not in cache
+    assert cache.size_bytes == 800
+
+    cache.put("huge", "x" * 2000)
+    assert "huge" not in cache
+    assert len(cache) == 2
+
+
+def test_lru_cache_expires_entries_with_per_entry_ttl():
+    cache = LruCache(ttl=60)
+    cache.put("short", 1, ttl=0)
+    cache.put("long", 2)
+
+    assert cache.get("short") is None
+    assert cache.get("long") == 2
+    assert cache.stats.expirations == 1
+
+
+def test_lru_cache_stores_falsy_values():
+    cache = LruCache()
+    cache.put("empty", {})
+    assert cache.get("empty", "missing") == {}
+
+
+@pytest.mark.asyncio
+async def test_cached_keys_on_arguments():
+    calls = []
+
+    @cached(max_entries=10)
+    async def fetch(match_id: int, limit: int = 1):
+        calls.append((match_id, limit))
+        return {}
+
+    assert await fetch(1) == {}
+    await fetch(1)
+    await fetch(2)
+    await fetch(2, limit=5)
+    await fetch(2, limit=5)
+
+    assert calls == [(1, 1), (2, 1), (2, 5)]
+    assert fetch.cache_info().hits == 2
+    assert fetch.cache_info().misses == 3
+
+
+@pytest.mark.asyncio
+async def test_cached_treats_positional_keyword_and_default_arguments_alike():
+    calls = []
+
+    @cached(max_entries=10)
+    async def fetch(match_id: int, limit: int = 1):
+        calls.append((match_id, limit))
+        return {}
+
+    await fetch(1)
+    await fetch(1, 1)
+    await fetch(1, limit=1)
+    await fetch(match_id=1, limit=1)
+    await fetch(limit=1, match_id=1)
+
+    assert calls == [(1, 1)]
+
+
+@pytest.mark.asyncio
+async def test_cached_does_not_store_errors():
+    attempts = 0
+
+    @cached()
+    async def flaky():
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            raise ConnectionError
+        await asyncio.sleep(0)
+        return attempts
+
+    with pytest.raises(ConnectionError):
+        await flaky()
+    assert await flaky() == 2
+    assert await flaky() == 2
+
+
+@pytest.mark.asyncio
+async def test_cached_coalesces_concurrent_misses():
+    calls = 0
+
+    @cached(ttl=60)
+    async def fetch(match_id: int):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return {"match_id": match_id}
+
+    results = await asyncio.gather(*(fetch(1) for _ in range(10)), fetch(2))
+
+    assert calls == 2
+    assert results[0] is results[9]
+    assert fetch.flight.coalesced == 9
+    assert fetch.flight.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_single_flight_propagates_errors_to_all_waiters():
+    calls = 0
+
+    @single_flight
+    async def fetch(match_id: int):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        raise ConnectionError(match_id)
+
+    results = await asyncio.gather(*(fetch(1) for _ in range(5)), return_exceptions=True)
+
+    assert calls == 1
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert fetch.flight.coalesced == 4
+
+
+@pytest.mark.asyncio
+async def test_single_flight_survives_cancelled_waiter():
+    @single_flight
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    first = asyncio.ensure_future(fetch())
+    second = asyncio.ensure_future(fetch())
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second == "done"
@@ -0,0 +1,52 @@
+import asyncio
+import logging
+
+import pytest
+from discord import AutoShardedClient
+
+from botislav import client
+from botislav.client import BotislavClient
+
+
+@pytest.fixture
+def bot(monkeypatch):
+    # the gateway is never connected, so there is nothing for discord.py to shut down
+    async def close(self):
+        pass
+
+    monkeypatch.setattr(AutoShardedClient, "close", close)
+    return BotislavClient(dialog_manager=None)
+
+
+@pytest.mark.asyncio
+async def test_failed_warm_up_is_logged(bot, monkeypatch, caplog):
+    async def warm_up_generation():
+        raise ImportError("no gigachat")
+
+    monkeypatch.setattr(client, "warm_up_generation", warm_up_generation)
+
+    with caplog.at_level(logging.ERROR, logger="botislav.client"):
+        await bot.on_ready()
+        await asyncio.gather(bot._warm_up, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    assert "Warming up description generators failed with no gigachat" in caplog.text
+    await bot.close()
+
+
+@pytest.mark.asyncio
+async def test_close_cancels_warm_up(bot, monkeypatch):
+    started = asyncio.Event()
+
+    async def warm_up_generation():
+        started.set()
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(client, "warm_up_generation", warm_up_generation)
+    await bot.on_ready()
+    await started.wait()
+    warm_up = bot._warm_up
+
+    await bot.close()
+
+    assert warm_up.cancelled()
@@ -0,0 +1,97 @@
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from botislav.integrations.constants import PersistentConstant, warm_up_constants
+from botislav.integrations.utils import HTTP_CLIENT
+
+
+@pytest_asyncio.fixture
+async def upstream():
+    state = {"version": 1, "etag": '"v1"', "requests": [], "status": None}
+
+    async def heroes(request: web.Request) -> web.Response:
+        state["requests"].append(request.headers.get("If-None-Match"))
+        if state["status"]:
+            return web.Response(status=state["status"])
+        if request.headers.get("If-None-Match") == state["etag"]:
+            return web.Response(status=304)
+        return web.json_response({"version": state["version"]}, headers={"ETag": state["etag"]})
+
+    app = web.Application()
+    app.router.add_get("/heroes.json", heroes)
+    server = TestServer(app, host="127.0.0.1")
+    await server.start_server()
+    state["url"] = str(server.make_url("/heroes.json"))
+    yield state
+    await HTTP_CLIENT.close()
+    await server.close()
+
+
+def _constant(upstream, tmp_path, revalidate_after: float = 60) -> PersistentConstant:
+    return PersistentConstant(
+        name="heroes",
+        url=upstream["url"],
+        loader=lambda data: data["version"],
+        revalidate_after=revalidate_after,
+        cache_dir=tmp_path,
+    )
+
+
+@pytest.mark.asyncio
+async def test_constant_is_persisted_and_served_from_disk(upstream, tmp_path):
+    assert await _constant(upstream, tmp_path)() == 1
+    assert len(upstream["requests"]) == 1
+
+    upstream["status"] = 503
+    restarted = _constant(upstream, tmp_path)
+    assert await restarted() == 1
+    assert len(upstream["requests"]) == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_constant_is_revalidated_with_etag(upstream, tmp_path):
+    constant = _constant(upstream, tmp_path, revalidate_after=0)
+    assert await constant() == 1
+
+    assert await constant() == 1
+    await constant._revalidation
+    assert upstream["requests"] == [None, '"v1"']
+
+    upstream["version"], upstream["etag"] = 2, '"v2"'
+    assert await constant() == 1
+    await constant._revalidation
+    assert await constant() == 2
+
+
+@pytest.mark.asyncio
+async def test_warm_up_keeps_stale_copy_when_upstream_is_down(upstream, tmp_path):
+    await _constant(upstream, tmp_path)()
+
+    upstream["status"] = 500
+    restarted = _constant(upstream, tmp_path)
+    await restarted.warm_up()
+    await restarted._revalidation
+
+    assert await restarted() == 1
+    assert len(upstream["requests"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_missing_constant_fails_when_upstream_is_down(upstream, tmp_path):
+    upstream["status"] = 500
+    with pytest.raises(RuntimeError):
+        await _constant(upstream, tmp_path)()
+
+
+@pytest.mark.asyncio
+async def test_warm_up_revalidates_only_the_given_constants(upstream, tmp_path):
+    _constant(upstream, tmp_path / "other")
+    constant = _constant(upstream, tmp_path)
+
+    await warm_up_constants([constant])
+    await constant._revalidation
+
+    assert await constant() == 1
+    assert len(upstream["requests"]) == 1
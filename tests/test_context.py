@@ -1,9 +1,11 @@
 import asyncio
 
+import ctor
 import pytest
 from unittest.mock import AsyncMock, MagicMock
 
 from botislav.context import Context, Cache, ContextManager
+from botislav.storage import MemoryUserStore
 
 
 @pytest.fixture
@@ -101,3 +103,47 @@ async def test_context_waits_for_user_reply_success(context_manger: ContextManag
     await asyncio.sleep(0.1)
 
     assert replied
+
+
+@pytest.mark.asyncio
+async def test_context_manager_writes_only_changed_records():
+    store = MemoryUserStore({"linked": {"steam_id": None, "opendota_id": 1}})
+    store.set = MagicMock(wraps=store.set)
+    manager = ContextManager(cache=store)
+    manager.set_client(MagicMock())
+
+    with manager.get_context("linked", MagicMock()):
+        pass
+    with manager.get_context("stranger", MagicMock()):
+        pass
+    store.set.assert_not_called()
+
+    with manager.get_context("stranger", MagicMock()) as context:
+        context.cache.opendota_id = 2
+    store.set.assert_called_once_with("stranger", {"steam_id": None, "opendota_id": 2})
+
+
+@pytest.mark.asyncio
+async def test_context_manager_keeps_loaded_caches_in_memory():
+    store = MemoryUserStore({"linked": {"steam_id": None, "opendota_id": 1}})
+    store.get = MagicMock(wraps=store.get)
+    manager = ContextManager(cache=store)
+    manager.set_client(MagicMock())
+
+    for _ in range(3):
+        with manager.get_context("linked", MagicMock()) as context:
+            assert context.cache.opendota_id == 1
+
+    store.get.assert_called_once_with("linked")
+
+
+def test_cache_tracks_modifications():
+    cache = Cache(opendota_id=1)
+    assert not cache.is_dirty
+
+    cache.opendota_id = 2
+    assert cache.is_dirty
+    assert ctor.dump(cache) == {"steam_id": None, "opendota_id": 2}
+
+    cache.mark_clean()
+    assert not cache.is_dirty
@@ -0,0 +1,132 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from botislav.context import ContextManager
+from botislav.dialog import DialogManager, DialogScheduler
+from botislav.intents import get_intent_classifier
+from botislav.storage import MemoryUserStore
+
+
+def _dialog(log, name: str, release: asyncio.Event):
+    async def run():
+        log.append(f"start {name}")
+        await release.wait()
+        log.append(f"end {name}")
+    return run
+
+
+@pytest.mark.asyncio
+async def test_global_and_per_guild_limits():
+    scheduler = DialogScheduler(max_concurrency=3, max_per_guild=2)
+    release, log = asyncio.Event(), []
+
+    for user in range(3):
+        scheduler.submit(f"a{user}", 1, _dialog(log, f"a{user}", release))
+    scheduler.submit("b0", 2, _dialog(log, "b0", release))
+    scheduler.submit("c0", 3, _dialog(log, "c0", release))
+    await asyncio.sleep(0)
+
+    assert sorted(log) == ["start a0", "start a1", "start b0"]
+    assert (scheduler.in_flight, scheduler.queued) == (3, 2)
+
+    release.set()
+    while scheduler.in_flight or scheduler.queued:
+        await asyncio.sleep(0.01)
+    assert scheduler.completed == 5
+
+
+@pytest.mark.asyncio
+async def test_backlog_merges_per_user_and_drops_oldest():
+    scheduler = DialogScheduler(max_concurrency=1, max_backlog=2)
+    release, log = asyncio.Event(), []
+
+    scheduler.submit("busy", None, _dialog(log, "busy", release))
+    scheduler.submit("a", None, _dialog(log, "a old", release))
+    scheduler.submit("b", None, _dialog(log, "b", release))
+    scheduler.submit("a", None, _dialog(log, "a new", release))
+    scheduler.submit("c", None, _dialog(log, "c", release))
+
+    assert (scheduler.merged, scheduler.dropped, scheduler.queued) == (1, 1, 2)
+    release.set()
+    while scheduler.in_flight or scheduler.queued:
+        await asyncio.sleep(0.01)
+    assert [entry for entry in log if entry.startswith("start")] == ["start busy", "start b", "start c"]
+
+
+@pytest.mark.asyncio
+async def test_one_user_never_runs_two_dialogs():
+    scheduler = DialogScheduler()
+    release, log = asyncio.Event(), []
+
+    scheduler.submit("a", None, _dialog(log, "first", release))
+    scheduler.submit("a", None, _dialog(log, "second", release))
+    await asyncio.sleep(0)
+    assert log == ["start first"]
+
+    release.set()
+    while scheduler.in_flight or scheduler.queued:
+        await asyncio.sleep(0.01)
+    assert log == ["start first", "end first", "start second", "end second"]
+
+
+@pytest.mark.asyncio
+async def test_failures_are_counted_and_do_not_leak_slots():
+    scheduler = DialogScheduler(max_concurrency=1)
+
+    async def fail():
+        raise RuntimeError("boom")
+
+    scheduler.submit("a", None, fail)
+    scheduler.submit("b", None, fail)
+    while scheduler.in_flight or scheduler.queued:
+        await asyncio.sleep(0.01)
+
+    assert scheduler.failed == 2
+
+
+@pytest.mark.asyncio
+async def test_drain_waits_then_cancels_and_rejects_new_dialogs():
+    scheduler = DialogScheduler(max_concurrency=2)
+    log = []
+
+    async def quick():
+        await asyncio.sleep(0.01)
+        log.append("quick")
+
+    async def stuck():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            log.append("cancelled")
+            raise
+
+    scheduler.submit("a", None, quick)
+    scheduler.submit("b", None, stuck)
+    scheduler.submit("c", None, quick)
+    await scheduler.drain(timeout=0.1)
+
+    assert sorted(log) == ["cancelled", "quick"]
+    assert (scheduler.in_flight, scheduler.queued, scheduler.dropped) == (0, 0, 1)
+    assert scheduler.submit("d", None, quick) is False
+
+
+@pytest.mark.asyncio
+async def test_intent_without_handler_is_ignored():
+    context_manager = ContextManager(cache=MemoryUserStore())
+    context_manager.set_client(AsyncMock())
+    dialog_manager = DialogManager(
+        context_manager=context_manager,
+        intent_classifier=get_intent_classifier(mode="lalr", cache=False),
+        handlers={},
+    )
+    message = AsyncMock()
+    message.content = "привет"
+    message.author.id = 1
+
+    await dialog_manager.handle(message)
+    await dialog_manager.scheduler.drain(timeout=1)
+
+    assert dialog_manager.scheduler.completed == 1
+    message.reply.assert_not_awaited()
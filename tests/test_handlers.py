@@ -0,0 +1,165 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from botislav import handlers
+from botislav.integrations.dota2 import Dota2Hero
+from botislav.integrations.opendota import DotaMatch, Player, PlayerRecentMatch, Hero
+from botislav.integrations.utils import UpstreamError
+
+ACCOUNT_ID = 55136643
+HERO_ID = 14
+
+
+def _dota2_hero() -> Dota2Hero:
+    return Dota2Hero(
+        id=HERO_ID, name="npc_dota_hero_pudge", order_id=1, name_loc="Pudge", bio_loc="", hype_loc="Мясник",
+        npe_desc_loc="", str_base=25, str_gain=3.2, agi_base=14, agi_gain=1.5, int_base=16, int_gain=1.5,
+        primary_attr=0, complexity=1, attack_capability=1, damage_min=45, damage_max=51, attack_rate=1.7,
+        attack_range=150, projectile_speed=0, armor=1, magic_resistance=25, movement_speed=280, turn_rate=0.7,
+        sight_range_day=1800, sight_range_night=800, max_health=720, health_regen=2.5, max_mana=291,
+        mana_regen=0.9,
+    )
+
+
+def _opendota_hero() -> Hero:
+    return Hero(
+        id=HERO_ID, name="npc_dota_hero_pudge", localized_name="Pudge", primary_attr="str", attack_type="Melee",
+        roles=[], img="", icon="", base_health=200, base_health_regen=None, base_mana=75, base_mana_regen=0,
+        base_armor=0, base_mr=25, base_attack_min=45, base_attack_max=51, base_str=25, base_agi=14, base_int=16,
+        str_gain=3.2, agi_gain=1.5, int_gain=1.5, attack_range=150, projectile_speed=0, attack_rate=1.7,
+        base_attack_time=100, attack_point=0.5, move_speed=280, day_vision=1800, night_vision=800,
+    )
+
+
+def _match() -> DotaMatch:
+    player = Player(
+        account_id=ACCOUNT_ID, hero_id=HERO_ID, win=1, kills=10, deaths=2, assists=5, personaname="Fesh"
+    )
+    return DotaMatch(match_id=1, start_time=1700000000, game_mode=22, players=[player])
+
+
+@pytest.fixture
+def in_flight():
+    # upstream requests running right now and the most that ever ran at once
+    return {"now": 0, "peak": 0}
+
+
+@pytest.fixture
+def upstream(monkeypatch, in_flight):
+    delays = {"recent": 0.0, "match": 0.1, "dota2": 0.1, "heroes": 0.1}
+
+    async def request(name):
+        in_flight["now"] += 1
+        in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+        try:
+            await asyncio.sleep(delays[name])
+        finally:
+            in_flight["now"] -= 1
+
+    async def get_player_recent_matches(account_id, limit):
+        await request("recent")
+        return [PlayerRecentMatch(match_id=1, hero_id=HERO_ID)]
+
+    async def get_match(match_id):
+        await request("match")
+        return _match()
+
+    async def get_hero_info_from_dota2_com(hero_id):
+        await request("dota2")
+        return _dota2_hero()
+
+    async def get_heroes():
+        await request("heroes")
+        return {HERO_ID: _opendota_hero()}
+
+    monkeypatch.setattr(handlers, "get_player_recent_matches", get_player_recent_matches)
+    monkeypatch.setattr(handlers, "get_match", get_match)
+    monkeypatch.setattr(handlers, "get_hero_info_from_dota2_com", get_hero_info_from_dota2_com)
+    monkeypatch.setattr(handlers, "get_heroes", get_heroes)
+    return delays
+
+
+@pytest.mark.asyncio
+async def test_recent_match_info_fetches_independent_stages_concurrently(upstream, in_flight):
+    match = await handlers.get_recent_match_info(ACCOUNT_ID)
+
+    assert match.hero_name == "Pudge"
+    assert match.hero_description == "Мясник"
+    assert match.score == "10/2/5"
+    assert match.hero_image_url.endswith("pudge_vert.jpg")
+    # the match, its hero from dota2.com and the hero constants are all requested at once
+    assert in_flight["peak"] == 3
+
+
+@pytest.mark.asyncio
+async def test_recent_match_info_skips_optional_stage_over_budget(upstream, monkeypatch):
+    monkeypatch.setattr(handlers, "RECENT_MATCH_BUDGET", 0.3)
+    upstream["dota2"] = 5.0
+
+    match = await handlers.get_recent_match_info(ACCOUNT_ID)
+
+    assert match.hero_name == "Pudge"
+    assert match.hero_description == ""
+
+
+@pytest.mark.asyncio
+async def test_recent_match_info_fails_when_required_stage_over_budget(upstream, monkeypatch):
+    monkeypatch.setattr(handlers, "RECENT_MATCH_BUDGET", 0.3)
+    upstream["match"] = 5.0
+
+    with pytest.raises(asyncio.TimeoutError):
+        await handlers.get_recent_match_info(ACCOUNT_ID)
+
+
+@pytest.mark.asyncio
+async def test_party_match_info_fetches_each_match_once(upstream, monkeypatch):
+    matches = {
+        1: DotaMatch(match_id=1, start_time=1700000000, game_mode=22, players=[
+            Player(account_id=1, hero_id=HERO_ID, win=1, kills=1, deaths=1, assists=1, personaname="a", party_id=7),
+            Player(account_id=2, hero_id=HERO_ID, win=1, kills=2, deaths=1, assists=1, personaname="b", party_id=7),
+            Player(account_id=3, hero_id=HERO_ID, win=0, kills=3, deaths=1, assists=1, personaname="c", party_id=8),
+        ]),
+        2: DotaMatch(match_id=2, start_time=1700000000, game_mode=22, players=[
+            Player(account_id=4, hero_id=HERO_ID, win=1, kills=4, deaths=1, assists=1, personaname="d"),
+            Player(account_id=5, hero_id=HERO_ID, win=1, kills=5, deaths=1, assists=1, personaname="e"),
+        ]),
+    }
+    last_match = {1: 1, 2: 1, 3: 1, 4: 2, 5: 2}
+    fetched = []
+
+    async def get_player_recent_matches(account_id, limit):
+        return [PlayerRecentMatch(match_id=last_match[account_id], hero_id=HERO_ID)]
+
+    async def get_match(match_id):
+        fetched.append(match_id)
+        return matches[match_id]
+
+    monkeypatch.setattr(handlers, "get_player_recent_matches", get_player_recent_matches)
+    monkeypatch.setattr(handlers, "get_match", get_match)
+
+    members = await handlers.get_party_match_info([1, 3, 4, 5, 4], include_party=False)
+    assert [member.account_id for member in members] == [1, 3, 4, 5]
+    assert sorted(fetched) == [1, 2]
+
+    members = await handlers.get_party_match_info([1], include_party=True)
+    assert [member.account_id for member in members] == [1, 2]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("url, reply", (
+    ("https://api.opendota.com/api/matches/1", "OpenDota сейчас не отвечает, попробуй попозже"),
+    ("https://www.dota2.com/datafeed/herodata?hero_id=14", "dota2.com сейчас не отвечает, попробуй попозже"),
+    ("https://raw.githubusercontent.com/odota/dotaconstants/master/build/heroes.json", "GitHub сейчас не отвечает, попробуй попозже"),
+    ("https://example.com/", "Сервис с данными матчей сейчас не отвечает, попробуй попозже"),
+))
+async def test_upstream_failure_reply_names_the_failed_service(url, reply):
+    @handlers.handles_exceptions
+    async def handler(context):
+        raise UpstreamError(url, 503)
+
+    context = AsyncMock()
+    await handler(context)
+
+    context.reply_to_user.assert_awaited_once_with(reply)
@@ -0,0 +1,145 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.prompts import PromptTemplate
+
+from botislav import handlers
+from botislav.context import ContextManager
+from botislav.dialog import DialogManager
+from botislav.intents import get_intent_classifier
+from botislav.llm import LazyChain, LlmExecutor
+from botislav.storage import DescriptionCache, MemoryUserStore
+
+
+def _slow_chain(seconds_per_chunk: float, response: str = "**Fesh** затащил"):
+    model = FakeListChatModel(responses=[response], sleep=seconds_per_chunk)
+    return PromptTemplate.from_template("{nickname}") | model
+
+
+def _recent_match() -> handlers.DotaRecentMatch:
+    return handlers.DotaRecentMatch(
+        match_id=1, account_id=55136643, win=True, kda=7.5, score="10/2/5", nickname="Fesh", hero_name="Pudge",
+        hero_description="", hero_image_url=None, date="01/01/2024", game_mode="Turbo", url="https://www.opendota.com/matches/1",
+    )
+
+
+@pytest.fixture(autouse=True)
+def description_cache(tmp_path, monkeypatch):
+    cache = DescriptionCache(path=tmp_path / "descriptions.sqlite3")
+    monkeypatch.setattr(handlers, "description_cache", cache)
+    return cache
+
+
+@pytest.mark.asyncio
+async def test_other_dialogs_progress_while_generation_is_in_flight():
+    executor = LlmExecutor(chain=_slow_chain(0.05), timeout=5)
+    generation = asyncio.create_task(executor.generate({"nickname": "Fesh"}))
+    await asyncio.sleep(0.05)
+    assert executor.in_flight == 1
+
+    context_manager = ContextManager(cache=MemoryUserStore())
+    dialog_manager = DialogManager(
+        context_manager=context_manager,
+        intent_classifier=get_intent_classifier(mode="lalr", cache=False),
+        handlers=handlers.get_handlers(),
+    )
+    context_manager.set_client(AsyncMock())
+    message = AsyncMock()
+    message.content = "привет"
+    message.author.id = 1
+
+    await dialog_manager.handle(message)
+    await asyncio.sleep(0.1)
+
+    message.reply.assert_awaited_once_with("Здарова")
+    assert not generation.done()
+    assert await generation == "**Fesh** затащил"
+
+
+@pytest.mark.asyncio
+async def test_generation_concurrency_is_bounded():
+    executor = LlmExecutor(chain=_slow_chain(0.01, "ok"), max_concurrency=1, timeout=5)
+    peak = 0
+
+    async def watch():
+        nonlocal peak
+        while True:
+            peak = max(peak, executor.in_flight)
+            await asyncio.sleep(0.001)
+
+    watcher = asyncio.create_task(watch())
+    results = await asyncio.gather(*(executor.generate({"nickname": "Fesh"}) for _ in range(3)))
+    watcher.cancel()
+
+    assert results == ["ok", "ok", "ok"]
+    assert peak == 1
+
+
+@pytest.mark.asyncio
+async def test_slow_generation_falls_back_to_phrase_templates(monkeypatch):
+    executor = LlmExecutor(chain=_slow_chain(0.5), timeout=0.1)
+    monkeypatch.setattr(handlers, "llm", executor)
+
+    description = await handlers.describe_match(_recent_match())
+
+    assert "**Fesh**" in description
+    assert "**10/2/5**" in description
+    assert executor.timeouts == 1
+
+
+@pytest.mark.asyncio
+async def test_repeated_description_is_served_from_cache(monkeypatch, description_cache):
+    llm = AsyncMock(wraps=LlmExecutor(chain=_slow_chain(0.001), timeout=5))
+    monkeypatch.setattr(handlers, "llm", llm)
+
+    first = await handlers.describe_match(_recent_match())
+    second = await handlers.describe_match(_recent_match())
+
+    assert first == second == "**Fesh** затащил"
+    llm.generate.assert_awaited_once()
+    assert description_cache.hits == 1
+
+
+@pytest.mark.asyncio
+async def test_fallback_description_is_not_cached(monkeypatch, description_cache):
+    monkeypatch.setattr(handlers, "llm", LlmExecutor(chain=_slow_chain(0.5), timeout=0.05))
+
+    await handlers.describe_match(_recent_match())
+
+    assert description_cache.misses == 1
+    assert await description_cache.get(f"1:55136643:{handlers.DESCRIBE_MATCH_PROMPT_VERSION}") is None
+
+
+@pytest.mark.asyncio
+async def test_lazy_chain_is_built_once_off_the_loop():
+    built = []
+
+    def build():
+        built.append(1)
+        return _slow_chain(0.001, "ok")
+
+    chain = LazyChain(factory=build)
+    assert not chain.loaded
+
+    executor = LlmExecutor(chain=chain, timeout=5)
+    assert await asyncio.gather(executor.generate({"nickname": "a"}), executor.generate({"nickname": "b"})) == ["ok", "ok"]
+    assert chain.loaded
+    assert built == [1]
+
+
+@pytest.mark.asyncio
+async def test_lazy_chain_load_survives_generation_timeout():
+    def build():
+        time.sleep(0.2)
+        return _slow_chain(0.001, "ok")
+
+    chain = LazyChain(factory=build)
+    executor = LlmExecutor(chain=chain, timeout=0.05)
+
+    assert await executor.generate({"nickname": "a"}) is None
+    await asyncio.sleep(0.3)
+    assert chain.loaded
+    assert await executor.generate({"nickname": "a"}) == "ok"
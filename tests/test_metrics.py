@@ -0,0 +1,71 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+from botislav.metrics import Metrics, _NOOP_SPAN, serve_metrics
+
+
+def test_disabled_metrics_do_nothing():
+    metrics = Metrics()
+
+    assert metrics.span("intent") is _NOOP_SPAN
+    with metrics.span("intent"):
+        pass
+    metrics.count("botislav_dialogs_total", intent="greeting")
+
+    assert metrics.spans == {} and metrics.counters == {}
+
+
+@pytest.mark.asyncio
+async def test_spans_counters_and_gauges_are_rendered():
+    metrics = Metrics(enabled=True)
+
+    with metrics.span("intent"):
+        pass
+    with metrics.span("llm"):
+        await asyncio.sleep(0.02)
+    metrics.count("botislav_dialogs_total", intent="greeting")
+    metrics.count("botislav_dialogs_total", intent="greeting")
+    metrics.gauge("botislav_dialogs_queued", "Queued dialogs", lambda: 3)
+
+    text = metrics.render()
+
+    assert 'botislav_span_seconds_bucket{span="intent",le="0.001"} 1' in text
+    assert 'botislav_span_seconds_bucket{span="llm",le="0.01"} 0' in text
+    assert 'botislav_span_seconds_bucket{span="llm",le="+Inf"} 1' in text
+    assert 'botislav_span_seconds_count{span="llm"} 1' in text
+    assert 'botislav_dialogs_total{intent="greeting"} 2' in text
+    assert "botislav_dialogs_queued 3" in text
+
+
+@pytest.mark.asyncio
+async def test_dialog_trace_collects_nested_spans(caplog):
+    metrics = Metrics(enabled=True, trace_dialogs=True)
+
+    async def dialog():
+        with metrics.trace_dialog("42"), metrics.span("dialog"):
+            with metrics.span("intent"):
+                pass
+            await asyncio.sleep(0)
+
+    with caplog.at_level("INFO", logger="botislav.metrics"):
+        await asyncio.gather(dialog(), dialog())
+
+    traces = [record.message for record in caplog.records if "trace" in record.message]
+    assert len(traces) == 2
+    assert all(trace.startswith("Dialog 42 trace: intent") and "dialog" in trace for trace in traces)
+
+
+@pytest.mark.asyncio
+async def test_metrics_are_served_over_http(unused_tcp_port):
+    metrics = Metrics(enabled=True)
+    metrics.gauge("botislav_dialogs_in_flight", "Running dialogs", lambda: 1)
+    runner = await serve_metrics("127.0.0.1", unused_tcp_port, metrics)
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{unused_tcp_port}/metrics") as response:
+                assert response.status == 200
+                assert "botislav_dialogs_in_flight 1" in await response.text()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,104 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from botislav.integrations import compact
+from botislav.integrations.decode import DecodePool
+from botislav.integrations.opendota import load_compact_match, load_match
+from botislav.integrations.utils import json_dumps, json_loads
+
+PAYLOAD = {
+    "match_id": 1,
+    "start_time": 1700000000,
+    "game_mode": 22,
+    "radiant_gold_adv": [1, 2, 3],
+    "chat": [{"time": 1, "type": "chat", "key": "gg"}],
+    "players": [
+        {"account_id": 55136643, "hero_id": 14, "kills": 10, "deaths": 2, "assists": 5, "damage": {"npc_dota_hero_lion": 100}},
+        {"account_id": None, "hero_id": 1, "kills": 0, "deaths": 0, "assists": 1, "isRadiant": False, "stuns": 1.5},
+    ],
+}
+
+
+def test_load_match_keeps_only_projected_fields():
+    match = load_match(PAYLOAD)
+
+    assert match.radiant_gold_adv is None and match.chat is None
+    player = match.find_player(55136643)
+    assert (player.hero_id, player.kda) == (14, 7.5)
+    assert player.damage is None
+
+
+def test_load_match_without_projection_keeps_everything():
+    match = load_match(PAYLOAD, match_fields=None, player_fields=None)
+
+    assert match.radiant_gold_adv == [1, 2, 3]
+    assert match.chat[0].key == "gg"
+    assert match.players[0].damage == {"npc_dota_hero_lion": 100}
+
+
+def test_compact_match_reads_like_match():
+    for fields in ({}, {"match_fields": None, "player_fields": None}):
+        match, compact = load_match(PAYLOAD, **fields), load_compact_match(PAYLOAD, **fields)
+
+        assert compact.to_match() == match
+        assert (compact.match_id, compact.start_date, compact.url, compact.game_mode_localized) == (
+            match.match_id, match.start_date, match.url, match.game_mode_localized
+        )
+        assert compact.duration is None
+        for player, compact_player in zip(match.players, compact.players):
+            assert compact_player.to_player() == player
+            assert compact_player.kda == player.kda
+            assert compact_player.isRadiant is player.isRadiant
+            assert compact_player.damage == player.damage
+        assert compact.find_player(55136643).kills == 10
+        assert compact.find_player(1) is None
+    assert compact.chat == match.chat
+
+
+@pytest.mark.asyncio
+async def test_decode_pool_offloads_only_large_payloads():
+    pool = DecodePool(inline_below=1024)
+    small = json_dumps(PAYLOAD)
+    large = json_dumps({**PAYLOAD, "chat": [{"time": 1, "type": "chat", "key": "gg"}] * 100})
+    try:
+        decoded = [await pool.decode(body, load_compact_match) for body in (small, large)]
+    finally:
+        pool.close()
+
+    assert (pool.inline, pool.offloaded) == (1, 1)
+    # decoding on a worker gives the same match as decoding inline
+    assert [match.to_match() for match in decoded] == [
+        load_compact_match(json_loads(body)).to_match() for body in (small, large)
+    ]
+
+
+def test_compact_layouts_are_capped(monkeypatch):
+    monkeypatch.setattr(compact, "MAX_LAYOUTS", len(compact._LAYOUTS))
+    player = {"account_id": 1, "hero_id": 1, "kills": 1, "deaths": 0, "assists": 0}
+
+    for extra in ({"stuns": 1.5}, {"party_id": 1}, {"party_size": 2}, {"personaname": "Fesh"}):
+        payload = {**PAYLOAD, "players": [{**player, **extra}]}
+        match = load_compact_match(payload, player_fields=None)
+        assert match.to_match() == load_match(payload, player_fields=None)
+
+    # past the cap every new set of present columns shares the layout that has all of them
+    assert len(compact._LAYOUTS) <= compact.MAX_LAYOUTS + 2
+
+
+def test_compact_layouts_registered_from_threads_are_consistent():
+    player_type = type(load_match(PAYLOAD).players[0])
+    names = ("kills", "deaths", "assists", "hero_id")
+
+    def pack(number):
+        # every number has its own set of present columns
+        columns = {name: number for bit, name in enumerate(names) if number >> bit & 1}
+        return number, columns, compact.CompactRows.pack(player_type, [{"account_id": number, **columns}])
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(pack, range(1, 200)))
+
+    for number, columns, rows in results:
+        assert rows.get(0, "account_id") == number
+        for name, value in columns.items():
+            assert rows.get(0, name) == value
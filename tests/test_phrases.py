@@ -1,11 +1,31 @@
+import random
+
 import pytest
+from lark.exceptions import UnexpectedInput
+
+from botislav.intents import (
+    IntentMeta,
+    IntentClassifier,
+    MEMO_MAX_PHRASE_LENGTH,
+    MEMO_SIZE,
+    get_intent_classifier,
+)
+from botislav.phrases import PHRASE_GENERATOR, Phrase, PhraseGenerator, PhraseIndex, Template
+
 
-from botislav.intents import IntentMeta, IntentClassifier, get_intent_classifier
+@pytest.fixture(scope="module", params=("earley", "lalr"))
+def intent_classifier(request) -> IntentClassifier:
+    return get_intent_classifier(mode=request.param)
+
+
+@pytest.fixture(scope="module")
+def earley_classifier() -> IntentClassifier:
+    return get_intent_classifier(mode="earley")
 
 
 @pytest.fixture(scope="module")
-def intent_classifier() -> IntentClassifier:
-    return get_intent_classifier()
+def lalr_classifier() -> IntentClassifier:
+    return get_intent_classifier(mode="lalr", cache=False)
 
 
 @pytest.mark.parametrize(
@@ -25,9 +45,168 @@ def intent_classifier() -> IntentClassifier:
         ("lm babagee", IntentMeta("pubg_lastmatch")),
         ("lastmatch", IntentMeta("dota_lastmatch")),
         ("привяжи https://www.opendota.com/players/55136643", IntentMeta("link_account")),
+        ("лм пати", IntentMeta("dota_party_lastmatch")),
+        ("last match dota party", IntentMeta("dota_party_lastmatch")),
+        ("лм <@123456789> <@!987654321>", IntentMeta("dota_party_lastmatch")),
+        ("лм <@123456789>", IntentMeta("dota_party_lastmatch")),
+        ("лм пубг пати", IntentMeta("silence")),
     )
 )
 def test_intent_classifier(
     intent_classifier: IntentClassifier, phrase: str, expected_meta: IntentMeta
 ):
     assert intent_classifier.get_intent(phrase) == expected_meta
+
+
+@pytest.mark.parametrize(
+    "phrase",
+    (
+        "бла бла бла",
+        "привет",
+        "  лм",
+        "\tlast match dota",
+        "ласт катка в pubg",
+        "привяжи https://www.opendota.com/players/55136643",
+        "пойдем в доту",
+        "hi",
+        "history",
+        "игра",
+    )
+)
+def test_prefilter_never_rejects_parsable_phrases(intent_classifier: IntentClassifier, phrase: str):
+    try:
+        intent_classifier.parser.parse(phrase)
+    except UnexpectedInput:
+        return
+    assert intent_classifier.may_match(phrase)
+
+
+def test_prefilter_rejects_chatter(intent_classifier: IntentClassifier):
+    assert not intent_classifier.may_match("кто пойдет играть")
+    assert not intent_classifier.may_match("gish is clueless")
+
+
+@pytest.mark.parametrize(
+    "phrase",
+    (
+        "лм в доту 2",
+        "lm in dota two",
+        "lm dota2",
+        "последняя игра",
+        "игра в доту",
+        "привяжи  https://www.opendota.com/players/1",
+        "привяжиhttps://www.opendota.com/players/1",
+        "привяжи https://www.opendota.com/players/",
+        "привяжи",
+        "приветик",
+        "хайлм",
+        "hi hi",
+        "лм лм",
+        " лм ",
+        "в",
+        "доту",
+        "лм в доту пати",
+        "лм доту <@1><@2>",
+        "лм <@1> пати",
+        "лм пати <@1>",
+    )
+)
+def test_lalr_mode_matches_earley_mode(
+    earley_classifier: IntentClassifier, lalr_classifier: IntentClassifier, phrase: str
+):
+    assert lalr_classifier.get_intent(phrase) == earley_classifier.get_intent(phrase)
+
+
+# pieces of every terminal in the grammar and a bit of chatter, glued into random phrases
+GRAMMAR_FRAGMENTS = (
+    "лм", "lm", "!lm", "last", "match", "last match", "ласт", "катка", "последняя", "игра", "в", "in",
+    "доту", "dota", "dota 2", "дока два", "пубг", "pubg", "babagee", "пати", "party", "тимы", "<@1>", "<@!22>",
+    "привет", "прив", "здарова", "hi", "hello", "хай", "привяжи", "https://www.opendota.com/players/42", "го", "",
+)
+
+
+def test_lalr_mode_matches_earley_mode_on_generated_phrases(
+    earley_classifier: IntentClassifier, lalr_classifier: IntentClassifier
+):
+    rng = random.Random(0)
+    for _ in range(2000):
+        pieces = rng.choices(GRAMMAR_FRAGMENTS, k=rng.randint(1, 4))
+        phrase = rng.choice((" ", "", "  ")).join(pieces)
+        assert lalr_classifier.get_intent(phrase) == earley_classifier.get_intent(phrase), phrase
+
+
+def test_intent_memo_normalizes_and_counts_hits():
+    classifier = get_intent_classifier(mode="lalr", cache=False)
+
+    assert classifier.get_intent("ЛМ") == IntentMeta("dota_lastmatch")
+    assert classifier.get_intent("  лм ") == IntentMeta("dota_lastmatch")
+    assert classifier.get_intent("ласт   катка") == IntentMeta("dota_lastmatch")
+    assert classifier.get_intent("играем?") == IntentMeta("silence")
+    assert classifier.get_intent("играем?") == IntentMeta("silence")
+
+    assert classifier.memo_info().hits == 2
+    assert classifier.memo_info().misses == 3
+
+
+def test_intent_memo_is_bounded():
+    classifier = get_intent_classifier(mode="lalr", cache=False)
+
+    for number in range(MEMO_SIZE * 2):
+        classifier.get_intent(f"игра {number}")
+    classifier.get_intent("игра " + "a" * MEMO_MAX_PHRASE_LENGTH)
+
+    assert len(classifier.memo) == MEMO_SIZE
+
+
+def _random_phrases(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    phrases = []
+    for number in range(count):
+        lower = round(rng.uniform(0, 8), 2)
+        higher = float("inf") if rng.random() < 0.05 else round(lower + rng.uniform(0.1, 2), 2)
+        phrases.append(Phrase(lower=lower, higher=higher, text=f"{number} **{{username}}**", win=True))
+    return phrases
+
+
+def test_phrase_index_finds_same_phrases_as_scanning():
+    phrases = _random_phrases(500)
+    index = PhraseIndex.build(phrases)
+
+    for kda in [0.0, 0.5, 1.0, 4.0, 7.99, 8.0, 100.0] + [random.Random(1).uniform(0, 12) for _ in range(200)]:
+        found = sorted(template.render(username="a") for template in index.find(kda))
+        expected = sorted(phrase.text.format(username="a") for phrase in phrases if phrase.check(True, kda))
+        assert found == expected
+
+
+def test_phrase_index_stores_each_template_in_few_nodes():
+    phrases = _random_phrases(2_000)
+    index = PhraseIndex.build(phrases)
+
+    intervals = len(index.nodes) // 2
+    assert sum(len(node) for node in index.nodes) <= 2 * intervals.bit_length() * len(phrases)
+
+
+def test_phrase_generator_picks_any_covering_phrase():
+    phrases = [Phrase(lower=lower, higher=lower + 2, text=f"{lower} {{username}}", win=True) for lower in range(8)]
+    generator = PhraseGenerator(
+        phrases_by_hero={"Pudge": {True: Template.compile("Pudge {username}")}},
+        phrases_generic={True: PhraseIndex.build(phrases)},
+    )
+
+    seen = {generator.get_phrase(True, username="a", hero="Pudge", score="", kda=4.5) for _ in range(200)}
+
+    assert seen == {"3 a", "4 a", "Pudge a"}
+
+
+def test_template_renders_like_format():
+    text = "**{username}** затащил на **{hero}** со счетом **{score}**"
+
+    assert Template.compile(text).render(username="Fesh", hero="Pudge", score="1/2/3") == text.format(
+        username="Fesh", hero="Pudge", score="1/2/3"
+    )
+
+
+def test_phrase_generator_uses_generic_and_hero_phrases():
+    phrase = PHRASE_GENERATOR.get_phrase(win=True, username="Fesh", hero="Pudge", score="10/2/5", kda=7.5)
+
+    assert "**Fesh**" in phrase
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+from time import time
+
+import pytest
+
+from botislav import prefetch
+from botislav.integrations.opendota import PlayerRecentMatch
+from botislav.prefetch import MatchPrefetcher
+from botislav.storage import MemoryUserStore, SqliteUserStore
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    state = {"last_match": {1: 10, 2: 20}, "ended_at": time() - 24 * 60 * 60, "warmed": [], "described": []}
+
+    async def get_player_recent_matches(account_id, limit):
+        return [PlayerRecentMatch(match_id=state["last_match"][account_id], start_time=int(state["ended_at"]), duration=0)]
+
+    async def get_recent_match_info(opendota_account_id):
+        state["warmed"].append(opendota_account_id)
+        return opendota_account_id
+
+    async def describe_match(match, executor=None):
+        assert executor is prefetch.handlers.background_llm
+        state["described"].append(match)
+
+    monkeypatch.setattr(prefetch, "get_player_recent_matches", get_player_recent_matches)
+    monkeypatch.setattr(prefetch.handlers, "get_recent_match_info", get_recent_match_info)
+    monkeypatch.setattr(prefetch.handlers, "describe_match", describe_match)
+    return state
+
+
+@pytest.mark.asyncio
+async def test_new_matches_are_warmed_and_polling_backs_off(upstream):
+    prefetcher = MatchPrefetcher(
+        accounts=lambda: [1, 2], min_interval=0.02, max_interval=0.08, requests_per_hour=10 ** 6
+    )
+    prefetcher.start()
+    await asyncio.sleep(0.1)
+    # old matches are only remembered, not warmed
+    assert upstream["warmed"] == []
+
+    upstream["last_match"][1] = 11
+    await asyncio.sleep(0.2)
+    await prefetcher.stop()
+
+    assert upstream["warmed"] == [1]
+    assert upstream["described"] == [1]
+    assert prefetcher.new_matches == 1
+    assert prefetcher.tracked_accounts == 2
+
+
+@pytest.mark.asyncio
+async def test_fresh_match_is_warmed_when_account_is_first_seen(upstream):
+    upstream["ended_at"] = time() - 60
+    prefetcher = MatchPrefetcher(accounts=lambda: [2], min_interval=0.01, requests_per_hour=10 ** 6, describe=False)
+    prefetcher.start()
+    await asyncio.sleep(0.05)
+    await prefetcher.stop()
+
+    assert upstream["warmed"] == [2]
+    assert upstream["described"] == []
+
+
+@pytest.mark.asyncio
+async def test_polling_stays_within_budget(upstream):
+    # 3600 requests per hour is one per second with a burst of a minute worth, i.e. 60
+    prefetcher = MatchPrefetcher(accounts=lambda: [1, 2], min_interval=0.001, max_interval=0.001, requests_per_hour=3600)
+    prefetcher.start()
+    await asyncio.sleep(0.2)
+    await prefetcher.stop()
+
+    assert prefetcher.polls <= 61
+    assert prefetcher.over_budget >= 1
+
+
+@pytest.mark.asyncio
+async def test_user_stores_list_linked_accounts(tmp_path):
+    memory = MemoryUserStore({"1": {"opendota_id": 5}, "2": {"opendota_id": None}, "3": {"opendota_id": 5}})
+    assert memory.opendota_ids() == [5]
+
+    store = SqliteUserStore(path=tmp_path / "users.sqlite3")
+    store.import_records([("1", {"opendota_id": 5}), ("2", {"steam_id": None, "opendota_id": None})])
+    store.set("2", {"opendota_id": 7})
+    store.set("1", {"opendota_id": None})
+    assert store.opendota_ids() == [7]
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_failures_outside_polling_do_not_stop_prefetching(upstream, tmp_path, caplog):
+    store = SqliteUserStore(path=tmp_path / "users.sqlite3")
+    store.import_records([("1", {"opendota_id": 1})])
+    listings = []
+
+    def accounts():
+        listings.append(threading.current_thread() is threading.main_thread())
+        if len(listings) == 1:
+            raise RuntimeError("store is busy")
+        return store.opendota_ids()
+
+    prefetcher = MatchPrefetcher(accounts=accounts, min_interval=0.01, refresh_accounts_every=0.01, requests_per_hour=10 ** 6)
+    prefetcher.start()
+    await asyncio.sleep(0.1)
+    await prefetcher.stop()
+    await store.close()
+
+    assert "store is busy" in caplog.text
+    # listing scans the store, so it never runs on the event loop thread
+    assert len(listings) > 1 and not any(listings)
+    assert prefetcher.polls >= 1
@@ -0,0 +1,175 @@
+import asyncio
+from time import monotonic
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from botislav.integrations.ratelimit import Priority, RateLimiter, TokenBucket, background_priority
+from botislav.integrations.shared_cache import SharedCache
+from botislav.integrations.utils import HttpClient, RetryPolicy, UpstreamError
+
+FAST_RETRIES = RetryPolicy(max_retries=3, backoff_base=0.01, backoff_max=0.05, max_retry_after=1.0)
+
+
+@pytest_asyncio.fixture
+async def upstream():
+    state = {"responses": [], "requests": 0}
+
+    async def match(request: web.Request) -> web.Response:
+        state["requests"] += 1
+        if state["responses"]:
+            status, headers = state["responses"].pop(0)
+            return web.Response(status=status, headers=headers)
+        return web.json_response({"match_id": 1})
+
+    app = web.Application()
+    app.router.add_get("/api/matches/1", match)
+    server = TestServer(app, host="127.0.0.1")
+    await server.start_server()
+    state["url"] = str(server.make_url("/api/matches/1"))
+    yield state
+    await server.close()
+
+
+@pytest_asyncio.fixture
+async def client():
+    client = HttpClient()
+    client.configure_host("127.0.0.1", retry_policy=FAST_RETRIES)
+    yield client
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_retry_after_is_respected(upstream, client):
+    limiter = RateLimiter(buckets=[TokenBucket(capacity=10, period=1)])
+    client.configure_host("127.0.0.1", rate_limiter=limiter)
+    upstream["responses"] = [(429, {"Retry-After": "0.2"})]
+
+    started = monotonic()
+    assert await client.get_json(upstream["url"]) == {"match_id": 1}
+
+    assert monotonic() - started >= 0.2
+    assert upstream["requests"] == 2
+    assert client.retries == 1
+
+
+@pytest.mark.asyncio
+async def test_transient_failures_are_retried_with_backoff(upstream, client):
+    upstream["responses"] = [(503, {}), (502, {})]
+
+    assert await client.get_json(upstream["url"]) == {"match_id": 1}
+    assert upstream["requests"] == 3
+
+
+@pytest.mark.asyncio
+async def test_upstream_error_after_retries_are_exhausted(upstream, client):
+    upstream["responses"] = [(429, {})] * 10
+
+    with pytest.raises(UpstreamError) as error:
+        await client.get_json(upstream["url"])
+
+    assert error.value.status == 429
+    assert upstream["requests"] == FAST_RETRIES.max_retries + 1
+
+
+@pytest.mark.asyncio
+async def test_long_retry_after_is_not_waited_for(upstream, client):
+    upstream["responses"] = [(429, {"Retry-After": "3600"})]
+
+    with pytest.raises(UpstreamError):
+        await client.get_json(upstream["url"])
+    assert upstream["requests"] == 1
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried(upstream, client):
+    upstream["responses"] = [(404, {})]
+
+    with pytest.raises(UpstreamError):
+        await client.get_json(upstream["url"])
+    assert upstream["requests"] == 1
+
+
+@pytest.mark.asyncio
+async def test_interactive_requests_overtake_background_ones():
+    limiter = RateLimiter(buckets=[TokenBucket(capacity=1, period=0.05)])
+    await limiter.acquire()
+    served = []
+
+    async def request(name: str) -> None:
+        await limiter.acquire()
+        served.append(name)
+
+    with background_priority():
+        background = [asyncio.create_task(request(f"background {index}")) for index in range(3)]
+    await asyncio.sleep(0)
+    interactive = asyncio.create_task(request("interactive"))
+    await asyncio.sleep(0)
+    assert limiter.queue_depth == 4
+
+    await asyncio.gather(interactive, *background)
+
+    assert served[0] == "interactive"
+    assert limiter.queue_depth == 0
+    assert limiter.throttled == 4
+    assert limiter.throttled_seconds > 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_the_queue():
+    limiter = RateLimiter(buckets=[TokenBucket(capacity=1, period=0.05)])
+    await limiter.acquire()
+
+    head = asyncio.create_task(limiter.acquire())
+    behind = asyncio.create_task(limiter.acquire(priority=Priority.BACKGROUND))
+    await asyncio.sleep(0)
+    head.cancel()
+
+    await asyncio.wait_for(behind, timeout=1)
+    assert limiter.queue_depth == 0
+
+
+def test_split_limiter_keeps_its_share_of_the_quota():
+    limiter = RateLimiter(buckets=[TokenBucket(capacity=60, period=60), TokenBucket(capacity=2, period=10)])
+
+    limiter.split(4)
+
+    minute, tiny = limiter.buckets
+    assert (minute.capacity, minute.rate) == (15, 0.25)
+    # half a token would never let a request through
+    assert tiny.capacity == 1 and tiny.rate == pytest.approx(0.05)
+
+
+@pytest.mark.asyncio
+async def test_shared_cache_serves_other_processes(upstream, tmp_path):
+    # two clients stand in for two bot processes sharing the cache file
+    clients = [HttpClient(shared_cache=SharedCache(path=tmp_path / "upstream.sqlite3")) for _ in range(2)]
+    try:
+        assert await clients[0].get_json(upstream["url"], shared_ttl=60) == {"match_id": 1}
+        assert await clients[1].get_json(upstream["url"], shared_ttl=60) == {"match_id": 1}
+        assert upstream["requests"] == 1
+
+        # without a ttl the response is neither shared nor looked up
+        assert await clients[1].get_json(upstream["url"]) == {"match_id": 1}
+        assert upstream["requests"] == 2
+    finally:
+        for client in clients:
+            await client.close()
+            await client.shared_cache.close()
+
+
+@pytest.mark.asyncio
+async def test_shared_cache_expires_entries(tmp_path):
+    cache = SharedCache(path=tmp_path / "upstream.sqlite3", max_entries=2, purge_every=1)
+    try:
+        await cache.put("expired", b"old", ttl=-1)
+        for key in ("a", "b", "c"):
+            await cache.put(key, key.encode() * 1000, ttl=60)
+
+        assert await cache.get("expired") is None
+        assert await cache.get("a") is None
+        assert await cache.get("c") == b"c" * 1000
+    finally:
+        await cache.close()
@@ -0,0 +1,97 @@
+import asyncio
+import multiprocessing
+from unittest.mock import MagicMock
+
+import pytest
+
+from botislav.context import ContextManager
+from botislav.sharding import ShardConfig, shard_for_guild
+from botislav.storage import SqliteUserStore
+
+GUILD_ID = 41771983423143937  # the example from discord's sharding docs
+
+
+def test_guilds_are_routed_like_discord_does():
+    assert shard_for_guild(GUILD_ID, 1) == 0
+    assert shard_for_guild(GUILD_ID, 2) == (GUILD_ID >> 22) % 2
+    assert shard_for_guild(None, 8) == 0
+
+
+def test_shard_config_from_env():
+    assert ShardConfig.from_env({}) == ShardConfig(count=1, ids=None)
+    assert not ShardConfig.from_env({}).sharded
+
+    config = ShardConfig.from_env({"SHARD_COUNT": "4", "SHARD_IDS": "2,3"})
+    assert config.sharded and config.processes == 2
+    assert not config.owns(None)
+    assert config.owns(GUILD_ID) == (shard_for_guild(GUILD_ID, 4) in (2, 3))
+
+    with pytest.raises(ValueError):
+        ShardConfig.from_env({"SHARD_COUNT": "2", "SHARD_IDS": "2"})
+
+
+def test_every_guild_has_exactly_one_owner():
+    shards = [ShardConfig(count=4, ids=(0, 1)), ShardConfig(count=4, ids=(2, 3))]
+    for guild_id in range(0, 1 << 30, 1 << 20):
+        assert sum(config.owns(guild_id) for config in shards) == 1
+
+
+@pytest.mark.asyncio
+async def test_processes_see_each_others_users(tmp_path):
+    first, second = (SqliteUserStore(path=tmp_path / "users.sqlite3") for _ in range(2))
+    try:
+        first.set("1", {"opendota_id": 1})
+        await first.flush()
+        second.set("2", {"opendota_id": 2})
+        await second.flush()
+
+        assert first.get("2") == {"opendota_id": 2}
+        assert second.get("1") == {"opendota_id": 1}
+        assert first.opendota_ids() == second.opendota_ids() == [1, 2]
+    finally:
+        await first.close()
+        await second.close()
+
+
+def _link_account_in_another_process(path: str, key: str, opendota_id: int) -> None:
+    async def link() -> None:
+        store = SqliteUserStore(path=path)
+        manager = ContextManager(cache=store, keep_loaded=False)
+        manager.set_client(MagicMock())
+        with manager.get_context(key, MagicMock()) as context:
+            context.cache.opendota_id = opendota_id
+        await store.close()
+
+    asyncio.run(link())
+
+
+def _run_in_another_process(*args) -> None:
+    process = multiprocessing.get_context("spawn").Process(target=_link_account_in_another_process, args=args)
+    process.start()
+    process.join(timeout=60)
+    assert process.exitcode == 0
+
+
+@pytest.mark.asyncio
+async def test_user_changes_are_seen_and_kept_across_processes(tmp_path):
+    path = str(tmp_path / "users.sqlite3")
+    store = SqliteUserStore(path=path)
+    manager = ContextManager(cache=store, keep_loaded=False)
+    manager.set_client(MagicMock())
+    try:
+        with manager.get_context("1", MagicMock()) as context:
+            assert context.cache.opendota_id is None
+
+        # the shard of another guild links the account
+        _run_in_another_process(path, "1", 555)
+        with manager.get_context("1", MagicMock()) as context:
+            assert context.cache.opendota_id == 555
+
+        # a dialog that loaded the user before the other process wrote does not undo that write
+        with manager.get_context("1", MagicMock()) as context:
+            _run_in_another_process(path, "1", 777)
+            context.cache.steam_id = "steam"
+        await store.flush()
+        assert store.get("1") == {"steam_id": "steam", "opendota_id": 777}
+    finally:
+        await store.close()
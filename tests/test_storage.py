@@ -0,0 +1,100 @@
+import json
+import asyncio
+import sqlite3
+
+import pytest
+
+from botislav.storage import DescriptionCache, SqliteUserStore, migrate_pickledb
+
+
+@pytest.mark.asyncio
+async def test_sqlite_store_serves_pending_writes_and_persists_them(tmp_path):
+    store = SqliteUserStore(path=tmp_path / "users.sqlite3")
+    store.set("1", {"opendota_id": 1})
+
+    assert store.get("1") == {"opendota_id": 1}
+    assert len(store) == 0
+
+    await store.flush()
+    assert len(store) == 1
+    await store.close()
+
+    reopened = SqliteUserStore(path=tmp_path / "users.sqlite3")
+    assert reopened.get("1") == {"opendota_id": 1}
+    assert reopened.get("2") is None
+    await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_store_flushes_when_batch_is_full(tmp_path):
+    store = SqliteUserStore(path=tmp_path / "users.sqlite3", flush_interval=60, max_pending=10)
+    await store.start()
+    for key in range(10):
+        store.set(str(key), {"opendota_id": key})
+    await asyncio.sleep(0.2)
+
+    assert len(store) == 10
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_flush_is_logged_and_retried(tmp_path, caplog):
+    store = SqliteUserStore(path=tmp_path / "users.sqlite3", flush_interval=60, max_pending=2)
+    write = store._write
+    failures = [sqlite3.OperationalError("database is locked")]
+
+    def flaky_write(batch):
+        if failures:
+            raise failures.pop()
+        write(batch)
+
+    store._write = flaky_write
+    store.set("1", {"opendota_id": 1})
+    store.set("2", {"opendota_id": 2})
+    await asyncio.sleep(0.1)
+
+    assert "database is locked" in caplog.text
+    # the failed batch is kept and written on close
+    await store.close()
+    reopened = SqliteUserStore(path=tmp_path / "users.sqlite3")
+    assert len(reopened) == 2
+    await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_migrate_pickledb_is_one_shot(tmp_path):
+    old_db = tmp_path / "cache.db"
+    old_db.write_text(json.dumps({"1": {"steam_id": None, "opendota_id": 55136643}}))
+    store = SqliteUserStore(path=tmp_path / "users.sqlite3")
+
+    assert migrate_pickledb(old_db, store) == 1
+    assert migrate_pickledb(old_db, store) == 0
+    assert store.get("1") == {"steam_id": None, "opendota_id": 55136643}
+    assert (tmp_path / "cache.db.migrated").exists()
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_description_cache_survives_restart_and_evicts_least_recently_used(tmp_path):
+    cache = DescriptionCache(path=tmp_path / "descriptions.sqlite3", max_entries=2, purge_every=1)
+    await cache.put("a", "first")
+    await cache.put("b", "second")
+    assert await cache.get("a") == "first"
+    await cache.put("c", "third")
+    await cache.close()
+
+    reopened = DescriptionCache(path=tmp_path / "descriptions.sqlite3", max_entries=2, purge_every=1)
+    assert await reopened.get("a") == "first"
+    assert await reopened.get("b") is None
+    assert await reopened.get("c") == "third"
+    await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_description_cache_purges_every_few_puts(tmp_path):
+    cache = DescriptionCache(path=tmp_path / "descriptions.sqlite3", max_entries=2, purge_every=3)
+    for number in range(5):
+        await cache.put(str(number), "text")
+    # the third put purged down to two entries, the next two are kept until the sixth
+    assert [await cache.get(str(number)) for number in range(5)] == [None, "text", "text", "text", "text"]
+    await cache.close()
@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+import pytest
+
+from botislav.watchdog import LoopWatchdog
+
+
+def _block_the_loop(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+@pytest.mark.asyncio
+async def test_stall_is_attributed_to_the_blocking_task():
+    watchdog = LoopWatchdog(threshold=0.05, interval=0.01)
+    watchdog.start()
+    try:
+        await asyncio.sleep(0.05)
+
+        async def dialog() -> None:
+            _block_the_loop(0.3)
+
+        await asyncio.create_task(dialog(), name="dialog-42:dota_lastmatch")
+        await asyncio.sleep(0.05)
+    finally:
+        watchdog.stop()
+
+    assert watchdog.stalls == 1
+    stall, = watchdog.recent
+    assert stall.lag >= 0.25
+    assert stall.task == "dialog-42:dota_lastmatch"
+    assert "_block_the_loop" in stall.stack
+
+
+@pytest.mark.asyncio
+async def test_idle_loop_has_no_stalls_and_watchdog_toggles():
+    watchdog = LoopWatchdog(threshold=0.05, interval=0.01)
+
+    watchdog.toggle()
+    assert watchdog.running
+    await asyncio.sleep(0.2)
+    watchdog.toggle()
+    assert not watchdog.running
+
+    # nothing is watched once stopped
+    _block_the_loop(0.1)
+    await asyncio.sleep(0.05)
+    assert watchdog.stalls == 0